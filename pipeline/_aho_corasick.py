@@ -0,0 +1,134 @@
+from array import array
+from collections import deque
+
+from pipeline._frozen_trie import FrozenTrie, FREE, ROOT
+
+
+#################
+# Aho-Corasick automaton on top of the double-array trie.
+#
+# Every node gets a failure link (the node of the longest proper suffix of
+# its path that is also a path in the trie) and an output link (the next
+# node on the failure chain where a keyword ends). The sentence is then
+# scanned exactly once, character by character, and all keywords ending at
+# a position are found by following the output links.
+#
+# Word boundaries are checked on the reported spans, so the matches are the
+# same as for the flashtext search: a keyword has to start at the sentence
+# start or after a boundary character and has to end before a boundary
+# character or at the sentence end.
+#################
+
+
+class AhoCorasickTrie(FrozenTrie):
+    """`FrozenTrie` without collapsed chains plus failure and output links.
+
+    Attributes:
+        fail (array): per node, the failure link
+        output (array): per node, the next node on the failure chain where a keyword ends (0 if none)
+        depth (array): per node, the length of its path
+    """
+
+    array_names = FrozenTrie.array_names + ("fail", "output", "depth")
+    fail = None
+    output = None
+    depth = None
+
+    @classmethod
+    def from_trie_dict(cls, trie_dict, keyword_key="_keyword_", non_word_boundaries=None, collapse_chains=False):
+        """Compiles a flashtext trie dict and computes the failure and output links.
+
+        Args:
+            trie_dict (dict): root of the nested dict trie
+            keyword_key (str): key that marks the end of a keyword in `trie_dict`
+            non_word_boundaries (set(str)): ignored, the automaton does not need the first word index
+            collapse_chains (bool): ignored, every character needs its own node
+
+        Returns:
+            AhoCorasickTrie: the compiled automaton
+        """
+        trie = super().from_trie_dict(trie_dict, keyword_key, collapse_chains=False)
+        trie.build_links()
+        return trie
+
+    def build_links(self):
+        """Computes `fail`, `output` and `depth` breadth first."""
+        base, check, value_ids = self.base, self.check, self.value_ids
+        size = len(check)
+        children = {}
+        for slot, parent in enumerate(check):
+            if parent != FREE:
+                children.setdefault(parent, []).append(slot)
+        fail = array("i", [ROOT]) * size
+        output = array("i", [ROOT]) * size
+        depth = array("i", [0]) * size
+        queue = deque([ROOT])
+        while queue:
+            node = queue.popleft()
+            for child in children.get(node, ()):
+                queue.append(child)
+                depth[child] = depth[node] + 1
+                if node == ROOT:
+                    continue
+                label = child - base[node]
+                state = fail[node]
+                while True:
+                    candidate = base[state] + label
+                    if check[candidate] == state:
+                        fail[child] = candidate
+                        break
+                    if state == ROOT:
+                        break
+                    state = fail[state]
+                suffix = fail[child]
+                output[child] = suffix if value_ids[suffix] >= 0 else output[suffix]
+        self.fail, self.output, self.depth = fail, output, depth
+
+    def extract_keywords(self, sentence, non_word_boundaries, overlapping=False):
+        """Scans the sentence once and returns the keywords found.
+
+        Args:
+            sentence (str): text to search, already lower cased if the processor is case insensitive
+            non_word_boundaries (set(str)): characters that continue a word
+            overlapping (bool): return all matches, also overlapping and nested ones.
+                Otherwise the leftmost-longest non overlapping matches are returned, like flashtext does.
+
+        Returns:
+            list(tuple): (value, start, end) for every keyword found, sorted by start
+        """
+        base, check, value_ids, values = self.base, self.check, self.value_ids, self.values
+        fail, output, depth, alphabet = self.fail, self.output, self.depth, self.alphabet
+        sentence_len = len(sentence)
+        matches = []
+        node = ROOT
+        for idx, char in enumerate(sentence):
+            label = alphabet[char]
+            child = base[node] + label
+            while check[child] != node:
+                if node == ROOT:
+                    break
+                node = fail[node]
+                child = base[node] + label
+            else:
+                node = child
+            end = idx + 1
+            if end < sentence_len and sentence[end] in non_word_boundaries:
+                # no keyword can end inside a word
+                continue
+            hit = node if value_ids[node] >= 0 else output[node]
+            while hit != ROOT:
+                start = end - depth[hit]
+                if start == 0 or sentence[start - 1] not in non_word_boundaries:
+                    matches.append((values[value_ids[hit]], start, end))
+                hit = output[hit]
+        matches.sort(key=lambda match: (match[1], -match[2]))
+        if overlapping:
+            return matches
+        keywords_extracted = []
+        last_end = -1
+        for match in matches:
+            # the character after a match is consumed as its word boundary
+            if match[1] > last_end:
+                keywords_extracted.append(match)
+                last_end = match[2]
+        return keywords_extracted
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+
+
+#################
+# Content addressed cache for the compilation of entity YAML files.
+#
+# Entries are stored under the sha256 of everything they were computed from:
+# the parsed content of a file under the hash of its bytes, the parser result
+# of the keys of a file under the hashes of the file and of all files its
+# 'ref' and 'composite' examples lead to. An entry never has to be
+# invalidated, a change of any input leads to a different key.
+#################
+
+logger = logging.getLogger(__name__)
+
+# part of every key, increase it when the cached results change their form
+CACHE_VERSION = 2
+
+PARSED_FILE = "file"
+COMPILED_FILE = "compiled"
+HIERARCHY = "hierarchy"
+
+
+def digest(*parts) -> str:
+    """sha256 of json serializable parts"""
+    return hashlib.sha256(json.dumps([CACHE_VERSION, *parts], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """sha256 of the bytes of a file"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class CompileCache(object):
+    """Pickled results in a directory, one file per entry.
+
+    Attributes:
+        cache_dir (str): the directory, created on the first store
+        hits (int): number of entries loaded
+        misses (int): number of entries looked up but not found
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        # entries loaded or stored, everything else is removed by prune
+        self._used = set()
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{kind}-{key}.pkl")
+
+    def load(self, kind: str, key: str):
+        """Returns the entry, None if there is none or it can not be read"""
+        path = self._path(kind, key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.add(path)
+        return value
+
+    def store(self, kind: str, key: str, value) -> None:
+        """Stores the entry. It is written to a temporary file first, concurrent
+        readers never see a partial entry."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(kind, key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._used.add(path)
+
+    def prune(self) -> int:
+        """Removes all entries that were neither loaded nor stored by this instance, so the
+        cache only holds the results of the current files. Entries of other users of the
+        directory are removed as well.
+
+        Returns:
+            int: number of entries removed
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".pkl") and path not in self._used:
+                os.unlink(path)
+                removed += 1
+        return removed
@@ -0,0 +1,278 @@
+import copy
+import re
+
+from pipeline._frozen_trie import FrozenTrie
+
+
+#################
+# Composite patterns matched at runtime.
+#
+# A composite such as "{handy}-vertrag {tarif}" is not expanded into every
+# combination of the texts of its placeholders. It is stored as a sequence of
+# slots instead: literal characters and placeholders. Each placeholder has
+# one trie of its texts (its vocabulary), shared by all composites using it,
+# so the memory grows with the sum of the vocabularies and not their product.
+#
+# All composites are kept in one pattern trie whose edges are either
+# characters or placeholders. From a word start of the message the pattern
+# trie is walked, a placeholder edge continues after every text of its
+# vocabulary that starts at the current position. A composite matches if the
+# walk reaches its end at a word end.
+#
+# The composites are searched in the same scan as the keywords: from every
+# start the keyword search visits, the longest keyword and the longest
+# composite are compared and the longer one wins, as if the composites had
+# been expanded into keywords.
+#################
+
+# key of the composites ending in a node of the pattern trie (the keyword key of flashtext)
+_KEYWORD = "_keyword_"
+# key of the placeholder edges of a node, placeholder name -> child node
+_SLOTS = "_slots_"
+
+_PLACEHOLDER = re.compile(r"{(.*?)}")
+
+
+def composite_slots(composite_text):
+    """Splits a composite text into its slots.
+
+    Returns:
+        list(tuple): (is_placeholder, text) in order, the text of a placeholder is its name
+
+    Examples:
+        >>> composite_slots("{handy}-vertrag")
+        >>> # [(True, 'handy'), (False, '-vertrag')]
+    """
+    parts = _PLACEHOLDER.split(composite_text)
+    # split alternates literal, placeholder, literal ...
+    return [(idx % 2 == 1, part) for idx, part in enumerate(parts) if part or idx % 2 == 1]
+
+
+class CompositeMatcher(object):
+    """Finds the composites of an entity hierarchy in messages without expanding them.
+
+    The keywords of the `KeywordProcessor` are searched together with the composites. Texts
+    are normalized and spans mapped back with it, so composites and keywords are found under
+    the same rules. Its keywords must not change after the first search.
+
+    Attributes:
+        composites (dict): composite text -> {entity: value}, a value of None is replaced by the
+            text the composite stands for, with the placeholders filled in
+    """
+
+    def __init__(self, keyword_processor, composites, vocabularies):
+        """
+        Args:
+            keyword_processor (KeywordProcessor): the keywords, normalization and word boundaries,
+                it is not changed
+            composites (dict): composite text -> {entity: value or None}
+            vocabularies (dict): placeholder name -> list of its texts
+        """
+        self.keyword_processor = keyword_processor
+        self.composites = composites
+        # compiled keywords, taken from the keyword processor on the first search
+        self._keyword_trie = None
+        normalize = keyword_processor._normalize
+        self._vocabularies = {}
+        for name, texts in vocabularies.items():
+            root = {}
+            for text in texts:
+                node = root
+                for char in normalize(text):
+                    node = node.setdefault(char, {})
+                node[_KEYWORD] = text
+            self._vocabularies[name] = root
+        self._root = self._pattern_trie(composites)
+
+    def _pattern_trie(self, composites):
+        """Builds the trie of the slots of the composites"""
+        normalize = self.keyword_processor._normalize
+        root = {}
+        for composite_text in composites:
+            node = root
+            for is_placeholder, text in composite_slots(composite_text):
+                if is_placeholder:
+                    node = node.setdefault(_SLOTS, {}).setdefault(text, {})
+                else:
+                    for char in normalize(text):
+                        node = node.setdefault(char, {})
+            node.setdefault(_KEYWORD, []).append(composite_text)
+        return root
+
+    def __len__(self):
+        return len(self.composites)
+
+    def restricted(self, entity_types, keyword_processor=None):
+        """Returns a matcher of the composites setting any of entity_types, their values reduced
+        to these types. The vocabulary tries are shared with this matcher.
+
+        Args:
+            entity_types (iterable(str)): the entity types to keep
+            keyword_processor (KeywordProcessor): the keywords restricted to these types, with the
+                normalization of the keyword processor of this matcher.
+                Defaults to None, the keyword processor of this matcher
+
+        Returns:
+            CompositeMatcher: the restricted matcher, it may have no composites at all
+        """
+        entity_types = frozenset(entity_types)
+        composites = {}
+        for composite_text, value in self.composites.items():
+            reduced = {entity: entity_value for entity, entity_value in value.items() if entity in entity_types}
+            if reduced:
+                composites[composite_text] = reduced
+        matcher = copy.copy(self)
+        if keyword_processor is not None:
+            matcher.keyword_processor = keyword_processor
+            matcher._keyword_trie = None
+        matcher.composites = composites
+        matcher._root = matcher._pattern_trie(composites)
+        return matcher
+
+    def _keywords(self):
+        """The compiled keywords, the trie in use if the keyword processor is frozen"""
+        trie = self._keyword_trie
+        if trie is None:
+            keyword_processor = self.keyword_processor
+            trie = keyword_processor.compile()
+            if not isinstance(trie, FrozenTrie):
+                # a DAWG has no walk from a single start
+                trie = FrozenTrie.from_trie_dict(
+                    trie.to_trie_dict(keyword_processor._keyword),
+                    keyword_processor._keyword,
+                    keyword_processor.non_word_boundaries,
+                )
+            self._keyword_trie = trie
+        return trie
+
+    def _vocabulary_matches(self, name, sentence, start):
+        """Yields (end, text) for every text of the vocabulary of `name` at `start`, word ends are
+        not required as the composite may continue in the same word"""
+        node = self._vocabularies.get(name)
+        idx = start
+        sentence_len = len(sentence)
+        while node is not None:
+            if _KEYWORD in node and idx > start:
+                yield idx, node[_KEYWORD]
+            if idx == sentence_len:
+                return
+            node = node.get(sentence[idx])
+            idx += 1
+
+    def _longest_match(self, sentence, start):
+        """Returns (end, matches) of the longest composites starting at `start`, None if there is
+        none. Several composites can end there through different nodes of the pattern trie,
+        matches maps each of their texts to its placeholder texts."""
+        non_word_boundaries = self.keyword_processor.non_word_boundaries
+        sentence_len = len(sentence)
+        best = None
+        stack = [(self._root, start, {})]
+        while stack:
+            node, idx, bindings = stack.pop()
+            if (
+                _KEYWORD in node
+                and idx > start
+                and (idx == sentence_len or sentence[idx] not in non_word_boundaries)
+                and (best is None or idx >= best[0])
+            ):
+                if best is None or idx > best[0]:
+                    best = (idx, {})
+                # the first bindings found for a composite are kept, like the first expansion
+                for composite_text in node[_KEYWORD]:
+                    best[1].setdefault(composite_text, bindings)
+            for name, child in node.get(_SLOTS, {}).items():
+                for end, text in self._vocabulary_matches(name, sentence, idx):
+                    # a placeholder used twice stands for the same text both times
+                    if bindings.get(name, text) == text:
+                        stack.append((child, end, {**bindings, name: text}))
+            if idx < sentence_len and sentence[idx] in node:
+                stack.append((node[sentence[idx]], idx + 1, bindings))
+        return best
+
+    def extract_keywords(self, text):
+        """Finds the keywords and composites in a message, with the result of the keyword search
+        over the keywords plus all expansions of the composites. From every start the longest
+        keyword or composite wins, the search continues after it. A keyword and composites
+        ending at the same position are one match with the entities of all of them.
+
+        Args:
+            text (str): the message text
+
+        Returns:
+            list(tuple): (value, start, end) for every keyword or composite found, value is
+                the {entity: value} dict of the match
+        """
+        keyword_processor = self.keyword_processor
+        if not text or not self.composites:
+            return keyword_processor.extract_keywords(text, span_info=True)
+        non_word_boundaries = keyword_processor.non_word_boundaries
+        keywords = self._keywords()
+        sentence, offsets = keyword_processor._normalize_sentence(text)
+        found = []
+        idx = 0
+        sentence_len = len(sentence)
+        while idx < sentence_len:
+            keyword = keywords.longest_match(sentence, idx, non_word_boundaries)
+            composite = self._longest_match(sentence, idx)
+            if composite is not None and (keyword is None or composite[0] >= keyword[1]):
+                end, matches = composite
+                value = dict(keyword[0]) if keyword is not None and keyword[1] == end else {}
+                for composite_text, bindings in matches.items():
+                    for entity, entity_value in self.composites[composite_text].items():
+                        value[entity] = composite_text.format(**bindings) if entity_value is None else entity_value
+                found.append((value, idx, end))
+                idx = end + 1
+                continue
+            word_end = idx
+            while word_end < sentence_len and sentence[word_end] in non_word_boundaries:
+                word_end += 1
+            if keyword is not None:
+                value, end = keyword
+                # flashtext drops falsy values, unless the keyword is the last word of the sentence
+                if value or (end == sentence_len and end == word_end):
+                    found.append((value, idx, end))
+                idx = end + 1
+                continue
+            # skip to the next word start
+            idx = word_end + 1
+        return keyword_processor._spans_result(found, offsets, True)
+
+
+def merge_matches(keyword_matches, composite_matches):
+    """Merges composites into keywords that were searched separately, e.g. by the fuzzy search:
+    the longer of two overlapping matches wins, the earlier one on equal length. A keyword and a
+    composite with the same span (a composite expanding to a keyword text) are one match with
+    the entities of both. Unlike `CompositeMatcher.extract_keywords`, a match that loses here
+    does not make room for a later match it overlapped.
+
+    Args:
+        keyword_matches (list(tuple)): (value, start, end, ...) of the keyword search, the values
+            are {entity: value} dicts. Further fields are kept.
+        composite_matches (list(tuple)): (value, start, end, ...) of the composites, in the form
+            of keyword_matches
+
+    Returns:
+        list(tuple): the matches sorted by start
+    """
+    if not composite_matches:
+        return keyword_matches
+    if not keyword_matches:
+        return composite_matches
+    by_span = {(match[1], match[2]): match for match in composite_matches}
+    candidates = []
+    for match in keyword_matches:
+        composite = by_span.pop((match[1], match[2]), None)
+        if composite is not None:
+            match = ({**match[0], **composite[0]},) + tuple(match[1:])
+        candidates.append(match)
+    candidates.extend(by_span.values())
+    candidates.sort(key=lambda match: (match[1], match[1] - match[2]))
+    merged = []
+    for match in candidates:
+        if merged and match[1] < merged[-1][2]:
+            previous = merged[-1]
+            if match[2] - match[1] > previous[2] - previous[1]:
+                merged[-1] = match
+            continue
+        merged.append(match)
+    return merged
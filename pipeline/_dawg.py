@@ -0,0 +1,257 @@
+import re
+
+
+#################
+# Minimized acyclic automaton (DAWG) of the keywords.
+#
+# A trie only shares prefixes. Composite expansion creates families like
+# "handy-vertrag", "iphone-vertrag", "tablet-vertrag" whose endings are all
+# stored again for every prefix. In the DAWG all states with the same
+# outgoing language are merged, so shared suffixes are stored once.
+#
+# The sorted keywords are added in one pass (Daciuk et al., "Incremental
+# construction of minimal acyclic finite-state automata"): once the next
+# keyword leaves a branch, the states of that branch can not change any more
+# and are replaced by an equal registered state if there is one.
+#
+# A merged state is reached by many keywords, so values can not be stored in
+# the states. Instead every edge knows how many keywords sort before it in
+# the state it leaves (perfect hashing), walking a keyword sums these up to
+# the rank of the keyword, which is the index of its value.
+#################
+
+# key of a state that ends a keyword in the edge dicts while building
+_FINAL = None
+
+
+class Dawg(object):
+    """Read-only keyword automaton with suffix sharing, searched like a `FrozenTrie`.
+
+    Attributes:
+        edges (list(dict)): per state, character -> (next state, keywords sorting before the edge)
+        final (list(bool)): per state, whether a keyword ends here
+        values (list): per keyword in sorted order, its value
+        terms (int): number of keywords
+        max_keyword_len (int): length of the longest keyword
+    """
+
+    def __init__(self, edges, final, values, max_keyword_len):
+        self.edges = edges
+        self.final = final
+        self.values = values
+        self.terms = len(values)
+        self.max_keyword_len = max_keyword_len
+        self._boundary_pattern = None
+
+    def __len__(self):
+        return self.terms
+
+    @property
+    def node_count(self):
+        """Number of states, incl. the root"""
+        return len(self.edges)
+
+    @property
+    def edge_count(self):
+        """Number of edges between the states"""
+        return sum(len(edges) for edges in self.edges)
+
+    @classmethod
+    def from_sorted_items(cls, items):
+        """Builds the minimized automaton in one pass over the keywords.
+
+        Args:
+            items (iterable(tuple)): (keyword, value) pairs sorted by keyword, e.g. `sorted(mapping.items())`.
+                Empty keywords are ignored.
+
+        Returns:
+            Dawg: the automaton
+
+        Raises:
+            ValueError: If the keywords are not sorted or not unique
+        """
+        # states while building: dict of character -> state, _FINAL -> True if a keyword ends there
+        states = [{}]
+        register = {}
+        # edges of the latest keyword that may still change: (state, character, next state)
+        unchecked = []
+        values = []
+        previous = ""
+        max_keyword_len = 0
+
+        def minimize(down_to):
+            while len(unchecked) > down_to:
+                parent, char, child = unchecked.pop()
+                # the children of child are final already, so its edges identify its language
+                key = tuple(states[child].items())
+                existing = register.get(key)
+                if existing is None:
+                    register[key] = child
+                else:
+                    states[parent][char] = existing
+                    states[child] = None
+
+        for keyword, value in items:
+            if not keyword:
+                continue
+            if values and keyword <= previous:
+                raise ValueError(f"Keywords must be sorted and unique, '{keyword}' follows '{previous}'")
+            common = 0
+            for common, (char, previous_char) in enumerate(zip(keyword, previous)):
+                if char != previous_char:
+                    break
+            else:
+                common = min(len(keyword), len(previous))
+            minimize(common)
+            state = unchecked[-1][2] if unchecked else 0
+            for char in keyword[common:]:
+                states.append({})
+                states[state][char] = len(states) - 1
+                unchecked.append((state, char, len(states) - 1))
+                state = len(states) - 1
+            states[state][_FINAL] = True
+            values.append(value)
+            previous = keyword
+            max_keyword_len = max(max_keyword_len, len(keyword))
+        minimize(0)
+        return cls._from_states(states, values, max_keyword_len)
+
+    @classmethod
+    def _from_states(cls, states, values, max_keyword_len):
+        """Numbers the states that are left and computes the edge offsets"""
+        number = {0: 0}
+        order = [0]
+        for state in order:
+            for char, child in states[state].items():
+                if char is not _FINAL and child not in number:
+                    number[child] = len(order)
+                    order.append(child)
+        final = [_FINAL in states[state] for state in order]
+        # keywords below each state, a state is counted after all its children (post order)
+        counts = [None] * len(order)
+        stack = [0]
+        while stack:
+            idx = stack[-1]
+            children = [number[child] for char, child in states[order[idx]].items() if char is not _FINAL]
+            pending = [child for child in children if counts[child] is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            counts[idx] = final[idx] + sum(counts[child] for child in children)
+        edges = []
+        for idx, state in enumerate(order):
+            skip = final[idx]
+            state_edges = {}
+            for char, child in states[state].items():
+                if char is _FINAL:
+                    continue
+                state_edges[char] = (number[child], skip)
+                skip += counts[number[child]]
+            edges.append(state_edges)
+        return cls(edges, final, values, max_keyword_len)
+
+    def find(self, word, state=0):
+        """Returns (state, rank) after `word` or None if no keyword starts with it"""
+        edges = self.edges
+        rank = 0
+        for char in word:
+            edge = edges[state].get(char)
+            if edge is None:
+                return None
+            state, skip = edge
+            rank += skip
+        return state, rank
+
+    def get(self, word, default=None):
+        """Returns the value of `word` or `default` if it is not a keyword"""
+        found = self.find(word)
+        if found is None or not self.final[found[0]]:
+            return default
+        return self.values[found[1]]
+
+    def iter_items(self, state=0, prefix="", rank=0):
+        """Yields (keyword, value) below `state` in sorted order"""
+        edges, final, values = self.edges, self.final, self.values
+        stack = [(state, prefix)]
+        while stack:
+            state, term = stack.pop()
+            if final[state]:
+                yield term, values[rank]
+                rank += 1
+            stack.extend((child, term + char) for char, (child, _) in reversed(list(edges[state].items())))
+
+    def iter_prefix(self, prefix):
+        """Yields (keyword, value) of the keywords starting with `prefix`"""
+        found = self.find(prefix)
+        if found is None:
+            return iter(())
+        state, rank = found
+        return self.iter_items(state, prefix, rank)
+
+    def to_trie_dict(self, keyword_key="_keyword_"):
+        """Rebuilds a flashtext trie dict with the same keywords and values"""
+        trie_dict = {}
+        for keyword, value in self.iter_items():
+            current_dict = trie_dict
+            for char in keyword:
+                current_dict = current_dict.setdefault(char, {})
+            current_dict[keyword_key] = value
+        return trie_dict
+
+    def extract_keywords(self, sentence, non_word_boundaries):
+        """Same search as `FrozenTrie.extract_keywords` on the automaton.
+
+        Args:
+            sentence (str): text to search, already normalized like the keywords
+            non_word_boundaries (set(str)): characters that continue a word
+
+        Returns:
+            list(tuple): (value, start, end) for every keyword found
+        """
+        keywords_extracted = []
+        edges, final, values = self.edges, self.final, self.values
+        next_boundary = self.boundary_pattern(non_word_boundaries).search
+        sentence_len = len(sentence)
+        start = 0
+        while start < sentence_len:
+            boundary = next_boundary(sentence, start)
+            word_end = boundary.start() if boundary else sentence_len
+            found = -1
+            state = rank = 0
+            idx = start
+            while idx < sentence_len:
+                edge = edges[state].get(sentence[idx])
+                if edge is None:
+                    break
+                state, skip = edge
+                rank += skip
+                idx += 1
+                if final[state] and (idx == sentence_len or sentence[idx] not in non_word_boundaries):
+                    # update longest sequence found
+                    found = rank
+                    found_end = idx
+            if found >= 0:
+                value = values[found]
+                # flashtext drops falsy values, unless the keyword is the last word of the sentence
+                if value or (found_end == sentence_len and found_end == word_end):
+                    keywords_extracted.append((value, start, found_end))
+                start = found_end + 1
+            elif boundary is None:
+                break
+            else:
+                # skip to end of word
+                start = word_end + 1
+        return keywords_extracted
+
+    def boundary_pattern(self, non_word_boundaries):
+        """Returns a compiled pattern that finds the next word boundary character"""
+        key = frozenset(non_word_boundaries)
+        cached = self._boundary_pattern
+        if cached is None or cached[0] != key:
+            if key:
+                pattern = re.compile("[^%s]" % "".join(re.escape(char) for char in sorted(key)))
+            else:
+                pattern = re.compile(".", re.S)
+            cached = self._boundary_pattern = (key, pattern)
+        return cached[1]
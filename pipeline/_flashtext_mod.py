@@ -1,6 +1,18 @@
+import gc
+import io
+import itertools
+import math
+import multiprocessing
 import os
 import string
-import io
+import threading
+from collections import namedtuple
+
+from pipeline._frozen_trie import FrozenTrie
+from pipeline._aho_corasick import AhoCorasickTrie
+from pipeline._dawg import Dawg
+from pipeline._fuzzy import EditBudget, extract_keywords_fuzzy
+from pipeline._token_trie import TokenTrie
 
 
 #################
@@ -27,6 +39,28 @@ import io
 #
 #################
 
+# processor and sentences of the running extract_keywords_batch call. Pool workers
+# are forked after they are set, so they share the trie copy-on-write with the parent.
+# _batch_lock is held from setting them until the workers are done.
+_batch_lock = threading.Lock()
+_batch_processor = None
+_batch_sentences = None
+
+
+# published state of a KeywordProcessor. Readers take the current snapshot once and only use
+# that, writers build a new one and replace the reference (atomic in python).
+# nodes is the number of dicts in trie_dict (incl. the root), None while frozen.
+_Snapshot = namedtuple("_Snapshot", ["trie_dict", "frozen", "terms", "nodes"])
+
+
+def _extract_keywords_chunk(bounds):
+    start, end, span_info = bounds
+    return [
+        _batch_processor.extract_keywords(sentence, span_info=span_info)
+        for sentence in _batch_sentences[start:end]
+    ]
+
+
 class KeywordProcessor(object):
     """KeywordProcessor
 
@@ -36,9 +70,20 @@ class KeywordProcessor(object):
         non_word_boundaries (set(str)): Characters that will determine if the word is continuing.
             Defaults to set([A-Za-z0-9_])
         keyword_trie_dict (dict): Trie dict built character by character, that is used for lookup
-            Defaults to empty dictionary
+            Defaults to empty dictionary. None while the processor is frozen.
+            Changes never modify a published trie: writers copy the dicts on the changed paths
+            and swap in the new version, so readers in other threads always see a complete one.
         case_sensitive (boolean): if the search algorithm should be case sensitive or not.
             Defaults to False
+        aho_corasick (boolean): if the keywords are searched with an Aho-Corasick automaton that
+            scans the sentence once and can return overlapping matches.
+            Defaults to False
+        normalizer (TextNormalizer): normalization applied to keywords and sentences instead of
+            lower casing, e.g. casefolding and umlaut folding.
+            Defaults to None
+        dawg (boolean): if the trie is frozen into a `Dawg` that also shares common suffixes of
+            the keywords, e.g. of composite expansions.
+            Defaults to False
 
     Examples:
         >>> # import module
@@ -59,12 +104,26 @@ class KeywordProcessor(object):
         * Idea came from this `Stack Overflow Question <https://stackoverflow.com/questions/44178449/regex-replace-is-taking-time-for-millions-of-documents-how-to-make-it-faster>`_.
     """
 
-    def __init__(self, case_sensitive=False):
+    def __init__(self, case_sensitive=False, aho_corasick=False, normalizer=None, dawg=False):
         """
         Args:
             case_sensitive (boolean): Keyword search should be case sensitive set or not.
                 Defaults to False
+            aho_corasick (boolean): Search with an Aho-Corasick automaton, the trie gets frozen
+                on the first search.
+                Defaults to False
+            normalizer (TextNormalizer): Applied to keywords and sentences instead of lower casing,
+                spans are mapped back to the original sentence.
+                Defaults to None
+            dawg (boolean): Freeze into a `Dawg` instead of a `FrozenTrie`. Keywords added to an
+                empty processor with `update_keywords` are built into it directly.
+                Defaults to False
+
+        Raises:
+            ValueError: If both aho_corasick and dawg are requested
         """
+        if aho_corasick and dawg:
+            raise ValueError("aho_corasick and dawg can not be combined")
         self._keyword = '_keyword_'
         self._white_space_chars = set(['.', '\t', '\n', '\a', ' ', ','])
         if case_sensitive:
@@ -72,9 +131,28 @@ class KeywordProcessor(object):
             self.non_word_boundaries = set(string.digits + string.ascii_letters + '_')
         else:
             self.non_word_boundaries = set(string.digits + string.ascii_lowercase + '_')
-        self.keyword_trie_dict = dict()
         self.case_sensitive = case_sensitive
-        self._terms_in_trie = 0
+        self.aho_corasick = aho_corasick
+        self.normalizer = normalizer
+        self.dawg = dawg
+        self._snapshot = _Snapshot(dict(), None, 0, 1)
+        # serializes the writers, readers never wait for it
+        self._write_lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_write_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._write_lock = threading.RLock()
+
+    @property
+    def keyword_trie_dict(self):
+        """The nested dict trie of the current snapshot, None while the processor is frozen.
+        It is shared with concurrent readers and must not be changed in place."""
+        return self._snapshot.trie_dict
 
     def __len__(self):
         """Number of terms present in the keyword_trie_dict
@@ -84,7 +162,17 @@ class KeywordProcessor(object):
                 Count of number of distinct terms in trie dictionary.
 
         """
-        return self._terms_in_trie
+        return self._snapshot.terms
+
+    @property
+    def node_count(self):
+        """Number of nodes (incl. the root) of the trie in use: the dicts of the dict trie or the
+        slots of the compiled trie, where a collapsed chain counts as one node. Kept up to date by
+        every change, no trie walk is needed."""
+        snapshot = self._snapshot
+        if snapshot.frozen is not None:
+            return snapshot.frozen.node_count
+        return snapshot.nodes
 
     def __contains__(self, word):
         """To check if word is present in the keyword_trie_dict
@@ -103,9 +191,11 @@ class KeywordProcessor(object):
             >>> # True
 
         """
-        if not self.case_sensitive:
-            word = word.lower()
-        current_dict = self.keyword_trie_dict
+        word = self._normalize(word)
+        snapshot = self._snapshot
+        if snapshot.frozen is not None:
+            return snapshot.frozen.get(word) is not None
+        current_dict = snapshot.trie_dict
         len_covered = 0
         for char in word:
             if char in current_dict:
@@ -131,9 +221,11 @@ class KeywordProcessor(object):
             >>> keyword_processor['Big Apple']
             >>> # New York
         """
-        if not self.case_sensitive:
-            word = word.lower()
-        current_dict = self.keyword_trie_dict
+        word = self._normalize(word)
+        snapshot = self._snapshot
+        if snapshot.frozen is not None:
+            return snapshot.frozen.get(word)
+        current_dict = snapshot.trie_dict
         len_covered = 0
         for char in word:
             if char in current_dict:
@@ -164,15 +256,11 @@ class KeywordProcessor(object):
             clean_name = keyword
 
         if keyword and clean_name:
-            if not self.case_sensitive:
-                keyword = keyword.lower()
-            current_dict = self.keyword_trie_dict
-            for letter in keyword:
-                current_dict = current_dict.setdefault(letter, {})
-            if self._keyword not in current_dict:
-                status = True
-                self._terms_in_trie += 1
-            current_dict[self._keyword] = clean_name
+            keyword = self._normalize(keyword)
+            with self._write_lock:
+                trie_dict, fresh, nodes = self._writable_trie_dict()
+                status, created = self._add_to_trie_dict(trie_dict, fresh, keyword, clean_name)
+                self._snapshot = _Snapshot(trie_dict, None, self._snapshot.terms + status, nodes + created)
         return status
 
     def __delitem__(self, keyword):
@@ -189,42 +277,223 @@ class KeywordProcessor(object):
         """
         status = False
         if keyword:
-            if not self.case_sensitive:
-                keyword = keyword.lower()
-            current_dict = self.keyword_trie_dict
-            character_trie_list = []
-            for letter in keyword:
-                if letter in current_dict:
-                    character_trie_list.append((letter, current_dict))
-                    current_dict = current_dict[letter]
-                else:
-                    # if character is not found, break out of the loop
-                    current_dict = None
-                    break
-            # remove the characters from trie dict if there are no other keywords with them
-            if current_dict and self._keyword in current_dict:
-                # we found a complete match for input keyword.
-                character_trie_list.append((self._keyword, current_dict))
-                character_trie_list.reverse()
-
-                for key_to_remove, dict_pointer in character_trie_list:
-                    if len(dict_pointer.keys()) == 1:
-                        dict_pointer.pop(key_to_remove)
-                    else:
-                        # more than one key means more than 1 path.
-                        # Delete not required path and keep the other
-                        dict_pointer.pop(key_to_remove)
-                        break
-                # successfully removed keyword
-                status = True
-                self._terms_in_trie -= 1
+            keyword = self._normalize(keyword)
+            with self._write_lock:
+                trie_dict, fresh, nodes = self._writable_trie_dict()
+                status, removed = self._remove_from_trie_dict(trie_dict, fresh, keyword)
+                if status:
+                    self._snapshot = _Snapshot(trie_dict, None, self._snapshot.terms - 1, nodes - removed)
         return status
 
+    def update_keywords(self, add=None, remove=None):
+        """Adds and removes many keywords at once and publishes the result as one new version.
+
+        Readers keep using the current version while the new one is built, they never see a
+        partly updated trie. A frozen processor is compiled again before the new version is
+        published, so the read path stays on a compiled trie.
+
+        Args:
+            add (dict): keyword -> clean name (None to use the keyword itself)
+            remove (iterable(str)): keywords to remove, applied before `add`
+
+        Examples:
+            >>> keyword_processor.update_keywords(add={'Big Apple': 'New York', 'Bay Area': None}, remove=['NY'])
+        """
+        with self._write_lock:
+            frozen = self._snapshot.frozen
+            if self.dawg and not remove and not self._snapshot.terms:
+                # bulk build, no dict trie at all
+                keywords = {
+                    self._normalize(keyword): clean_name or keyword
+                    for keyword, clean_name in (add or {}).items()
+                    if keyword
+                }
+                dawg = Dawg.from_sorted_items(sorted(keywords.items()))
+                self._snapshot = _Snapshot(None, dawg, len(dawg), None)
+                return
+            trie_dict, fresh, nodes = self._writable_trie_dict()
+            terms = self._snapshot.terms
+            for keyword in remove or ():
+                if keyword:
+                    status, removed = self._remove_from_trie_dict(trie_dict, fresh, self._normalize(keyword))
+                    terms -= status
+                    nodes -= removed
+            for keyword, clean_name in (add or {}).items():
+                if keyword:
+                    status, created = self._add_to_trie_dict(
+                        trie_dict, fresh, self._normalize(keyword), clean_name or keyword
+                    )
+                    terms += status
+                    nodes += created
+            if frozen is not None:
+                self._snapshot = _Snapshot(None, self._compile(trie_dict), terms, None)
+            else:
+                self._snapshot = _Snapshot(trie_dict, None, terms, nodes)
+
+    def _writable_trie_dict(self):
+        """Returns the root of a new version of the dict trie, the ids of its dicts that may be
+        changed in place (None if all may be) and its number of nodes. The other dicts are shared
+        with the current version and have to be copied before they are changed."""
+        snapshot = self._snapshot
+        if snapshot.frozen is not None:
+            trie_dict = snapshot.frozen.to_trie_dict(self._keyword)
+            return trie_dict, None, self._count_nodes(trie_dict)
+        if not snapshot.trie_dict:
+            return {}, None, 1
+        trie_dict = dict(snapshot.trie_dict)
+        return trie_dict, {id(trie_dict)}, snapshot.nodes
+
+    def _count_nodes(self, trie_dict):
+        """Counts the dicts of a dict trie, including the root"""
+        nodes = 0
+        stack = [trie_dict]
+        while stack:
+            current_dict = stack.pop()
+            nodes += 1
+            stack.extend(child for key, child in current_dict.items() if key != self._keyword)
+        return nodes
+
+    def _add_to_trie_dict(self, trie_dict, fresh, keyword, clean_name):
+        """Adds keyword to a new version from `_writable_trie_dict`, copying the shared dicts on its path.
+        Returns (True if the keyword was not present before, number of nodes created)."""
+        current_dict = trie_dict
+        created = 0
+        if fresh is None:
+            new_dict = {}
+            for letter in keyword:
+                current_dict = current_dict.setdefault(letter, new_dict)
+                if current_dict is new_dict:
+                    created += 1
+                    new_dict = {}
+        else:
+            for letter in keyword:
+                child = current_dict.get(letter)
+                if child is None:
+                    child = current_dict[letter] = {}
+                    fresh.add(id(child))
+                    created += 1
+                elif id(child) not in fresh:
+                    child = current_dict[letter] = dict(child)
+                    fresh.add(id(child))
+                current_dict = child
+        status = self._keyword not in current_dict
+        current_dict[self._keyword] = clean_name
+        return status, created
+
+    def _remove_from_trie_dict(self, trie_dict, fresh, keyword):
+        """Removes keyword from a new version from `_writable_trie_dict`, copying the shared dicts on its path.
+        Returns (True if the keyword was present, number of nodes removed)."""
+        current_dict = trie_dict
+        for letter in keyword:
+            if letter not in current_dict:
+                # if character is not found, the keyword is not present
+                return False, 0
+            current_dict = current_dict[letter]
+        if self._keyword not in current_dict:
+            return False, 0
+        # we found a complete match for input keyword.
+        current_dict = trie_dict
+        character_trie_list = []
+        for letter in keyword:
+            character_trie_list.append((letter, current_dict))
+            child = current_dict[letter]
+            if fresh is not None and id(child) not in fresh:
+                child = current_dict[letter] = dict(child)
+                fresh.add(id(child))
+            current_dict = child
+        character_trie_list.append((self._keyword, current_dict))
+        character_trie_list.reverse()
+        # remove the characters from trie dict if there are no other keywords with them
+        removed = -1
+        for key_to_remove, dict_pointer in character_trie_list:
+            removed += 1
+            if len(dict_pointer.keys()) == 1:
+                dict_pointer.pop(key_to_remove)
+            else:
+                # more than one key means more than 1 path.
+                # Delete not required path and keep the other
+                dict_pointer.pop(key_to_remove)
+                break
+        return True, removed
+
     def __iter__(self):
         """Disabled iteration as get_all_keywords() is the right way to iterate
         """
         raise NotImplementedError("Please use get_all_keywords() instead")
 
+    def freeze(self):
+        """Compiles the trie into the compact, read-only `FrozenTrie` layout
+        and releases the nested dict trie.
+        All lookups and `extract_keywords` run against the compiled trie afterwards.
+        Adding or removing single keywords unfreezes the processor again, `update_keywords`
+        compiles the changed trie again instead.
+        In aho_corasick mode the compiled trie is an `AhoCorasickTrie`, in dawg mode a `Dawg`.
+
+        Returns:
+            frozen_trie : FrozenTrie
+                The compiled trie.
+
+        Examples:
+            >>> keyword_processor.add_keyword('Big Apple', 'New York')
+            >>> keyword_processor.freeze()
+            >>> keyword_processor.extract_keywords('I love big apple')
+            >>> # ['New York']
+        """
+        snapshot = self._snapshot
+        if snapshot.frozen is None:
+            with self._write_lock:
+                snapshot = self._snapshot
+                if snapshot.frozen is None:
+                    snapshot = self._snapshot = _Snapshot(
+                        None, self._compile(snapshot.trie_dict), snapshot.terms, None
+                    )
+        return snapshot.frozen
+
+    def compile(self):
+        """Returns the compiled trie without freezing the processor.
+        If the processor is frozen this is the trie in use, otherwise a new one is compiled from the dict trie.
+
+        Returns:
+            frozen_trie : FrozenTrie
+                The compiled trie, an `AhoCorasickTrie` in aho_corasick mode.
+        """
+        snapshot = self._snapshot
+        if snapshot.frozen is not None:
+            return snapshot.frozen
+        return self._compile(snapshot.trie_dict)
+
+    def _compile(self, trie_dict):
+        if self.dawg:
+            return Dawg.from_sorted_items(sorted(self._iter_trie_dict(trie_dict, '')))
+        trie_class = AhoCorasickTrie if self.aho_corasick else FrozenTrie
+        return trie_class.from_trie_dict(trie_dict, self._keyword, self.non_word_boundaries)
+
+    def set_frozen(self, frozen_trie):
+        """Replaces all keywords by an already compiled trie, e.g. one loaded with `FrozenTrie.load`.
+        The processor is frozen afterwards.
+
+        Args:
+            frozen_trie (FrozenTrie|Dawg): compiled trie with the same case sensitivity as this processor
+        """
+        with self._write_lock:
+            self.aho_corasick = isinstance(frozen_trie, AhoCorasickTrie)
+            self.dawg = isinstance(frozen_trie, Dawg)
+            self._snapshot = _Snapshot(None, frozen_trie, len(frozen_trie), None)
+
+    def unfreeze(self):
+        """Rebuilds the nested dict trie from the compiled trie, so keywords can be changed again.
+        """
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.frozen is not None:
+                trie_dict = snapshot.frozen.to_trie_dict(self._keyword)
+                self._snapshot = _Snapshot(trie_dict, None, snapshot.terms, self._count_nodes(trie_dict))
+
+    @property
+    def is_frozen(self):
+        """True if the processor currently uses the compiled trie"""
+        return self._snapshot.frozen is not None
+
     def set_non_word_boundaries(self, non_word_boundaries):
         """set of characters that will be considered as part of word.
 
@@ -340,14 +609,16 @@ class KeywordProcessor(object):
         """
         if not os.path.isfile(keyword_file):
             raise IOError("Invalid file path {}".format(keyword_file))
+        keywords = {}
         with io.open(keyword_file, encoding=encoding) as f:
             for line in f:
                 if '=>' in line:
                     keyword, clean_name = line.split('=>')
-                    self.add_keyword(keyword, clean_name.strip())
+                    keywords[keyword] = clean_name.strip()
                 else:
                     keyword = line.strip()
-                    self.add_keyword(keyword)
+                    keywords[keyword] = None
+        self.update_keywords(add=keywords)
 
     def add_keywords_from_dict(self, keyword_dict):
         """To add keywords from a dictionary
@@ -366,12 +637,14 @@ class KeywordProcessor(object):
             AttributeError: If value for a key in `keyword_dict` is not a list.
 
         """
+        add = {}
         for clean_name, keywords in keyword_dict.items():
             if not isinstance(keywords, list):
                 raise AttributeError("Value of key {} should be a list".format(clean_name))
 
             for keyword in keywords:
-                self.add_keyword(keyword, clean_name)
+                add[keyword] = clean_name
+        self.update_keywords(add=add)
 
     def remove_keywords_from_dict(self, keyword_dict):
         """To remove keywords from a dictionary
@@ -390,12 +663,13 @@ class KeywordProcessor(object):
             AttributeError: If value for a key in `keyword_dict` is not a list.
 
         """
+        remove = []
         for clean_name, keywords in keyword_dict.items():
             if not isinstance(keywords, list):
                 raise AttributeError("Value of key {} should be a list".format(clean_name))
 
-            for keyword in keywords:
-                self.remove_keyword(keyword)
+            remove.extend(keywords)
+        self.update_keywords(remove=remove)
 
     def add_keywords_from_list(self, keyword_list):
         """To add keywords from a list
@@ -412,8 +686,7 @@ class KeywordProcessor(object):
         if not isinstance(keyword_list, list):
             raise AttributeError("keyword_list should be a list")
 
-        for keyword in keyword_list:
-            self.add_keyword(keyword)
+        self.update_keywords(add=dict.fromkeys(keyword_list))
 
     def remove_keywords_from_list(self, keyword_list):
         """To remove keywords present in list
@@ -430,12 +703,11 @@ class KeywordProcessor(object):
         if not isinstance(keyword_list, list):
                 raise AttributeError("keyword_list should be a list")
 
-        for keyword in keyword_list:
-            self.remove_keyword(keyword)
+        self.update_keywords(remove=keyword_list)
 
     def get_all_keywords(self, term_so_far='', current_dict=None):
-        """Recursively builds a dictionary of keywords present in the dictionary
-        And the clean name mapped to those keywords.
+        """Builds a dictionary of keywords present in the dictionary
+        And the clean name mapped to those keywords. Use `iter_keywords` to go through them lazily.
 
         Args:
             term_so_far : string
@@ -456,30 +728,86 @@ class KeywordProcessor(object):
             >>> {'j2ee': 'Java', 'python': 'Python'}
             >>> # NOTE: for case_insensitive all keys will be lowercased.
         """
-        terms_present = {}
-        if not term_so_far:
-            term_so_far = ''
         if current_dict is None:
-            current_dict = self.keyword_trie_dict
-        for key in current_dict:
-            if key == '_keyword_':
-                terms_present[term_so_far] = current_dict[key]
-            else:
-                sub_values = self.get_all_keywords(term_so_far + key, current_dict[key])
-                for key in sub_values:
-                    terms_present[key] = sub_values[key]
-        return terms_present
+            return dict(self.iter_keywords())
+        return dict(self._iter_trie_dict(current_dict, term_so_far or ''))
+
+    def iter_keywords(self):
+        """Lazily yields all keywords and the clean names mapped to them, without building
+        a dictionary of all of them first.
+
+        Returns:
+            generator : (keyword, clean_name) pairs
+
+        Examples:
+            >>> keyword_processor.add_keyword('j2ee', 'Java')
+            >>> next(keyword_processor.iter_keywords())
+            >>> # ('j2ee', 'Java')
+        """
+        snapshot = self._snapshot
+        if snapshot.frozen is not None:
+            return snapshot.frozen.iter_items()
+        return self._iter_trie_dict(snapshot.trie_dict, '')
+
+    def keywords_with_prefix(self, prefix, limit=None):
+        """Returns the keywords starting with `prefix`, e.g. for autocompletion.
+        Only the subtree below the prefix is visited.
+
+        Args:
+            prefix (str): beginning of the keywords, normalized like keywords
+            limit (int): return at most this many keywords.
+                Defaults to all
+
+        Returns:
+            keywords (list(tuple)): (keyword, clean_name) pairs
 
-    def extract_keywords(self, sentence, span_info=False):
+        Examples:
+            >>> keyword_processor.add_keywords_from_list(['java', 'javascript', 'python'])
+            >>> keyword_processor.keywords_with_prefix('Java')
+            >>> # [('java', 'java'), ('javascript', 'javascript')]
+        """
+        prefix = self._normalize(prefix)
+        snapshot = self._snapshot
+        if snapshot.frozen is not None:
+            keywords = snapshot.frozen.iter_prefix(prefix)
+        else:
+            current_dict = snapshot.trie_dict
+            for char in prefix:
+                if char not in current_dict:
+                    return []
+                current_dict = current_dict[char]
+            keywords = self._iter_trie_dict(current_dict, prefix)
+        return list(itertools.islice(keywords, limit))
+
+    def _iter_trie_dict(self, current_dict, term_so_far):
+        """Yields (keyword, clean_name) below `current_dict` in the order of the recursive walk"""
+        stack = [(term_so_far, current_dict, True)]
+        while stack:
+            term, item, is_dict = stack.pop()
+            if not is_dict:
+                yield term, item
+                continue
+            stack.extend(
+                (term, child, False) if key == self._keyword else (term + key, child, True)
+                for key, child in reversed(list(item.items()))
+            )
+
+    def extract_keywords(self, sentence, span_info=False, overlapping=False):
         """Searches in the string for all keywords present in corpus.
         Keywords present are added to a list `keywords_extracted` and returned.
 
         Args:
             sentence (str): Line of text where we will search for keywords
+            span_info (bool): Return (keyword, start, end) tuples instead of the keywords only
+            overlapping (bool): Return all matches, also nested and overlapping ones.
+                Only available in aho_corasick mode.
 
         Returns:
             keywords_extracted (list(str)): List of terms/keywords found in sentence that match our corpus
 
+        Raises:
+            ValueError: If `overlapping` is requested without aho_corasick mode.
+
         Examples:
             >>> from flashtext import KeywordProcessor
             >>> keyword_processor = KeywordProcessor()
@@ -491,12 +819,20 @@ class KeywordProcessor(object):
 
         """
         keywords_extracted = []
+        if overlapping and not self.aho_corasick:
+            raise ValueError("Overlapping matches are only available in aho_corasick mode")
         if not sentence:
             # if sentence is empty or none just return empty list
             return keywords_extracted
-        if not self.case_sensitive:
-            sentence = sentence.lower()
-        current_dict = self.keyword_trie_dict
+        sentence, offsets = self._normalize_sentence(sentence)
+        if self.aho_corasick:
+            keywords_extracted = self.freeze().extract_keywords(sentence, self.non_word_boundaries, overlapping)
+            return self._spans_result(keywords_extracted, offsets, span_info)
+        snapshot = self._snapshot
+        if snapshot.frozen is not None:
+            keywords_extracted = snapshot.frozen.extract_keywords(sentence, self.non_word_boundaries)
+            return self._spans_result(keywords_extracted, offsets, span_info)
+        keyword_trie_dict = current_dict = snapshot.trie_dict
         sequence_start_pos = 0
         sequence_end_pos = 0
         reset_current_dict = False
@@ -544,20 +880,20 @@ class KeywordProcessor(object):
                                 is_longer_seq_found = True
                         if is_longer_seq_found:
                             idx = sequence_end_pos
-                    current_dict = self.keyword_trie_dict
+                    current_dict = keyword_trie_dict
                     if longest_sequence_found:
                         keywords_extracted.append((longest_sequence_found, sequence_start_pos, idx))
                     reset_current_dict = True
                 else:
                     # we reset current_dict
-                    current_dict = self.keyword_trie_dict
+                    current_dict = keyword_trie_dict
                     reset_current_dict = True
             elif char in current_dict:
                 # we can continue from this char
                 current_dict = current_dict[char]
             else:
                 # we reset current_dict
-                current_dict = self.keyword_trie_dict
+                current_dict = keyword_trie_dict
                 reset_current_dict = True
                 # skip to end of word
                 idy = idx + 1
@@ -576,8 +912,224 @@ class KeywordProcessor(object):
             if reset_current_dict:
                 reset_current_dict = False
                 sequence_start_pos = idx
-        if span_info:
+        return self._spans_result(keywords_extracted, offsets, span_info)
+
+    def iter_extract_keywords(self, source, chunk_size=65536):
+        """Searches a text that is read piece by piece and yields the keywords as they are found.
+
+        Only a window of about `chunk_size` plus the longest keyword characters is kept in memory.
+        A match is yielded once enough text after its start is known that a longer match or a
+        continuing word can be ruled out, so keywords spanning two chunks are found like in the
+        complete text. The trie gets frozen for the search.
+
+        Args:
+            source (str|file|iterable(str)): the text, a file object opened in text mode or an
+                iterable of text chunks
+            chunk_size (int): number of characters read from a file object at once.
+                Defaults to 65536
+
+        Yields:
+            tuple: (keyword, start, end) with offsets into the complete text
+
+        Examples:
+            >>> keyword_processor.add_keyword('Big Apple', 'New York')
+            >>> list(keyword_processor.iter_extract_keywords(['I love Big Ap', 'ple']))
+            >>> # [('New York', 7, 16)]
+        """
+        if isinstance(source, str):
+            chunks = [source]
+        elif hasattr(source, "read"):
+            chunks = iter(lambda: source.read(chunk_size), "")
+        else:
+            chunks = source
+        # characters after a match start that decide about the match: the keyword and its end boundary
+        window = self.freeze().max_keyword_len + 1
+        buffer = ""
+        offset = 0
+        # the buffer starts inside a word that is longer than any keyword
+        in_word = False
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                if not chunk:
+                    continue
+                buffer += chunk
+            if in_word:
+                cut = next((idx + 1 for idx, char in enumerate(buffer) if self._is_boundary(char)), None)
+                if cut is None:
+                    offset += len(buffer)
+                    buffer = ""
+                    continue
+                in_word = False
+                buffer = buffer[cut:]
+                offset += cut
+            if chunk is None:
+                for keyword, start, end in self.extract_keywords(buffer, span_info=True):
+                    yield keyword, offset + start, offset + end
+                return
+            limit = len(buffer) - window
+            if limit <= 0:
+                continue
+            cut = 0
+            for keyword, start, end in self.extract_keywords(buffer, span_info=True):
+                if start >= limit:
+                    break
+                yield keyword, offset + start, offset + end
+                cut = end + 1
+            # restart at the last word start before limit that no match covers, the search
+            # passes every such position
+            for idx in range(limit - 1, cut - 1, -1):
+                if self._is_boundary(buffer[idx]):
+                    cut = idx + 1
+                    break
+            else:
+                if cut < limit:
+                    # no match starts at cut, the search continues after the end of its word
+                    cut = limit
+                    in_word = True
+            buffer = buffer[cut:]
+            offset += cut
+
+    def _is_boundary(self, char):
+        """Whether `char` ends a word, after normalization"""
+        return self._normalize(char)[-1:] not in self.non_word_boundaries
+
+    def extract_keywords_fuzzy(self, sentence, max_edits, keyword_length=False):
+        """Searches in the string for keywords, allowing a few typos per keyword.
+
+        Matches within `max_edits` Levenshtein edits (insertions, deletions, substitutions)
+        of a keyword are found by walking the trie, only the part of the trie within the
+        allowed edits is visited. The trie gets frozen for the search.
+
+        Args:
+            sentence (str): Line of text where we will search for keywords
+            max_edits (dict|int|EditBudget): minimal keyword length -> number of edits allowed,
+                e.g. {4: 1, 8: 2}. An int applies to all keyword lengths. A match always needs
+                fewer edits than the keyword has characters.
+            keyword_length (bool): Add the length of the matched keyword (as normalized) to the tuples.
+                Defaults to False
+
+        Returns:
+            keywords_extracted (list(tuple)): (keyword, start, end, edits) for every match,
+                edits is 0 for exact matches
+
+        Raises:
+            ValueError: In dawg mode, the search needs the tree shape of the `FrozenTrie`
+
+        Examples:
+            >>> keyword_processor.add_keyword('Big Apple', 'New York')
+            >>> keyword_processor.extract_keywords_fuzzy('I love Big Aple', {5: 1})
+            >>> # [('New York', 7, 15, 1)]
+        """
+        if self.dawg:
+            raise ValueError("Fuzzy matching is not available in dawg mode")
+        if not sentence:
+            return []
+        if not isinstance(max_edits, EditBudget):
+            max_edits = EditBudget(max_edits)
+        sentence, offsets = self._normalize_sentence(sentence)
+        keywords_extracted = extract_keywords_fuzzy(self.freeze(), sentence, self.non_word_boundaries, max_edits)
+        if offsets is not None:
+            keywords_extracted = [
+                (value, offsets[start], offsets[end - 1] + 1, edits, length)
+                for value, start, end, edits, length in keywords_extracted
+            ]
+        if keyword_length:
+            return keywords_extracted
+        return [match[:4] for match in keywords_extracted]
+
+    def build_token_trie(self):
+        """Builds a `TokenTrie` with the current keywords, to search the tokens of a tokenizer
+        instead of the characters of the text.
+
+        Returns:
+            token_trie : TokenTrie
+        """
+        token_trie = TokenTrie(self._normalize_sentence, self.non_word_boundaries)
+        for keyword, clean_name in self.iter_keywords():
+            token_trie.add_keyword(keyword, clean_name)
+        return token_trie
+
+    def _normalize_sentence(self, sentence):
+        """Returns the sentence in the form keywords are stored in and the offsets to map positions
+        back, None if the positions did not change"""
+        if self.normalizer is not None:
+            return self.normalizer.normalize(sentence)
+        if not self.case_sensitive:
+            return sentence.lower(), None
+        return sentence, None
+
+    def _normalize(self, keyword):
+        """Brings a keyword into the form it is stored in the trie"""
+        if self.normalizer is not None:
+            return self.normalizer(keyword)
+        if not self.case_sensitive:
+            return keyword.lower()
+        return keyword
+
+    @staticmethod
+    def _spans_result(keywords_extracted, offsets, span_info):
+        """Maps the spans found in the normalized sentence back to the original sentence"""
+        if not span_info:
+            return [value[0] for value in keywords_extracted]
+        if offsets is None:
             return keywords_extracted
-        return [value[0] for value in keywords_extracted]
+        return [(value, offsets[start], offsets[end - 1] + 1) for value, start, end in keywords_extracted]
+
+    def extract_keywords_batch(self, sentences, workers=None, span_info=True, chunk_size=None):
+        """Extracts the keywords of many sentences, split across a pool of worker processes.
 
+        The trie is built (and in aho_corasick mode compiled) once in this process. The workers
+        are forked afterwards and read the trie and the sentences copy-on-write, only the
+        (start, end) index ranges of the chunks are sent to them.
+        Forking is safe while other threads run (e.g. a file watcher): a child only gets the
+        calling thread, but the workers only read the snapshot the processor published and take
+        no lock. The workers are forked while holding the write lock, so no writer is half way
+        through publishing a new snapshot, and logging resets its locks in a forked child. The
+        DeprecationWarning of python 3.12+ about forking with threads does not apply to this.
+        Without `fork` support or with a single worker the sentences are processed in this process.
 
+        Args:
+            sentences (iterable(str)): Sentences to search
+            workers (int): Number of worker processes.
+                Defaults to the number of CPUs
+            span_info (bool): Return (keyword, start, end) tuples instead of the keywords only.
+                Defaults to True
+            chunk_size (int): Number of sentences per task.
+                Defaults to four tasks per worker
+
+        Returns:
+            keywords_extracted (list(list)): The result of `extract_keywords` for each sentence, in input order
+
+        Examples:
+            >>> keyword_processor.add_keyword('Big Apple', 'New York')
+            >>> keyword_processor.extract_keywords_batch(['I love Big Apple', 'no match'], workers=2)
+            >>> # [[('New York', 7, 16)], []]
+        """
+        global _batch_processor, _batch_sentences
+        sentences = list(sentences)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(sentences))
+        if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            return [self.extract_keywords(sentence, span_info=span_info) for sentence in sentences]
+        if self.aho_corasick:
+            self.freeze()
+        if not chunk_size:
+            chunk_size = math.ceil(len(sentences) / (4 * workers))
+        bounds = [
+            (start, min(start + chunk_size, len(sentences)), span_info)
+            for start in range(0, len(sentences), chunk_size)
+        ]
+        with _batch_lock:
+            _batch_processor, _batch_sentences = self, sentences
+            # keep the garbage collector of the workers from touching (and so copying) the shared objects
+            gc.freeze()
+            try:
+                with self._write_lock:
+                    pool = multiprocessing.get_context("fork").Pool(workers)
+                with pool:
+                    chunks = pool.map(_extract_keywords_chunk, bounds)
+            finally:
+                gc.unfreeze()
+                _batch_processor = _batch_sentences = None
+        return [keywords for chunk in chunks for keywords in chunk]
@@ -0,0 +1,719 @@
+import json
+import mmap
+import re
+import struct
+import sys
+from array import array
+from collections import deque
+
+
+#################
+# Compact, read-only layout for the KeywordProcessor trie.
+#
+# The nested dict trie of flashtext needs one python dict per character of
+# every keyword. Once the keywords are known, the trie is compiled into a
+# double-array (base/check) so that a node is just an integer and a
+# transition is two array lookups:
+#
+#     child = base[node] + label(char)    valid if check[child] == node
+#
+# Chains of nodes with a single child and no keyword (the unique tail of
+# most keywords) are collapsed into the node where the chain starts. The
+# characters of the chain are kept in one shared tail string and compared
+# with str.startswith instead of one transition per character.
+#
+# As keywords can only start at a word start and end at a word end, the
+# first word of a keyword has to be a complete word of the text. The nodes
+# reached after the first word are kept in `word_nodes`, so a word of the
+# text needs a single dict lookup instead of a walk through the trie.
+#
+# Keyword values are stored once in a value table, nodes only keep the
+# index into that table.
+#
+# The binary artifact keeps the arrays and the value table outside of its
+# json header. A memory mapped artifact is shared by all processes mapping
+# the same file, a value is only decoded into a private object when a
+# process finds it. The index of the first words is the one large private
+# structure left, it can be left out at the cost of a slower search.
+#################
+
+ROOT = 0
+NO_VALUE = -1
+FREE = -1
+
+# binary artifact: magic, format version, header length, json header, arrays (8 byte aligned),
+# since version 2 followed by the value offsets, the json values and the json first word index
+ARTIFACT_MAGIC = b"EHTRIE\x00\x00"
+ARTIFACT_VERSION = 2
+_ARTIFACT_PREFIX = struct.Struct("<8sII")
+_OFFSET_SIZE = array("q").itemsize
+
+_MISSING = object()
+
+
+class _Alphabet(dict):
+    """Maps characters to their edge label (1..n). Unknown characters map to 0,
+    which never is a valid transition."""
+
+    def __missing__(self, key):
+        return 0
+
+
+def _grow(arrays, size):
+    """Extends the double-array `arrays` (base, check, value_ids, tail_pos, tail_len) to `size` slots"""
+    grow = size - len(arrays[0])
+    if grow > 0:
+        for arr, fill in zip(arrays, (0, FREE, NO_VALUE, 0, 0)):
+            arr.extend(array("i", [fill]) * grow)
+
+
+class _ValueTable(object):
+    """Read-only value table of a loaded artifact. A value is decoded from its json on the
+    first access and kept, later accesses return the same object."""
+
+    def __init__(self, offsets, blob):
+        """
+        Args:
+            offsets (memoryview): start of every value in blob, plus the end of the last one
+            blob (memoryview): the json encoded values
+        """
+        self._offsets = offsets
+        self._blob = blob
+        self._decoded = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, vid):
+        value = self._decoded.get(vid, _MISSING)
+        if value is _MISSING:
+            value = self._decoded[vid] = self.peek(vid)
+        return value
+
+    def __iter__(self):
+        return (self[vid] for vid in range(len(self)))
+
+    def peek(self, vid):
+        """Returns the value of vid without keeping it, decoded again on every call unless it was accessed"""
+        value = self._decoded.get(vid, _MISSING)
+        if value is _MISSING:
+            if not 0 <= vid < len(self):
+                raise IndexError(f"value id {vid} out of range")
+            value = json.loads(bytes(self._blob[self._offsets[vid]:self._offsets[vid + 1]]))
+        return value
+
+
+class FrozenTrie(object):
+    """Double-array compiled version of a `KeywordProcessor` trie dict.
+
+    Attributes:
+        chars (list): edge label -> character (index 0 is unused)
+        alphabet (dict): character -> edge label, 0 for characters not used in any keyword
+        base (array): per node, offset of its children slots
+        check (array): per slot, the parent node or -1 for unused slots
+        value_ids (array): per node, index into `values` or -1 if no keyword ends here
+        tail_pos (array): per node, start of the collapsed single child chain in `tails`
+        tail_len (array): per node, length of the collapsed chain (0 if there is none)
+        tails (str): all collapsed chains
+        values (list): value table, every distinct value object is stored once
+        terms (int): number of keywords
+        max_keyword_len (int): length of the longest keyword
+        non_word_boundaries (frozenset(str)): word characters the trie was compiled for, or None
+        word_nodes (dict): first word of the keywords -> node after that word
+    """
+
+    def __init__(
+        self,
+        chars,
+        base,
+        check,
+        value_ids,
+        tail_pos,
+        tail_len,
+        tails,
+        values,
+        terms,
+        max_keyword_len,
+        non_word_boundaries=None,
+        word_nodes=None,
+    ):
+        self.chars = chars
+        self.alphabet = _Alphabet((char, label) for label, char in enumerate(chars) if label)
+        self.base = base
+        self.check = check
+        self.value_ids = value_ids
+        self.tail_pos = tail_pos
+        self.tail_len = tail_len
+        self.tails = tails
+        self.values = values
+        self.terms = terms
+        self.max_keyword_len = max_keyword_len
+        self.non_word_boundaries = non_word_boundaries
+        self.word_nodes = word_nodes
+        self._boundary_pattern = None
+        self._children = None
+        self._longest_below = None
+        self._node_count = None
+
+    def __len__(self):
+        return self.terms
+
+    # arrays written to and mapped from the binary artifact
+    array_names = ("base", "check", "value_ids", "tail_pos", "tail_len")
+
+    @property
+    def node_count(self):
+        """Number of used slots (incl. the root) in the double-array, counted once and kept"""
+        if self._node_count is None:
+            check = self.check if isinstance(self.check, array) else array("i", self.check)
+            self._node_count = len(check) - check.count(FREE) + 1
+        return self._node_count
+
+    @property
+    def nbytes(self):
+        """Approximate size of the arrays and tails in bytes (without the value table)"""
+        arrays = (self.base, self.check, self.value_ids, self.tail_pos, self.tail_len)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.tails.encode("utf-8"))
+
+    @classmethod
+    def from_trie_dict(cls, trie_dict, keyword_key="_keyword_", non_word_boundaries=None, collapse_chains=True):
+        """Compiles a flashtext trie dict into a `FrozenTrie`.
+
+        Nodes are placed breadth first. Nodes with a single child use the first
+        free slot, for nodes with several children the first base offset is
+        searched where all children slots are free.
+
+        Args:
+            trie_dict (dict): root of the nested dict trie
+            keyword_key (str): key that marks the end of a keyword in `trie_dict`
+            non_word_boundaries (set(str)): characters that continue a word. If given, collapsed
+                chains stop at word boundaries and the first word index is built.
+            collapse_chains (bool): collapse single child chains into tails. Defaults to True
+
+        Returns:
+            FrozenTrie: the compiled trie
+        """
+        chars = set()
+        stack = [trie_dict]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key != keyword_key:
+                    chars.add(key)
+                    stack.append(child)
+        chars = [""] + sorted(chars)
+        labels = {char: label for label, char in enumerate(chars) if label}
+
+        arrays = tuple(array("i") for _ in range(5))
+        base, check, value_ids, tail_pos, tail_len = arrays
+        used = bytearray()
+        _grow(arrays, max(256, 2 * len(chars)))
+        used.extend(bytes(len(base)))
+        used[ROOT] = 1
+        values = []
+        value_index = {}
+        tails = []
+        tail_index = {}
+        tails_len = 0
+        terms = 0
+        max_keyword_len = 0
+        max_base = 0
+        first_free = 1
+        # where the search for nodes with several children starts, it only moves forward
+        # so that the densely packed front of the array is not scanned over and over
+        search_from = 1
+
+        if non_word_boundaries is not None:
+            non_word_boundaries = frozenset(non_word_boundaries)
+            word_nodes = {}
+        else:
+            word_nodes = None
+
+        # word is the path to the node as long as it only consists of word characters
+        queue = deque([(ROOT, trie_dict, 0, "" if word_nodes is not None else None)])
+        while queue:
+            slot, node, depth, word = queue.popleft()
+            if word and (keyword_key in node or any(key not in non_word_boundaries for key in node)):
+                word_nodes[word] = slot
+            children = []
+            for key, child in node.items():
+                if key == keyword_key:
+                    vid = value_index.get(id(child))
+                    if vid is None:
+                        vid = value_index[id(child)] = len(values)
+                        values.append(child)
+                    value_ids[slot] = vid
+                    terms += 1
+                    max_keyword_len = max(max_keyword_len, depth)
+                else:
+                    children.append((labels[key], child))
+            if not children:
+                continue
+            children.sort(key=lambda c: c[0])
+            first, last = children[0][0], children[-1][0]
+            if len(children) == 1:
+                offset = used.find(0, max(first_free, first))
+                offset = (len(used) if offset == -1 else offset) - first
+            else:
+                pos = used.find(0, max(search_from, first_free, first))
+                attempts = 0
+                while True:
+                    if pos == -1:
+                        pos = max(len(used), first)
+                    offset = pos - first
+                    if offset + last >= len(used):
+                        size = max(offset + last + 1, 2 * len(used))
+                        _grow(arrays, size)
+                        used.extend(bytes(size - len(used)))
+                    for label, _ in children:
+                        if used[offset + label]:
+                            break
+                    else:
+                        break
+                    attempts += 1
+                    pos = used.find(0, pos + 1)
+                if attempts > 16:
+                    search_from = pos
+            if offset + last >= len(used):
+                size = max(offset + last + 1, 2 * len(used))
+                _grow(arrays, size)
+                used.extend(bytes(size - len(used)))
+            base[slot] = offset
+            max_base = max(max_base, offset)
+            for label, child in children:
+                # collapse the chain of single children without keyword
+                tail = []
+                while collapse_chains and len(child) == 1 and keyword_key not in child:
+                    key, grandchild = next(iter(child.items()))
+                    if non_word_boundaries is not None and key not in non_word_boundaries:
+                        break
+                    tail.append(key)
+                    child = grandchild
+                child_slot = offset + label
+                tail = "".join(tail)
+                if tail:
+                    pos = tail_index.get(tail)
+                    if pos is None:
+                        pos = tail_index[tail] = tails_len
+                        tails.append(tail)
+                        tails_len += len(tail)
+                    tail_pos[child_slot] = pos
+                    tail_len[child_slot] = len(tail)
+                used[child_slot] = 1
+                check[child_slot] = slot
+                if word is not None and chars[label] in non_word_boundaries:
+                    child_word = word + chars[label] + tail
+                else:
+                    child_word = None
+                queue.append((child_slot, child, depth + 1 + len(tail), child_word))
+            first_free = used.find(0, first_free)
+            if first_free == -1:
+                first_free = len(used)
+
+        # every base[node] + label has to stay inside the arrays
+        size = max(len(used) - used[::-1].find(1), max_base + len(chars))
+        _grow(arrays, size)
+        for arr in arrays:
+            del arr[size:]
+        return cls(
+            chars,
+            base,
+            check,
+            value_ids,
+            tail_pos,
+            tail_len,
+            "".join(tails),
+            values,
+            terms,
+            max_keyword_len,
+            non_word_boundaries,
+            word_nodes,
+        )
+
+    def save(self, path, values=None):
+        """Writes the trie to a binary, versioned artifact that `load` can memory map.
+
+        The value table and the first word index are written after the arrays, a loaded
+        trie only decodes what it uses of them.
+
+        Args:
+            path (str): file to write
+            values (list): value table to store instead of `values`, must have the same order.
+                All values have to be JSON serializable.
+        """
+        arrays = [getattr(self, name) for name in self.array_names]
+        encoded = [
+            json.dumps(value, ensure_ascii=False).encode("utf-8")
+            for value in (self.values if values is None else values)
+        ]
+        offsets = array("q", [0]) * (len(encoded) + 1)
+        for vid, value in enumerate(encoded):
+            offsets[vid + 1] = offsets[vid] + len(value)
+        word_nodes = json.dumps(self.word_nodes, ensure_ascii=False).encode("utf-8")
+        header = {
+            "kind": type(self).__name__,
+            "byteorder": sys.byteorder,
+            "itemsize": [a.itemsize for a in arrays],
+            "lengths": [len(a) for a in arrays],
+            "chars": self.chars,
+            "tails": self.tails,
+            "values_count": len(encoded),
+            "values_bytes": offsets[-1],
+            "word_nodes_bytes": len(word_nodes),
+            "terms": self.terms,
+            "node_count": self.node_count,
+            "max_keyword_len": self.max_keyword_len,
+            "non_word_boundaries": sorted(self.non_word_boundaries) if self.non_word_boundaries is not None else None,
+        }
+        header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        header += b" " * (-(_ARTIFACT_PREFIX.size + len(header)) % 8)
+        with open(path, "wb") as f:
+            f.write(_ARTIFACT_PREFIX.pack(ARTIFACT_MAGIC, ARTIFACT_VERSION, len(header)))
+            f.write(header)
+            for arr in arrays:
+                data = arr.tobytes()
+                f.write(data)
+                f.write(b"\x00" * (-len(data) % 8))
+            f.write(offsets.tobytes())
+            f.write(b"".join(encoded))
+            f.write(word_nodes)
+
+    @classmethod
+    def load(cls, path, use_mmap=True, word_nodes=True):
+        """Loads a trie written by `save`.
+
+        With `use_mmap` the arrays and the value table are read-only views into the memory
+        mapped file, so nothing is copied or rebuilt and all processes loading the same file
+        share its pages. Values are decoded when they are first found.
+
+        Args:
+            path (str): artifact to read
+            use_mmap (bool): map the file instead of reading it. Defaults to True
+            word_nodes (bool): load the index of the first words of the keywords. Without it
+                every search walks the first word through the arrays, which is slower but
+                keeps the private memory of a process small. Defaults to True
+
+        Returns:
+            FrozenTrie: instance of the class the artifact was written from
+
+        Raises:
+            ValueError: If the file is no trie artifact, has another format version or was
+                written on a platform with other byte order or integer size
+        """
+        with open(path, "rb") as f:
+            if use_mmap:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = f.read()
+        if len(buffer) < _ARTIFACT_PREFIX.size:
+            raise ValueError(f"{path} is not a keyword trie artifact")
+        magic, version, header_len = _ARTIFACT_PREFIX.unpack_from(buffer)
+        if magic != ARTIFACT_MAGIC:
+            raise ValueError(f"{path} is not a keyword trie artifact")
+        if version not in (1, ARTIFACT_VERSION):
+            raise ValueError(f"{path} has format version {version}, expected {ARTIFACT_VERSION}")
+        offset = _ARTIFACT_PREFIX.size
+        header = json.loads(bytes(buffer[offset:offset + header_len]).decode("utf-8"))
+        offset += header_len
+        kinds = {kind.__name__: kind for kind in [FrozenTrie] + FrozenTrie.__subclasses__()}
+        kind = kinds.get(header["kind"])
+        if kind is None:
+            raise ValueError(f"{path} contains an unknown trie type {header['kind']}")
+        itemsize = array("i").itemsize
+        if header["byteorder"] != sys.byteorder or any(size != itemsize for size in header["itemsize"]):
+            raise ValueError(f"{path} was written on an incompatible platform")
+        view = memoryview(buffer)
+        arrays = {}
+        for name, length in zip(kind.array_names, header["lengths"]):
+            arrays[name] = view[offset:offset + length * itemsize].cast("i")
+            offset += length * itemsize
+            offset += -offset % 8
+        if version == 1:
+            # values and first words in the json header
+            values = header["values"]
+            first_words = header["word_nodes"] if word_nodes else None
+        else:
+            count = header["values_count"]
+            offsets = view[offset:offset + (count + 1) * _OFFSET_SIZE].cast("q")
+            offset += (count + 1) * _OFFSET_SIZE
+            values = _ValueTable(offsets, view[offset:offset + header["values_bytes"]])
+            offset += header["values_bytes"]
+            first_words = (
+                json.loads(bytes(view[offset:offset + header["word_nodes_bytes"]]).decode("utf-8"))
+                if word_nodes
+                else None
+            )
+        nwb = header["non_word_boundaries"]
+        trie = kind(
+            header["chars"],
+            arrays["base"],
+            arrays["check"],
+            arrays["value_ids"],
+            arrays["tail_pos"],
+            arrays["tail_len"],
+            header["tails"],
+            values,
+            header["terms"],
+            header["max_keyword_len"],
+            frozenset(nwb) if nwb is not None else None,
+            first_words,
+        )
+        for name in kind.array_names[5:]:
+            setattr(trie, name, arrays[name])
+        trie._node_count = header.get("node_count")
+        return trie
+
+    def to_trie_dict(self, keyword_key="_keyword_"):
+        """Rebuilds the nested flashtext trie dict.
+
+        Args:
+            keyword_key (str): key that marks the end of a keyword
+
+        Returns:
+            dict: root of the nested dict trie
+        """
+        trie_dict = {}
+        for keyword, value in self.iter_items():
+            current_dict = trie_dict
+            for char in keyword:
+                current_dict = current_dict.setdefault(char, {})
+            current_dict[keyword_key] = value
+        return trie_dict
+
+    def _tail(self, node):
+        pos = self.tail_pos[node]
+        return self.tails[pos:pos + self.tail_len[node]]
+
+    def find_node(self, word):
+        """Returns the node reached by walking all characters of `word` from the root.
+
+        Returns:
+            int: the node, None if `word` is not a path in the trie or ends inside a collapsed chain
+        """
+        base, check, alphabet, tail_len = self.base, self.check, self.alphabet, self.tail_len
+        node = ROOT
+        idx = 0
+        word_len = len(word)
+        while idx < word_len:
+            child = base[node] + alphabet[word[idx]]
+            if check[child] != node:
+                return None
+            node = child
+            idx += 1
+            if tail_len[node]:
+                tail = self._tail(node)
+                if not word.startswith(tail, idx):
+                    return None
+                idx += len(tail)
+        return node
+
+    def get(self, word, default=None):
+        """Returns the value stored for `word` or `default`"""
+        node = self.find_node(word)
+        if node is None or self.value_ids[node] == NO_VALUE:
+            return default
+        return self.values[self.value_ids[node]]
+
+    def iter_items(self, node=ROOT, prefix=""):
+        """Yields (keyword, value) pairs for all keywords below `node`"""
+        values = self.values
+        for term, vid in self.iter_value_ids(node, prefix):
+            yield term, values[vid]
+
+    def iter_value_ids(self, node=ROOT, prefix=""):
+        """Yields (keyword, index into `values`) pairs for all keywords below `node`, no value is decoded"""
+        base, check, value_ids, chars = self.base, self.check, self.value_ids, self.chars
+        stack = [(node, prefix)]
+        while stack:
+            node, term = stack.pop()
+            if value_ids[node] != NO_VALUE:
+                yield term, value_ids[node]
+            offset = base[node]
+            for label in range(len(chars) - 1, 0, -1):
+                child = offset + label
+                if check[child] == node:
+                    stack.append((child, term + chars[label] + self._tail(child)))
+
+    def children(self, node):
+        """Returns the outgoing edges of `node`.
+
+        The index of all edges is built on the first call and kept.
+
+        Returns:
+            dict: first character -> (characters, child). The characters of an edge are
+                the label of the child plus its collapsed chain.
+        """
+        if self._children is None:
+            base, check, chars = self.base, self.check, self.chars
+            index = {}
+            for slot, parent in enumerate(check):
+                if parent != FREE:
+                    char = chars[slot - base[parent]]
+                    index.setdefault(parent, {})[char] = (char + self._tail(slot), slot)
+            self._children = index
+        return self._children.get(node, {})
+
+    def longest_below(self):
+        """Returns the length of the longest keyword in the subtree of every node (cached).
+
+        Returns:
+            array: per node, the length of the longest keyword ending at or below it, -1 if none
+        """
+        if self._longest_below is None:
+            value_ids = self.value_ids
+            longest = array("i", [NO_VALUE]) * len(self.check)
+            order = [(ROOT, 0)]
+            for node, depth in order:
+                for edge, child in self.children(node).values():
+                    order.append((child, depth + len(edge)))
+            for node, depth in reversed(order):
+                length = depth if value_ids[node] != NO_VALUE else NO_VALUE
+                for _, child in self.children(node).values():
+                    if longest[child] > length:
+                        length = longest[child]
+                longest[node] = length
+            self._longest_below = longest
+        return self._longest_below
+
+    def iter_prefix(self, prefix):
+        """Yields (keyword, value) pairs for all keywords starting with `prefix`"""
+        base, check, alphabet, tail_len = self.base, self.check, self.alphabet, self.tail_len
+        node = ROOT
+        path = ""
+        idx = 0
+        prefix_len = len(prefix)
+        while idx < prefix_len:
+            child = base[node] + alphabet[prefix[idx]]
+            if check[child] != node:
+                return
+            node = child
+            path += prefix[idx]
+            idx += 1
+            if tail_len[node]:
+                # the prefix may end inside the collapsed chain
+                tail = self._tail(node)
+                if not tail.startswith(prefix[idx:idx + len(tail)]):
+                    return
+                path += tail
+                idx += len(tail)
+        yield from self.iter_items(node, path)
+
+    def extract_keywords(self, sentence, non_word_boundaries):
+        """Same search as `KeywordProcessor.extract_keywords` on the compiled trie.
+
+        A keyword can only start at the beginning of the sentence or right after a
+        word boundary and must be followed by a word boundary or the end of the
+        sentence. From every start the longest such keyword wins, the search then
+        continues after the character following it. If there is no match, the rest
+        of the word is skipped.
+
+        Args:
+            sentence (str): text to search, already lower cased if the processor is case insensitive
+            non_word_boundaries (set(str)): characters that continue a word
+
+        Returns:
+            list(tuple): (value, start, end) for every keyword found
+        """
+        keywords_extracted = []
+        base, check, value_ids, values = self.base, self.check, self.value_ids, self.values
+        tail_pos, tail_len, tails, alphabet = self.tail_pos, self.tail_len, self.tails, self.alphabet
+        next_boundary = self.boundary_pattern(non_word_boundaries).search
+        word_nodes = self.word_nodes if self.non_word_boundaries == self._boundary_pattern[0] else None
+        sentence_len = len(sentence)
+        start = 0
+        while start < sentence_len:
+            boundary = next_boundary(sentence, start)
+            word_end = boundary.start() if boundary else sentence_len
+            found = -1
+            if word_nodes is not None and word_end > start:
+                # jump over the first word
+                node = word_nodes.get(sentence[start:word_end])
+                if node is None:
+                    if boundary is None:
+                        break
+                    start = word_end + 1
+                    continue
+                idx = word_end
+                if value_ids[node] >= 0:
+                    found = value_ids[node]
+                    found_end = idx
+            else:
+                node = 0
+                idx = start
+            while idx < sentence_len:
+                child = base[node] + alphabet[sentence[idx]]
+                if check[child] != node:
+                    break
+                node = child
+                idx += 1
+                length = tail_len[node]
+                if length:
+                    pos = tail_pos[node]
+                    if not sentence.startswith(tails[pos:pos + length], idx):
+                        break
+                    idx += length
+                if value_ids[node] >= 0 and (idx == sentence_len or sentence[idx] not in non_word_boundaries):
+                    # update longest sequence found
+                    found = value_ids[node]
+                    found_end = idx
+            if found >= 0:
+                value = values[found]
+                # flashtext drops falsy values, unless the keyword is the last word of the sentence
+                if value or (found_end == sentence_len and found_end == word_end):
+                    keywords_extracted.append((value, start, found_end))
+                start = found_end + 1
+            elif boundary is None:
+                break
+            else:
+                # skip to end of word
+                start = word_end + 1
+        return keywords_extracted
+
+    def longest_match(self, sentence, start, non_word_boundaries):
+        """Returns the longest keyword starting at `start` and ending at a word end, as
+        `extract_keywords` finds it from that start.
+
+        Args:
+            sentence (str): text to search, normalized like the keywords
+            start (int): position the keyword starts at
+            non_word_boundaries (set(str)): characters that continue a word
+
+        Returns:
+            tuple: (value, end) of the keyword, None if there is none
+        """
+        base, check, value_ids = self.base, self.check, self.value_ids
+        tail_pos, tail_len, tails, alphabet = self.tail_pos, self.tail_len, self.tails, self.alphabet
+        sentence_len = len(sentence)
+        found = -1
+        node = 0
+        idx = start
+        while idx < sentence_len:
+            child = base[node] + alphabet[sentence[idx]]
+            if check[child] != node:
+                break
+            node = child
+            idx += 1
+            length = tail_len[node]
+            if length:
+                pos = tail_pos[node]
+                if not sentence.startswith(tails[pos:pos + length], idx):
+                    break
+                idx += length
+            if value_ids[node] >= 0 and (idx == sentence_len or sentence[idx] not in non_word_boundaries):
+                found = value_ids[node]
+                found_end = idx
+        if found < 0:
+            return None
+        return self.values[found], found_end
+
+    def boundary_pattern(self, non_word_boundaries):
+        """Returns a compiled pattern that finds the next word boundary character"""
+        key = frozenset(non_word_boundaries)
+        cached = self._boundary_pattern
+        if cached is None or cached[0] != key:
+            if key:
+                pattern = re.compile("[^%s]" % "".join(re.escape(char) for char in sorted(key)))
+            else:
+                pattern = re.compile(".", re.S)
+            cached = self._boundary_pattern = (key, pattern)
+        return cached[1]
@@ -0,0 +1,186 @@
+from pipeline._frozen_trie import ROOT
+
+
+#################
+# Bounded edit distance (Levenshtein) search over the compiled keyword trie.
+#
+# From every word start of the sentence the trie is walked depth first while
+# one row of the edit distance matrix between the path of the node and the
+# text after the word start is carried along:
+#
+#     row[j] = edit distance between the path and sentence[start:start + j]
+#
+# Only the band of +-k cells around the diagonal can stay within k edits, so
+# a row only keeps that band (cell j of a path of length d at position
+# j - d + k + 1, with one always exceeded cell on either side). A row costs
+# O(k) and a subtree is dropped as soon as every cell of its row exceeds k.
+# The work per word start therefore depends on the part of the trie that is
+# reachable within k edits, not on the number of keywords.
+#################
+
+
+class EditBudget(object):
+    """Number of edits allowed for a keyword, depending on its length.
+
+    Attributes:
+        thresholds (list(tuple)): (minimal keyword length, edits) sorted by length
+        max (int): largest number of edits of any keyword length
+    """
+
+    def __init__(self, max_edits):
+        """
+        Args:
+            max_edits (dict|int): minimal keyword length -> edits allowed, e.g. {4: 1, 8: 2} allows
+                one edit for keywords of 4 to 7 characters and two from 8 characters on.
+                Keys may be strings (as in json). A single int applies to every keyword length.
+
+        Raises:
+            ValueError: If lengths or edits are negative
+        """
+        if isinstance(max_edits, int):
+            max_edits = {0: max_edits}
+        thresholds = sorted((int(length), int(edits)) for length, edits in max_edits.items())
+        if any(length < 0 or edits < 0 for length, edits in thresholds):
+            raise ValueError(f"Keyword lengths and edits must not be negative: {max_edits}")
+        self.thresholds = thresholds
+        self.max = max((edits for _, edits in thresholds), default=0)
+
+    def __call__(self, length):
+        allowed = 0
+        for min_length, edits in self.thresholds:
+            if length < min_length:
+                break
+            allowed = edits
+        return allowed
+
+
+def extract_keywords_fuzzy(trie, sentence, non_word_boundaries, budget):
+    """Searches the sentence for keywords within the edit budget.
+
+    Keywords start at word starts and end at word ends, like for the exact search.
+    From each start the longest match wins (fewer edits break ties), the search
+    continues after the character following it. A match needs fewer edits than
+    the keyword has characters, otherwise any short word would match it.
+
+    Args:
+        trie (FrozenTrie): compiled keyword trie
+        sentence (str): text to search, already normalized like the keywords
+        non_word_boundaries (set(str)): characters that continue a word
+        budget (EditBudget): allowed edits per keyword length
+
+    Returns:
+        list(tuple): (value, start, end, edits, keyword length) for every keyword found
+    """
+    keywords_extracted = []
+    # edits allowed per keyword length, and so per subtree by the longest keyword in it
+    allowed = [budget(length) for length in range(trie.max_keyword_len + 1)]
+    max_edits = max(allowed, default=0)
+    next_boundary = trie.boundary_pattern(non_word_boundaries).search
+    sentence_len = len(sentence)
+    start = 0
+    while start < sentence_len:
+        found = _best_match(trie, sentence, start, non_word_boundaries, allowed, max_edits)
+        if found is not None:
+            end, edits, value, length = found
+            # flashtext drops falsy values
+            if value:
+                keywords_extracted.append((value, start, end, edits, length))
+            start = end + 1
+            continue
+        boundary = next_boundary(sentence, start)
+        if boundary is None:
+            break
+        # skip to end of word
+        start = boundary.start() + 1
+    return keywords_extracted
+
+
+def _best_match(trie, sentence, start, non_word_boundaries, allowed, max_edits):
+    """Returns (end, edits, value, keyword length) of the longest keyword starting at `start` or None"""
+    sentence_len = len(sentence)
+    text_len = min(sentence_len - start, trie.max_keyword_len + max_edits)
+    text = sentence[start:start + text_len]
+    # text lengths that end at a word end. An inexact match also has to start and end with a
+    # word character, otherwise an inserted boundary character would make a longer match.
+    starts_word = text[:1] in non_word_boundaries
+    word_ends = [
+        (j, starts_word and text[j - 1] in non_word_boundaries)
+        for j in range(1, text_len + 1)
+        if start + j == sentence_len or sentence[start + j] not in non_word_boundaries
+    ]
+    if not word_ends:
+        return None
+    value_ids, values, longest_below = trie.value_ids, trie.values, trie.longest_below()
+    cap = max_edits + 1
+    # band of the root row, cells j = -max_edits - 1 .. max_edits + 1
+    width = 2 * max_edits + 3
+    row = [cap] * width
+    for j in range(min(max_edits, text_len) + 1):
+        row[j + max_edits + 1] = j
+    best = None
+    stack = [(ROOT, row, 0, 0)]
+    while stack:
+        node, row, depth, smallest = stack.pop()
+        limit = allowed[longest_below[node]]
+        edges = trie.children(node)
+        if smallest == limit:
+            # no edits left, only children continuing the text where the budget is reached can match
+            first = depth - max_edits if depth > max_edits else 0
+            last = depth + max_edits if depth + max_edits < text_len else text_len - 1
+            edges = [
+                edges[char]
+                for char in {text[j] for j in range(first, last + 1) if row[j - depth + max_edits + 1] == limit}
+                if char in edges
+            ]
+        else:
+            edges = edges.values()
+        for edge, child in edges:
+            limit = allowed[longest_below[child]]
+            child_row = row
+            child_depth = depth
+            for char in edge:
+                child_depth += 1
+                low = child_depth - max_edits if child_depth > max_edits else 1
+                high = child_depth + max_edits if child_depth + max_edits < text_len else text_len
+                if low > high:
+                    child_row = None
+                    break
+                # position of cell j in the band of the new row, the one of the previous row is one more
+                shift = max_edits + 1 - child_depth
+                prev, child_row = child_row, [cap] * width
+                smallest = cap
+                if child_depth <= max_edits:
+                    child_row[shift] = smallest = child_depth
+                for j in range(low, high + 1):
+                    i = j + shift
+                    cost = prev[i] + (text[j - 1] != char)
+                    deletion = prev[i + 1] + 1
+                    if deletion < cost:
+                        cost = deletion
+                    insertion = child_row[i - 1] + 1
+                    if insertion < cost:
+                        cost = insertion
+                    if cost > cap:
+                        cost = cap
+                    child_row[i] = cost
+                    if cost < smallest:
+                        smallest = cost
+                if smallest > limit:
+                    child_row = None
+                    break
+            if child_row is None:
+                continue
+            if value_ids[child] >= 0:
+                shift = max_edits + 1 - child_depth
+                for j, word_char in word_ends:
+                    if not 0 <= j + shift < width:
+                        continue
+                    edits = child_row[j + shift]
+                    if edits > allowed[child_depth] or edits >= child_depth or (edits and not word_char):
+                        continue
+                    if best is None or j > best[0] or (j == best[0] and edits < best[1]):
+                        best = (j, edits, values[value_ids[child]], child_depth)
+            stack.append((child, child_row, child_depth, smallest))
+    if best is None:
+        return None
+    return start + best[0], best[1], best[2], best[3]
@@ -0,0 +1,276 @@
+import copy
+import logging
+import re
+import time
+
+from pipeline._dawg import Dawg
+
+
+#################
+# Interchangeable matcher backends for the keywords of a KeywordProcessor.
+#
+# All backends return the same (value, start, end) tuples as
+# `KeywordProcessor.extract_keywords(sentence, span_info=True)`, they only
+# differ in the data structure that is searched:
+#
+#   dict_trie          the nested dict trie of flashtext
+#   frozen_trie        the compiled double-array trie (or Aho-Corasick automaton)
+#   dawg               the minimized automaton, common suffixes are shared as well
+#   regex_alternation  one regular expression, the trie written as nested alternations
+#   token_trie         a trie keyed on the words of the tokenizer output, messages
+#                      whose tokens are not the words of the text are searched
+#                      by characters
+#
+# Which one is fastest depends on the number and length of the keywords and
+# on the messages, `select_matcher` measures it on a sample. It still compares
+# the results with the keyword processor and skips a backend that differs.
+#################
+
+logger = logging.getLogger(__name__)
+
+DICT_TRIE = "dict_trie"
+FROZEN_TRIE = "frozen_trie"
+DAWG = "dawg"
+REGEX_ALTERNATION = "regex_alternation"
+TOKEN_TRIE = "token_trie"
+
+
+class Matcher(object):
+    """Searches messages for the keywords of a `KeywordProcessor`.
+
+    Attributes:
+        name (str): name of the backend, the `matcher` setting that selects it
+    """
+
+    name = None
+
+    def __init__(self, keyword_processor):
+        """
+        Args:
+            keyword_processor (KeywordProcessor): processor with the keywords, it is not changed
+        """
+        self.keyword_processor = keyword_processor
+
+    def extract_keywords(self, text, tokens=None):
+        """Finds the keywords in a message.
+
+        Args:
+            text (str): the message text
+            tokens (list): tokens of `text` with `start` and `end`, only used by backends working on tokens
+
+        Returns:
+            list(tuple): (value, start, end) for every keyword found
+        """
+        return self.keyword_processor.extract_keywords(text, span_info=True)
+
+
+class DictTrieMatcher(Matcher):
+    """Searches the nested dict trie, no compile step at all"""
+
+    name = DICT_TRIE
+
+    def __init__(self, keyword_processor):
+        # a copy shares the (immutable) snapshot with the original processor,
+        # unfreezing it only rebuilds the dict trie if the original is frozen
+        keyword_processor = copy.copy(keyword_processor)
+        keyword_processor.aho_corasick = keyword_processor.dawg = False
+        keyword_processor.unfreeze()
+        super().__init__(keyword_processor)
+
+
+class FrozenTrieMatcher(Matcher):
+    """Searches the compiled trie, in aho_corasick mode the automaton"""
+
+    name = FROZEN_TRIE
+
+    def __init__(self, keyword_processor):
+        if not keyword_processor.is_frozen or keyword_processor.dawg:
+            keyword_processor = copy.copy(keyword_processor)
+            keyword_processor.unfreeze()
+            keyword_processor.dawg = False
+            keyword_processor.freeze()
+        super().__init__(keyword_processor)
+
+
+class DawgMatcher(Matcher):
+    """Searches the minimized automaton, built in one pass over the sorted keywords"""
+
+    name = DAWG
+
+    def __init__(self, keyword_processor):
+        if not keyword_processor.dawg:
+            keywords = sorted(keyword_processor.iter_keywords())
+            keyword_processor = copy.copy(keyword_processor)
+            keyword_processor.aho_corasick = False
+            keyword_processor.set_frozen(Dawg.from_sorted_items(keywords))
+        super().__init__(keyword_processor)
+
+
+class RegexAlternationMatcher(Matcher):
+    """Searches with one regular expression.
+
+    The keywords are written as nested alternations along their common prefixes,
+    e.g. "new", "new york", "newark" become ``new(?:\\ york(?![nwb])|ark(?![nwb])|(?![nwb]))``.
+    Longer continuations come first, so the first match is the longest keyword that
+    is followed by a word boundary, like for the trie search.
+    """
+
+    name = REGEX_ALTERNATION
+
+    def __init__(self, keyword_processor):
+        super().__init__(keyword_processor)
+        non_word_boundaries = keyword_processor.non_word_boundaries
+        self._values = dict(keyword_processor.iter_keywords())
+        if non_word_boundaries:
+            word_char = "[%s]" % "".join(re.escape(char) for char in sorted(non_word_boundaries))
+            self._next_boundary = re.compile("[^%s]" % word_char[1:-1]).search
+        else:
+            word_char = "(?s:.)"
+            self._next_boundary = re.compile(".", re.S).search
+        self._pattern = re.compile(self._alternation(self._values, "(?!%s)" % word_char))
+
+    @staticmethod
+    def _alternation(keywords, end):
+        """Writes the keywords as nested alternations, `end` is appended to every keyword"""
+        # character trie of the keywords, None marks the end of a keyword
+        root = {}
+        for keyword in keywords:
+            node = root
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[None] = True
+
+        def pattern(node):
+            branches = []
+            for char, child in node.items():
+                if char is None:
+                    continue
+                # single child chains become one literal
+                chain = char
+                while len(child) == 1 and None not in child:
+                    (char, child), = child.items()
+                    chain += char
+                branches.append(re.escape(chain) + pattern(child))
+            # ending here is the last choice, after all longer keywords
+            if None in node:
+                branches.append(end)
+            if len(branches) == 1:
+                return branches[0]
+            return "(?:%s)" % "|".join(branches)
+
+        if not root:
+            # matches nothing
+            return "(?!)"
+        return pattern(root)
+
+    def extract_keywords(self, text, tokens=None):
+        if not text:
+            return []
+        keyword_processor = self.keyword_processor
+        sentence, offsets = keyword_processor._normalize_sentence(text)
+        match_keyword, next_boundary, values = self._pattern.match, self._next_boundary, self._values
+        keywords_extracted = []
+        sentence_len = len(sentence)
+        start = 0
+        while start < sentence_len:
+            boundary = next_boundary(sentence, start)
+            word_end = boundary.start() if boundary else sentence_len
+            match = match_keyword(sentence, start)
+            if match is not None:
+                end = match.end()
+                value = values[match.group()]
+                # flashtext drops falsy values, unless the keyword is the last word of the sentence
+                if value or (end == sentence_len and end == word_end):
+                    keywords_extracted.append((value, start, end))
+                start = end + 1
+            elif boundary is None:
+                break
+            else:
+                # skip to end of word
+                start = word_end + 1
+        return keyword_processor._spans_result(keywords_extracted, offsets, True)
+
+
+class TokenTrieMatcher(Matcher):
+    """Searches the words of the tokens. Messages without tokens, or with tokens that are not
+    the words of the text, are searched character by character."""
+
+    name = TOKEN_TRIE
+
+    def __init__(self, keyword_processor):
+        super().__init__(keyword_processor)
+        self._token_trie = keyword_processor.build_token_trie()
+        if self._token_trie.unsupported:
+            logger.warning(
+                f"{self._token_trie.unsupported} keywords have no word characters and can not be found "
+                f"through tokens, all messages are searched character by character"
+            )
+
+    def extract_keywords(self, text, tokens=None):
+        if not tokens or self._token_trie.unsupported:
+            return super().extract_keywords(text)
+        keywords_extracted = self._token_trie.extract_keywords(text, tokens)
+        if keywords_extracted is None:
+            # the tokenizer split inside a word or left one out
+            return super().extract_keywords(text)
+        return keywords_extracted
+
+
+MATCHERS = {
+    matcher.name: matcher
+    for matcher in (DictTrieMatcher, FrozenTrieMatcher, DawgMatcher, RegexAlternationMatcher, TokenTrieMatcher)
+}
+
+
+def create_matcher(name, keyword_processor):
+    """Builds the matcher backend `name` for the keywords of `keyword_processor`.
+
+    Raises:
+        ValueError: If there is no backend of that name
+    """
+    if name not in MATCHERS:
+        raise ValueError(f"Unknown matcher '{name}', use any of {list(MATCHERS)}")
+    return MATCHERS[name](keyword_processor)
+
+
+def select_matcher(keyword_processor, messages, names=None, repeat=3):
+    """Benchmarks the matcher backends on sample messages and returns the fastest.
+
+    Backends that do not find exactly the same keywords as
+    `KeywordProcessor.extract_keywords` on every sample message are not considered.
+
+    Args:
+        keyword_processor (KeywordProcessor): processor with the keywords
+        messages (list(tuple)): (text, tokens) of the sample messages, tokens may be None
+        names (list(str)): backends to compare.
+            Defaults to all
+        repeat (int): runs per backend, the fastest run counts
+
+    Returns:
+        tuple: (fastest matcher, {name: seconds per run} of every backend that was measured).
+            If every backend differs, a frozen_trie matcher without timing.
+    """
+    expected = [keyword_processor.extract_keywords(text, span_info=True) for text, _ in messages]
+    fastest = None
+    timings = {}
+    for name in MATCHERS if names is None else names:
+        start = time.perf_counter()
+        matcher = create_matcher(name, keyword_processor)
+        build_time = time.perf_counter() - start
+        if [matcher.extract_keywords(text, tokens) for text, tokens in messages] != expected:
+            logger.warning(f"Matcher {name} differs from the keyword processor on the sample, skipped")
+            continue
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for text, tokens in messages:
+                matcher.extract_keywords(text, tokens)
+            runs.append(time.perf_counter() - start)
+        timings[name] = min(runs)
+        logger.debug(f"Matcher {name}: built in {build_time:.3f}s, {timings[name]:.4f}s per run")
+        if fastest is None or timings[name] < timings[fastest.name]:
+            fastest = matcher
+    if fastest is None:
+        logger.warning(f"No matcher finds the keywords of the keyword processor on the sample, using {FROZEN_TRIE}")
+        fastest = create_matcher(FROZEN_TRIE, keyword_processor)
+    return fastest, timings
@@ -0,0 +1,102 @@
+#################
+# Span preserving text normalization for the keyword matcher.
+#
+# Keywords and messages are normalized the same way, so spelling variants
+# such as "Köln"/"Koeln" or "Straße"/"Strasse" end up as one trie path.
+# Normalization may change the length of the text ("ö" -> "oe"), so an
+# offset map from the normalized text back into the original text is
+# returned whenever that happens.
+#################
+
+CASEFOLD = "casefold"
+UMLAUTS = "umlauts"
+ESZETT = "eszett"
+
+NORMALIZATION_STEPS = (CASEFOLD, UMLAUTS, ESZETT)
+
+_UMLAUTS = {"ä": "ae", "ö": "oe", "ü": "ue", "Ä": "Ae", "Ö": "Oe", "Ü": "Ue"}
+_ESZETT = {"ß": "ss", "ẞ": "SS"}
+
+
+class _FoldTable(dict):
+    """str.translate table that computes and caches the replacement of each character on first use"""
+
+    def __init__(self, fold):
+        super().__init__()
+        self._fold = fold
+
+    def __missing__(self, key):
+        replacement = self[key] = self._fold(chr(key))
+        return replacement
+
+
+class TextNormalizer(object):
+    """Normalizes texts character by character and keeps track of the original offsets.
+
+    Attributes:
+        steps (list(str)): applied steps, in this order: casefold, umlauts (ä -> ae, ...), eszett (ß -> ss)
+    """
+
+    def __init__(self, steps):
+        """
+        Args:
+            steps (list(str)): normalization steps to apply, any of `NORMALIZATION_STEPS`
+
+        Raises:
+            ValueError: If an unknown step is given
+        """
+        unknown = [step for step in steps if step not in NORMALIZATION_STEPS]
+        if unknown:
+            raise ValueError(f"Unknown normalization step(s) {unknown}, use any of {list(NORMALIZATION_STEPS)}")
+        self.steps = [step for step in NORMALIZATION_STEPS if step in steps]
+        self._table = _FoldTable(self.fold)
+
+    def __eq__(self, other):
+        return isinstance(other, TextNormalizer) and self.steps == other.steps
+
+    def __getstate__(self):
+        return {"steps": self.steps}
+
+    def __setstate__(self, state):
+        self.__init__(state["steps"])
+
+    def fold(self, char):
+        """Returns the normalized form of a single character"""
+        if CASEFOLD in self.steps:
+            char = char.casefold()
+        if UMLAUTS in self.steps:
+            char = "".join(_UMLAUTS.get(c, c) for c in char)
+        if ESZETT in self.steps:
+            char = "".join(_ESZETT.get(c, c) for c in char)
+        return char
+
+    def __call__(self, text):
+        """Returns the normalized text"""
+        return text.translate(self._table)
+
+    def normalize(self, text):
+        """Normalizes `text` and maps the normalized positions back.
+
+        Args:
+            text (str): text to normalize
+
+        Returns:
+            tuple: (normalized text, offsets). offsets[i] is the position in `text` of the character
+                the i-th normalized character was created from. offsets is None if no character
+                changed its length, positions are the same in both texts then.
+        """
+        normalized = text.translate(self._table)
+        if len(normalized) == len(text):
+            return normalized, None
+        table = self._table
+        offsets = []
+        for idx, char in enumerate(text):
+            offsets.extend([idx] * len(table[ord(char)]))
+        return normalized, offsets
+
+    @staticmethod
+    def original_span(offsets, start, end):
+        """Maps the span [start, end) of the normalized text to the original text"""
+        if offsets is None:
+            return start, end
+        return offsets[start], offsets[end - 1] + 1
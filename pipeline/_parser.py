@@ -1,4 +1,6 @@
-from typing import Any, Dict, List, Text, Union
+import itertools
+import json
+from typing import Any, Dict, Iterator, List, Optional, Text, Union
 from rasa.shared.utils.io import read_yaml_file
 from rasa.shared.utils.validation import validate_yaml_schema
 import re
@@ -20,13 +22,22 @@ ANY_SOURCE_ENTITY_KEY = "_ANY_"
 logger = logging.getLogger(__file__)
 
 
-def _walkthrough(dict_of_lists: dict) -> list:
-    """List generator for GridSearch-like parameter searches
-    Given a dict of lists it returns a list of dicts.
+def _crossmul(dict_of_lists: dict) -> int:
+    """Number of combinations `_walkthrough` yields for dict_of_lists, without creating them"""
+    res = 1
+    for value in dict_of_lists.values():
+        if isinstance(value, list):
+            res *= len(value)
+    return res
 
 
-    >>>walkthrough({'a':[1],'b':5, 'c':[3,6],'d':[1,2,3,4]})
-    [1] Iterating 8 item combinations
+def _walkthrough(dict_of_lists: dict) -> Iterator[dict]:
+    """Generator for GridSearch-like parameter searches
+    Given a dict of lists it yields one dict per combination, the last key changes fastest.
+    Only the current combination is kept in memory.
+
+
+    >>>list(_walkthrough({'a':[1],'b':5, 'c':[3,6],'d':[1,2,3,4]}))
         [{'a': 1, 'b': 5, 'c': 3, 'd': 1},
         {'a': 1, 'b': 5, 'c': 3, 'd': 2},
         {'a': 1, 'b': 5, 'c': 3, 'd': 3},
@@ -39,48 +50,103 @@ def _walkthrough(dict_of_lists: dict) -> list:
     Args:
         dict_of_lists (dict): The dictionary with lists as values. (Scalars will be converted)
 
+    Yields:
+        dict: For each dict another combination from the lists of the original dict is used.
+    """
+    keys = list(dict_of_lists)
+    # avoid single items breaking the tool
+    values = [v if isinstance(v, list) else [v] for v in dict_of_lists.values()]
+    for combination in itertools.product(*values):
+        yield dict(zip(keys, combination))
+
+
+def dependencies(data: Dict[str, list]) -> Dict[str, List[str]]:
+    """Returns the keys each key of a top-down hierarchy takes examples from through its
+    'ref' and 'composite' examples, in the order they are mentioned.
+
+    Args:
+        data (Dict[str,dict]): top down hierarchy loaded from file(s)
+
     Returns:
-        list: A list of dictionaries. For each dict another combination from the lists of the original dict is used.
+        Dict[str, List[str]]: key -> keys it refers to directly
     """
+    result = {}
+    for key, e_data_lst in data.items():
+        refs = []
+        for e_dict in e_data_lst or []:
+            if not isinstance(e_dict, dict):
+                continue
+            for example in e_dict.get(EXAMPLES) or []:
+                if example.get(EXAMPLE_REF):
+                    refs.append(example[EXAMPLE_REF])
+                if example.get(EXAMPLE_COMPOSITE):
+                    refs.extend(re.findall(r"{(.*?)}", example[EXAMPLE_COMPOSITE]))
+        result[key] = list(dict.fromkeys(refs))
+    return result
+
+
+def build_value_table(hierarchy: dict) -> dict:
+    """Interns the entity dicts of a bottom up hierarchy: equal dicts are stored once in
+    "values" and keywords refer to them by their index. Alternative spellings are resolved
+    to the index of the text they are an alternative of, so a hit needs no second lookup.
+
+    Args:
+        hierarchy (dict): bottom up hierarchy with text -> {entity: value} under "entities"
+            and alternative spelling -> text under "alternatives"
+
+    Returns:
+        dict: the hierarchy with "values" (list of {entity: value}), "entities" (text -> index)
+            and "alternatives" (alternative spelling -> index)
+    """
+    values: List[dict] = []
+    # serialized with the key order, dicts differing in it create their entities in another order
+    index: Dict[str, int] = {}
+
+    def intern(value: dict) -> int:
+        key = json.dumps(value)
+        if key not in index:
+            index[key] = len(values)
+            values.append(value)
+        return index[key]
 
-    def crossmul(dic_of_lists: dict) -> int:
-        res = 1
-        for tup in dic_of_lists.items():
-            if isinstance(tup[1], list):
-                res *= len(tup[1])
-        return res
-
-    def __iterate(the_list: list, __cur=[]):
-        __debug = False
-
-        def _print(*args, **kwargs):
-            if __debug:
-                print(*args, **kwargs)
-
-        par = the_list[0][0]
-        _print(__cur)  # , end=',')
-        pvm = []
-        if not isinstance(the_list[0][1], list):  # avoid single items breaking th e tool
-            the_list[0][1] = [the_list[0][1]]
-
-        if len(the_list) > 1:  # there are more parameters to come
-            for pv in the_list[0][1]:
-                pvm.extend(__iterate(the_list[1:], __cur + [(par, pv)]))  # go through the others
-        else:
-            # lowest level
-            for pv in the_list[0][1]:
-                _print("cur= ", __cur)
-                _print("appending", __cur + [(par, pv)])
-                pvm.append(__cur + [(par, pv)])
-        _print("returning", pvm)
-        return pvm
-
-    # logger.debug(f"Iterating {crossmul(dict_of_lists)} item combinations")
-    tups = [[k, v] for (k, v) in dict_of_lists.items()]
-    return [dict(a) for a in __iterate(tups)]
-
-
-def topdownparser(data: Dict[str, list]) -> dict:
+    entities = {text: intern(targets) for text, targets in hierarchy["entities"].items()}
+    # like their text, alternatives of a text without entities (of a _NO_ENTITY_ key) are no keywords
+    alternatives = {
+        alternative: entities[text] for alternative, text in hierarchy["alternatives"].items() if text in entities
+    }
+    return {**hierarchy, "values": values, "entities": entities, "alternatives": alternatives}
+
+
+def merge_hierarchies(parts: List[dict]) -> dict:
+    """Merges the results of topdownparser calls for disjoint `targets` into the result of
+    a single call for all of them, parts are taken in the order of the targets.
+
+    Args:
+        parts (List[dict]): results of topdownparser
+
+    Returns:
+        dict: bottom up hierarchy
+    """
+    merged: Dict[str, dict] = {"entities": {}, "alternatives": {}}
+    for part in parts:
+        for key in ("entities", "composites"):
+            if key in part:
+                mapping = merged.setdefault(key, {})
+                for text, targets in part[key].items():
+                    mapping.setdefault(text, {}).update(targets)
+        merged["alternatives"].update(part["alternatives"])
+        if "vocabularies" in part:
+            merged.setdefault("vocabularies", {}).update(part["vocabularies"])
+    return build_value_table(merged)
+
+
+def topdownparser(
+    data: Dict[str, list],
+    lazy_composites: bool = False,
+    max_composite_expansions: Optional[int] = None,
+    targets: Optional[List[str]] = None,
+    composite_sizes: Optional[Dict[str, int]] = None,
+) -> dict:
     """Parses a top-down type entity hierarchy dictionary.
     The format is 
     ```
@@ -96,12 +162,46 @@ def topdownparser(data: Dict[str, list]) -> dict:
 
     Args:
         data (Dict[str,dict]): top down hierarchy loaded from file(s)
+        lazy_composites (bool): keep composites as patterns instead of expanding them into
+            every combination of their placeholder texts. They are returned under "composites"
+            (composite text -> {entity: value}, None stands for the text the composite matched)
+            with the texts of each placeholder under "vocabularies". Composites nested in a
+            placeholder are still expanded into its vocabulary.
+        max_composite_expansions (int): largest number of texts a single composite may expand to,
+            checked before it is expanded. None for no limit.
+        targets (List[str]): the keys to create the result for, all other keys only provide
+            examples. None for all keys of data. The result for some targets is not interned
+            with build_value_table, its alternatives may belong to texts of other keys:
+            merge_hierarchies interns the merged results.
+        composite_sizes (Dict[str, int]): if given, filled with composite text -> number of
+            texts it expands to, also for composites kept as patterns
 
     Returns:
-        dict: bottom up hierarchy for fast replacements of values
+        dict: bottom up hierarchy for fast replacements of values, see build_value_table
+
+    Raises:
+        ValueError: If `ref` or `composite` examples refer to each other in a cycle, or a
+            composite would expand to more than max_composite_expansions texts
     """
     target_mapping = {}
     alternatives_mapping = {}
+    composites_mapping = {}
+    # keys marked with _NO_ENTITY_ only provide examples to others, the marker is
+    # taken out up front so the result does not depend on the order of the keys
+    no_entity = {key for key, e_data_lst in data.items() if DONT_CREATE_ENTITY in e_data_lst}
+    data = {key: [e_dict for e_dict in e_data_lst if e_dict != DONT_CREATE_ENTITY] for key, e_data_lst in data.items()}
+    # every keyword and composite is expanded once, the results are shared and must not be changed
+    collected: Dict[str, List[str]] = {}
+    composed: Dict[str, List[str]] = {}
+    resolved: Dict[str, tuple] = {}
+    # keywords currently expanded, to report a cycle with its full path
+    collecting: List[str] = []
+    resolving: List[str] = []
+
+    def check_cycle(path: List[str], keyword: str) -> None:
+        if keyword in path:
+            cycle = path[path.index(keyword) :] + [keyword]
+            raise ValueError(f"Cycle in entity hierarchy: {' -> '.join(cycle)}")
 
     def create_text_entry(
         ent_source_value: Text,
@@ -119,6 +219,7 @@ def topdownparser(data: Dict[str, list]) -> dict:
         """Returns example texts as list of strings, starting with the given keyword.
         Local target values are ignored.
         'ref' and 'composite' references are followed recursively.
+        The list is computed once per keyword, repeated texts are only kept once.
 
         Args:
             keyword (str): The entity value to look for examples
@@ -126,6 +227,10 @@ def topdownparser(data: Dict[str, list]) -> dict:
         Returns:
             List[str]: A list of strings, containing each text example found under keyword.
         """
+        if keyword in collected:
+            return collected[keyword]
+        check_cycle(collecting, keyword)
+        collecting.append(keyword)
         # collect all strings from the examples as list
         # if example is ref, include those as well
         # if example is composite, recurse
@@ -147,6 +252,8 @@ def topdownparser(data: Dict[str, list]) -> dict:
                 comp = empl.get(EXAMPLE_COMPOSITE)
                 if comp:
                     results.extend(process_composite(comp))
+        collecting.pop()
+        results = collected[keyword] = list(dict.fromkeys(results))
         return results
 
     def process_composite(composite_text: str) -> List[str]:
@@ -154,7 +261,7 @@ def topdownparser(data: Dict[str, list]) -> dict:
         f-string-like text, such as "{handy}-vertrag". It will look for the 
         handy-keyword and return all the text examples below, plus following
         all the 'ref' examples, plus also recursively resolving all other
-        'composite' examples themselves.
+        'composite' examples themselves. The list is computed once per text.
 
         Args:
             composite_text (str): f-string-like text, such as "static {reference}"
@@ -162,6 +269,8 @@ def topdownparser(data: Dict[str, list]) -> dict:
         Returns:
             List[str]: List of composed text strings with all placeholders replaced
         """
+        if composite_text in composed:
+            return composed[composite_text]
         # take one f-string and return a list of populated strings
         compounds = re.findall(r"{(.*?)}", composite_text)
         # logger.debug(compounds)
@@ -169,72 +278,103 @@ def topdownparser(data: Dict[str, list]) -> dict:
         # collect the lists of replacements
         for placeholder in compounds:
             replacers[placeholder] = collect_composite(placeholder)
+        expansions = _crossmul(replacers)
+        if max_composite_expansions is not None and expansions > max_composite_expansions:
+            raise ValueError(
+                f"Composite '{composite_text}' expands to {expansions} texts "
+                f"({' x '.join(str(len(v)) for v in replacers.values())}), "
+                f"more than max_composite_expansions={max_composite_expansions}"
+            )
+        logger.debug(f"Iterating {expansions} item combinations of '{composite_text}'")
+        if composite_sizes is not None:
+            composite_sizes[composite_text] = expansions
         # iterate the combinations
-        results = []
-        for one_combination in _walkthrough(replacers):
-            # logger.debug(composite_text.format(**one_combination))
-            results.append(composite_text.format(**one_combination))
+        results = [composite_text.format(**one_combination) for one_combination in _walkthrough(replacers)]
+        composed[composite_text] = results
         return results
 
-    def parse_one(
-        target_entity: Union[str, None], e_data_lst: list, parent_target_value: Any = None
-    ):
-        # logger.debug(f"\nentity {target_entity}")
-        # logger.debug(f"list {e_data_lst}")
-        if DONT_CREATE_ENTITY in e_data_lst:
-            target_entity = None
-            e_data_lst.remove(DONT_CREATE_ENTITY)
-        for e_dict in e_data_lst:
-            # if it is a string ignor ethe entry
-            # logger.debug(f"dict {e_dict}")
+    def resolve(keyword: str) -> tuple:
+        """Returns the target values of the texts and the alternative spellings the
+        examples of keyword create, following 'ref' examples recursively.
+        Computed once per keyword: a target value given by the referring example
+        replaces all values below it, so it is applied by the caller.
+
+        Args:
+            keyword (str): The entity whose examples are resolved
+
+        Returns:
+            tuple: (text -> target value, alternative spelling -> text, composite text -> target
+                value), later examples override earlier ones like repeated create_text_entry calls do.
+                Composites are only returned with lazy_composites, a target value of None stands
+                for the text matched.
+        """
+        if keyword in resolved:
+            return resolved[keyword]
+        check_cycle(resolving, keyword)
+        resolving.append(keyword)
+        entries = {}
+        alternatives = {}
+        composites = {}
+        for e_dict in data[keyword]:
             # the dictionary is supposed to have up to three keys:
             # value (optional) - string
             # entities_only (optional) - list
             # examples - list
 
-            targ_val = parent_target_value or e_dict.get(TARGET_VALUE_KEY)
-
-            # for ent_restriction in ent_restriction_list:
+            targ_val = e_dict.get(TARGET_VALUE_KEY)
 
             for example in e_dict.get(EXAMPLES) or []:
-                # if text
-                # logger.debug(f"example {example}")
                 text = example.get(EXAMPLE_TEXT)
                 ref = example.get(EXAMPLE_REF)
                 composite: str = example.get(EXAMPLE_COMPOSITE)
 
                 if text:
-                    # logger.debug(
-                    #     f"create_text_entry(ent_source_value={text},ent_target={target_entity},val_target={targ_val or text},)"
-                    # )
-                    create_text_entry(
-                        ent_source_value=text, ent_target=target_entity, val_target=targ_val or text
-                    )
+                    entries[text] = targ_val or text
                     alts = example.get(EXAMPLE_TEXT_ALT_SPELLING, [])  # alternative spellings
                     for alternative in alts:
-                        alternatives_mapping.update({alternative: text})
+                        alternatives[alternative] = text
 
                 if ref:
-                    parse_one(
-                        target_entity=target_entity,
-                        e_data_lst=data[ref],
-                        parent_target_value=targ_val,
-                    )
-
-                if composite:
+                    ref_entries, ref_alternatives, ref_composites = resolve(ref)
+                    if targ_val:
+                        # the value of the referring example wins
+                        entries.update(dict.fromkeys(ref_entries, targ_val))
+                        composites.update(dict.fromkeys(ref_composites, targ_val))
+                    else:
+                        entries.update(ref_entries)
+                        composites.update(ref_composites)
+                    alternatives.update(ref_alternatives)
+
+                if composite and lazy_composites:
+                    composites[composite] = targ_val or text or None
+                    if composite_sizes is not None:
+                        placeholders = re.findall(r"{(.*?)}", composite)
+                        composite_sizes[composite] = _crossmul({p: collect_composite(p) for p in placeholders})
+                elif composite:
                     # restrictions: composites do only pull all
                     # texts (also recursive) from mentioned
                     # entity-values
-                    cmp_list = process_composite(composite)
-                    for word in cmp_list:
+                    for word in process_composite(composite):
                         # create an entry per returned string
-                        create_text_entry(
-                            ent_source_value=word,
-                            ent_target=target_entity,
-                            val_target=targ_val or text or word,
-                        )
-
-    for target_entity, e_data_lst in data.items():
-        parse_one(target_entity, e_data_lst)
-    return {"entities": target_mapping, "alternatives": alternatives_mapping}
-
+                        entries[word] = targ_val or text or word
+        resolving.pop()
+        resolved[keyword] = (entries, alternatives, composites)
+        return entries, alternatives, composites
+
+    for target_entity in data if targets is None else targets:
+        entries, alternatives, composites = resolve(target_entity)
+        if target_entity not in no_entity:
+            for text, targ_val in entries.items():
+                create_text_entry(ent_source_value=text, ent_target=target_entity, val_target=targ_val)
+            for composite, targ_val in composites.items():
+                composites_mapping.setdefault(composite, {})[target_entity] = targ_val
+        alternatives_mapping.update(alternatives)
+    hierarchy = {"entities": target_mapping, "alternatives": alternatives_mapping}
+    if lazy_composites:
+        hierarchy["composites"] = composites_mapping
+        hierarchy["vocabularies"] = {
+            placeholder: collect_composite(placeholder)
+            for composite in composites_mapping
+            for placeholder in re.findall(r"{(.*?)}", composite)
+        }
+    return hierarchy if targets is not None else build_value_table(hierarchy)
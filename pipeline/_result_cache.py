@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+#################
+# Bounded LRU cache for the entities extracted from a message.
+#
+# Chat traffic repeats the same short messages over and over ("ja", "nein",
+# tariff names), their entities are only extracted once. Entries expire
+# after a time to live, the least recently used entry is dropped when the
+# cache is full.
+#################
+
+_MISSING = object()
+
+
+def _copy(entities):
+    """Copies a list of entity dicts, the dicts are what later components change"""
+    return [dict(entity) for entity in entities]
+
+
+class ResultCache(object):
+    """Thread safe LRU cache of entity lists with an optional time to live.
+
+    The lists and their entity dicts are copied when they are stored and when they
+    are returned, callers can change what they get without changing the cache.
+
+    Attributes:
+        max_size (int): number of entries kept at most
+        ttl (float): seconds an entry is valid, None to keep entries until they are dropped
+        hits (int): number of lookups that found a valid entry
+        misses (int): number of lookups that did not
+        generation (int): number of times the cache was cleared
+    """
+
+    def __init__(self, max_size, ttl=None):
+        """
+        Args:
+            max_size (int): number of entries kept at most
+            ttl (float): seconds an entry is valid.
+                Defaults to None, entries do not expire
+
+        Raises:
+            ValueError: If max_size is not positive
+        """
+        if max_size <= 0:
+            raise ValueError(f"The size of the result cache must be positive, not {max_size}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        # key -> (expiry time, value), the least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Returns a copy of the entities stored for key, default if there is none or it expired"""
+        with self._lock:
+            expires, value = self._entries.get(key, (None, _MISSING))
+            if value is not _MISSING and expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                value = _MISSING
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _copy(value)
+
+    def put(self, key, value, generation=None):
+        """Stores a copy of the entities for key, the least recently used entry is dropped if the cache is full.
+
+        Args:
+            key: the key
+            value (list(dict)): the entities
+            generation (int): the generation the entities were extracted in, they are not stored
+                if the cache was cleared since. Defaults to None, they are stored in any case
+        """
+        value = _copy(value)
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops all entries, e.g. after the keywords changed. The counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    @property
+    def stats(self):
+        """dict: hits, misses and current size"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_size}
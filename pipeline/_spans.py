@@ -0,0 +1,61 @@
+from bisect import bisect_left
+
+
+#################
+# Overlap lookups between entity spans.
+#
+# The spans are sorted by start once, with the running maximum of their ends.
+# The spans overlapping [start, end) all start before end, so they are in
+# front of the bisect position of end. Walking back from there, the walk can
+# stop as soon as the running maximum of the ends is not after start: no
+# span further left reaches into [start, end) either. Building the index is
+# O(n log n), a lookup O(log n) plus the spans it passes.
+#################
+
+KEEP_BOTH = "keep_both"
+PREFER_LONGEST = "prefer_longest"
+PREFER_HIERARCHY = "prefer_hierarchy"
+PREFER_ORIGINAL = "prefer_original"
+
+OVERLAP_POLICIES = (KEEP_BOTH, PREFER_LONGEST, PREFER_HIERARCHY, PREFER_ORIGINAL)
+
+
+class SpanIndex(object):
+    """Finds the spans overlapping a range.
+
+    Attributes:
+        spans (list(tuple)): (start, end, key) sorted by start
+    """
+
+    def __init__(self, spans):
+        """
+        Args:
+            spans (iterable(tuple)): (start, end, key) of the indexed spans, the key is returned
+                by `overlapping`. Spans with a start or end of None are left out.
+        """
+        self.spans = sorted(
+            (span for span in spans if span[0] is not None and span[1] is not None), key=lambda span: span[0]
+        )
+        self._starts = [span[0] for span in self.spans]
+        self._max_ends = []
+        max_end = None
+        for _, end, _ in self.spans:
+            max_end = end if max_end is None or end > max_end else max_end
+            self._max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def overlapping(self, start, end):
+        """Returns the keys of the spans that share at least one character with [start, end)
+
+        Returns:
+            list: keys in descending order of the span starts
+        """
+        keys = []
+        idx = bisect_left(self._starts, end) - 1
+        while idx >= 0 and self._max_ends[idx] > start:
+            if self.spans[idx][1] > start:
+                keys.append(self.spans[idx][2])
+            idx -= 1
+        return keys
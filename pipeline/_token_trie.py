@@ -0,0 +1,219 @@
+import re
+
+
+#################
+# Token level trie for the keywords of a KeywordProcessor.
+#
+# The tokenizer has already split the message into words, so instead of
+# walking the text character by character the trie is keyed on whole
+# tokens: a keyword of three words is three dict lookups.
+#
+# The edge of every token after the first one also holds the characters
+# between it and the previous token, i.e. "new york" is stored as the path
+# "new" -> " york". A message only matches if it has the same separators,
+# exactly like for the character based search.
+#
+# Characters before the first and after the last word of a keyword (the
+# "." of "z.b." or the "++" of "c++") are not part of any token. They are
+# kept with the value in the node of the last word and compared with the
+# text in front of the first and after the last word, the keyword span
+# includes them. Keywords without any word character can not be found
+# through tokens at all, they are counted in `unsupported`.
+#
+# The words of the tokens have to be the words of the text. A tokenizer that
+# splits inside a word (e.g. "iphone12" into "iphone" and "12") or leaves
+# out word characters would hide keywords the character search finds, such
+# messages are reported and have to be searched by characters.
+#################
+
+# key of the values in a node, (lead, trail) -> value. Edges are non-empty strings.
+_VALUE = None
+
+
+class TokenTrie(object):
+    """Trie keyed on normalized tokens.
+
+    Attributes:
+        terms (int): number of keywords
+        unsupported (int): number of keywords without word characters, they were not added
+    """
+
+    def __init__(self, normalize, non_word_boundaries):
+        """
+        Args:
+            normalize (callable): returns (normalized text, offsets) like `TextNormalizer.normalize`,
+                the form the keywords are stored in
+            non_word_boundaries (set(str)): characters that continue a word. Keywords and tokens
+                are split into words at all other characters.
+        """
+        self._normalize = normalize
+        self._word = re.compile("[%s]+" % "".join(re.escape(char) for char in sorted(non_word_boundaries)))
+        self._non_word_boundaries = non_word_boundaries
+        # (character, side) -> whether it continues a word on that side
+        self._continues = {}
+        self._root = {}
+        # characters in front of the first word of any keyword, the longest first
+        self._leads = [""]
+        self.terms = 0
+        self.unsupported = 0
+
+    def __len__(self):
+        return self.terms
+
+    def add_keyword(self, keyword, value):
+        """Adds an (already normalized) keyword. Characters before its first and after its last
+        word have to be in the text next to these words.
+
+        Returns:
+            bool: False if the keyword has no word characters and was not added
+        """
+        edges = []
+        first_start = previous_end = None
+        for word in self._word.finditer(keyword):
+            if previous_end is None:
+                first_start = word.start()
+                edges.append(word.group())
+            else:
+                edges.append(keyword[previous_end:word.end()])
+            previous_end = word.end()
+        if not edges:
+            self.unsupported += 1
+            return False
+        lead, trail = keyword[:first_start], keyword[previous_end:]
+        if lead not in self._leads:
+            self._leads.append(lead)
+            self._leads.sort(key=len, reverse=True)
+        node = self._root
+        for edge in edges:
+            node = node.setdefault(edge, {})
+        values = node.setdefault(_VALUE, {})
+        if (lead, trail) not in values:
+            self.terms += 1
+        values[lead, trail] = value
+        return True
+
+    def words(self, text, tokens):
+        """Returns (start, end, normalized word) of the words in the tokens. A token only
+        consists of more than one word if it contains characters that end a word."""
+        words = []
+        find_words = self._word.finditer
+        for token in tokens:
+            normalized, offsets = self._normalize(text[token.start:token.end])
+            for word in find_words(normalized):
+                if offsets is None:
+                    words.append((token.start + word.start(), token.start + word.end(), word.group()))
+                else:
+                    start, end = offsets[word.start()], offsets[word.end() - 1] + 1
+                    words.append((token.start + start, token.start + end, word.group()))
+        return words
+
+    def covers(self, text, words):
+        """Whether the words of the tokens are exactly the words of the text: none of them
+        continues in the text and there are no word characters between them.
+
+        Args:
+            text (str): the message text
+            words (list(tuple)): the result of `words`
+        """
+        find_word = self._word.search
+        previous_end = 0
+        for start, end, _ in words:
+            if start < previous_end or find_word(self._normalize(text[previous_end:start])[0]):
+                return False
+            if (start > 0 and self._continues_word(text[start - 1], -1)) or (
+                end < len(text) and self._continues_word(text[end], 0)
+            ):
+                return False
+            previous_end = end
+        return not find_word(self._normalize(text[previous_end:])[0])
+
+    def extract_keywords(self, text, tokens):
+        """Finds the keywords in the tokens of a message, with the same result as the character search.
+
+        Keywords are tried from left to right by their start, a start in front of a word
+        holds characters of a lead. The longest keyword of the first start that has one wins,
+        the search continues after the character following it.
+
+        Args:
+            text (str): the message text
+            tokens (list): tokens of `text` with `start` and `end`, in order
+
+        Returns:
+            list(tuple): (value, start, end) for every keyword found, None if the words of the
+                tokens are not the words of the text (see `covers`)
+        """
+        root = self._root
+        words = self.words(text, tokens)
+        if not self.covers(text, words):
+            return None
+        word_count = len(words)
+        keywords_extracted = []
+        # the character after a keyword is skipped, like by the character search
+        min_start = 0
+        idx = 0
+        while idx < word_count:
+            word_start = words[idx][0]
+            node = root.get(words[idx][2])
+            found = None
+            if node is not None and word_start >= min_start:
+                for lead in self._leads:
+                    start = word_start - len(lead)
+                    # the tokenizer may have cut off word characters (e.g. a trailing "-"), a
+                    # keyword has to start and end at a word boundary of the text itself
+                    if (
+                        start < min_start
+                        or (start > 0 and self._continues_word(text[start - 1], -1))
+                        or (lead and self._normalize(text[start:word_start])[0] != lead)
+                    ):
+                        continue
+                    found = self._longest_from(text, words, idx, node, lead)
+                    if found is not None:
+                        break
+            if found is None:
+                idx += 1
+                continue
+            last, end, value, edges = found
+            # flashtext drops falsy values, unless the keyword is the last word of the sentence
+            if value or (not edges and last == idx and end == len(text)):
+                keywords_extracted.append((value, start, end))
+            min_start = end + 1
+            idx = last + 1
+            while idx < word_count and words[idx][0] < min_start:
+                idx += 1
+        return keywords_extracted
+
+    def _longest_from(self, text, words, idx, node, lead):
+        """Returns (last word, end, value, whether lead or trail are not empty) of the longest
+        keyword with lead whose first word is words[idx], None if there is none"""
+        found = None
+        last = idx
+        text_len = len(text)
+        while node is not None:
+            word_end = words[last][1]
+            for (value_lead, trail), value in node.get(_VALUE, {}).items():
+                if value_lead != lead:
+                    continue
+                end = word_end + len(trail)
+                if (
+                    (found is None or end > found[1])
+                    and (not trail or self._normalize(text[word_end:end])[0] == trail)
+                    and (end == text_len or not self._continues_word(text[end], 0))
+                ):
+                    # update longest sequence found
+                    found = last, end, value, bool(lead or trail)
+            last += 1
+            if last == len(words):
+                break
+            # the next word together with the characters in front of it
+            separator = text[words[last - 1][1]:words[last][0]]
+            node = node.get(self._normalize(separator)[0] + words[last][2])
+        return found
+
+    def _continues_word(self, char, side):
+        """Whether `char` continues a word next to it, `side` picks the character of its
+        normalized form that touches the word (0: first, -1: last)"""
+        continues = self._continues.get((char, side))
+        if continues is None:
+            normalized = self._normalize(char)[0]
+            continues = self._continues[char, side] = bool(normalized) and normalized[side] in self._non_word_boundaries
+        return continues
@@ -0,0 +1,78 @@
+#################
+# Entity type -> keywords setting it.
+#
+# Keywords with equal {entity: value} dicts share one dict object, so the
+# index groups the keywords by their dict and maps each entity type to the
+# dicts that set it. Restricting the keywords to some types walks only the
+# dicts of these types, the dicts are reduced to the requested types once
+# and shared again by all their keywords.
+#
+# The keywords of a compiled trie are grouped by their value ids instead.
+# The values are only looked at for their entity types and not kept, a
+# memory mapped value table decodes the values of a type when it is
+# requested.
+#################
+
+
+class TypeIndex(object):
+    """Index of the keywords of a `KeywordProcessor` by the entity types their values set.
+
+    Attributes:
+        types (list(str)): all entity types, sorted
+    """
+
+    def __init__(self, items, values=None):
+        """
+        Args:
+            items (iterable(tuple)): (keyword, {entity: value}) of all keywords, e.g.
+                `KeywordProcessor.iter_keywords()`, or (keyword, value id) with values
+            values (list): the values the ids of items index, e.g. `FrozenTrie.values`.
+                A value table with `peek` (a loaded artifact) is read without keeping the values.
+                Defaults to None, items carry the values
+        """
+        self._value_table = values
+        # value group -> the value (or value id) and its keywords, the group number is the position
+        self._values = []
+        self._keywords = []
+        group_of = {}
+        for keyword, value in items:
+            key = value if values is not None else id(value)
+            group = group_of.get(key)
+            if group is None:
+                group = group_of[key] = len(self._values)
+                self._values.append(value)
+                self._keywords.append([])
+            self._keywords[group].append(keyword)
+        peek = getattr(values, "peek", None) or (values.__getitem__ if values is not None else None)
+        self._groups = {}
+        for group, value in enumerate(self._values):
+            for entity_type in value if peek is None else peek(value):
+                self._groups.setdefault(entity_type, []).append(group)
+        self.types = sorted(self._groups)
+
+    def __contains__(self, entity_type):
+        return entity_type in self._groups
+
+    def keywords(self, entity_type):
+        """Returns the keywords whose value sets entity_type, as normalized for the search"""
+        return [keyword for group in self._groups.get(entity_type, ()) for keyword in self._keywords[group]]
+
+    def restricted_keywords(self, entity_types):
+        """Returns the keywords setting any of entity_types, mapped to their values reduced to these types.
+
+        Args:
+            entity_types (iterable(str)): the entity types to keep
+
+        Returns:
+            dict: keyword -> {entity: value} with only the entities of entity_types
+        """
+        entity_types = frozenset(entity_types)
+        groups = sorted({group for entity_type in entity_types for group in self._groups.get(entity_type, ())})
+        restricted = {}
+        for group in groups:
+            value = self._values[group]
+            if self._value_table is not None:
+                value = self._value_table[value]
+            reduced = {entity: entity_value for entity, entity_value in value.items() if entity in entity_types}
+            restricted.update(dict.fromkeys(self._keywords[group], reduced))
+        return restricted
@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+from glob import glob
+
+
+#################
+# Polling watcher for the entity YAML files.
+#
+# Every interval the files matching the glob pattern are listed with their
+# modification time and size. A file added, removed or written changes this
+# signature and the callback is run with the sorted file list, in the thread
+# of the watcher. Polling needs no extra dependency and also works on network
+# and container file systems without inotify events.
+#################
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(pattern):
+    """path -> (mtime in ns, size) of the files matching the glob pattern"""
+    signature = {}
+    for path in glob(pattern, recursive=True):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # removed after it was listed
+            continue
+        signature[path] = (stat.st_mtime_ns, stat.st_size)
+    return signature
+
+
+class FileWatcher(object):
+    """Runs a callback in a daemon thread whenever the files matching a glob pattern change.
+
+    Attributes:
+        pattern (str): glob pattern of the watched files, `**` matches directories recursively
+        interval (float): seconds between two looks at the files
+        signature (dict): path -> (mtime in ns, size) of the files when they were last looked at
+    """
+
+    def __init__(self, pattern, callback, interval=2.0, signature=None):
+        """
+        Args:
+            pattern (str): glob pattern of the watched files
+            callback (callable): called with the sorted list of the files after they changed.
+                An exception is logged, the files are only passed again after the next change.
+            interval (float): seconds between two looks at the files
+            signature (dict): what the files are compared with first.
+                Defaults to None, the files as they are now
+        """
+        self.pattern = pattern
+        self.interval = interval
+        self.signature = file_signature(pattern) if signature is None else signature
+        self._callback = callback
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts the thread, it looks at the files every interval seconds"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"watch {self.pattern}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the thread, waiting at most timeout seconds for a running callback"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def check(self):
+        """Runs the callback if the files changed since the last look.
+
+        Returns:
+            bool: whether they changed
+        """
+        signature = file_signature(self.pattern)
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        try:
+            self._callback(sorted(signature))
+        except Exception:
+            logger.exception(f"Handling the changed files of {self.pattern} failed")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
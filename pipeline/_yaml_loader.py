@@ -0,0 +1,130 @@
+import logging
+import multiprocessing
+import os
+import re
+
+from rasa.shared.utils.io import read_yaml_file
+
+try:
+    import yaml
+    from yaml import CSafeLoader
+except ImportError:  # PyYAML without LibYAML bindings
+    CSafeLoader = None
+
+
+#################
+# Fast loading of many entity YAML files.
+#
+# rasa's read_yaml_file parses with the pure python ruamel loader in YAML 1.2
+# mode. If PyYAML was built with LibYAML, its C loader is used instead, with
+# scalars resolved by the patterns of that ruamel mode: examples such as "no",
+# "on", "1:20" or "1:20.5" stay strings, "010" is ten, "1_000" is a thousand
+# and "2020-01-01" is a date. A duplicate key is an error, as in rasa.
+# Many files are parsed in a pool of worker processes, the results are
+# returned in the order of the files.
+#################
+
+logger = logging.getLogger(__name__)
+
+if CSafeLoader is not None:
+
+    class _Yaml12SafeLoader(CSafeLoader):
+        """LibYAML safe loader resolving scalars like YAML 1.2, duplicate keys are an error"""
+
+        def construct_mapping(self, node, deep=False):
+            keys = set()
+            for key_node, _ in node.value:
+                if key_node.tag == _MERGE:
+                    # merged keys may be overridden
+                    continue
+                key = self.construct_object(key_node, deep=deep)
+                try:
+                    duplicate = key in keys
+                except TypeError:
+                    # unhashable, reported by the base constructor
+                    continue
+                if duplicate:
+                    raise yaml.constructor.ConstructorError(
+                        "while constructing a mapping",
+                        node.start_mark,
+                        f"found duplicate key {key!r}",
+                        key_node.start_mark,
+                    )
+                keys.add(key)
+            return super().construct_mapping(node, deep=deep)
+
+        def construct_yaml_int(self, node):
+            value = self.construct_scalar(node).replace("_", "")
+            sign = -1 if value[0] == "-" else 1
+            value = value.lstrip("+-")
+            base = {"0b": 2, "0o": 8, "0x": 16}.get(value[:2])
+            if base is not None:
+                return sign * int(value[2:], base)
+            # no octal "010" in YAML 1.2
+            return sign * int(value, 10)
+
+    _BOOL = "tag:yaml.org,2002:bool"
+    _INT = "tag:yaml.org,2002:int"
+    _FLOAT = "tag:yaml.org,2002:float"
+    _MERGE = "tag:yaml.org,2002:merge"
+    # the timestamp resolver is the same in both versions
+    _Yaml12SafeLoader.yaml_implicit_resolvers = {
+        first: [(tag, regexp) for tag, regexp in resolvers if tag not in (_BOOL, _INT, _FLOAT)]
+        for first, resolvers in CSafeLoader.yaml_implicit_resolvers.items()
+    }
+    _Yaml12SafeLoader.add_implicit_resolver(
+        _BOOL, re.compile(r"^(?:true|True|TRUE|false|False|FALSE)$"), list("tTfF")
+    )
+    _Yaml12SafeLoader.add_implicit_resolver(
+        _INT,
+        re.compile(r"^(?:[-+]?0b[0-1_]+|[-+]?0o?[0-7_]+|[-+]?[0-9_]+|[-+]?0x[0-9a-fA-F_]+)$"),
+        list("-+0123456789"),
+    )
+    _Yaml12SafeLoader.add_implicit_resolver(
+        _FLOAT,
+        re.compile(
+            r"^(?:[-+]?(?:[0-9][0-9_]*)\.[0-9_]*(?:[eE][-+]?[0-9]+)?"
+            r"|[-+]?(?:[0-9][0-9_]*)(?:[eE][-+]?[0-9]+)"
+            r"|\.[0-9_]+(?:[eE][-+][0-9]+)?"
+            r"|[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN))$"
+        ),
+        list("-+0123456789."),
+    )
+    _Yaml12SafeLoader.add_constructor(_INT, _Yaml12SafeLoader.construct_yaml_int)
+
+# the loader read_entity_file uses, parsed files are only reused from a cache of the same loader
+LOADER_KIND = "rasa" if CSafeLoader is None else "libyaml-1.2"
+
+
+def read_entity_file(path):
+    """Parses one YAML file, with the C loader if available.
+
+    Returns:
+        the content of the file, an empty dict for an empty file
+    """
+    if CSafeLoader is None:
+        return read_yaml_file(path)
+    with open(path, encoding="utf-8") as f:
+        return yaml.load(f, Loader=_Yaml12SafeLoader) or {}
+
+
+def read_entity_files(paths, workers=None):
+    """Parses YAML files, spread over a pool of worker processes.
+
+    Args:
+        paths (list(str)): the files
+        workers (int): number of worker processes.
+            Defaults to the number of CPUs, no pool is started for a single file or worker
+
+    Returns:
+        list: the content of each file, in the order of paths
+    """
+    paths = list(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        return [read_entity_file(path) for path in paths]
+    logger.debug(f"reading {len(paths)} files with {workers} processes")
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(read_entity_file, paths, chunksize=max(1, len(paths) // (4 * workers)))
@@ -0,0 +1,240 @@
+"""Compiles entity hierarchy YAML files offline and reports their size.
+
+Runs the same steps as `EntityHierarchy.train` and prints, for every phase,
+the time it took and the numbers that decide about the memory of a worker:
+keywords per target entity, expansions per composite, trie nodes per depth
+and the estimated size of the matcher.
+
+    python -m pipeline.compile 'entities/**/*.yml' --config config.yml --output models/entities
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from glob import glob
+from typing import Any, Dict, Iterator, List, Optional, Text, Tuple
+
+import rasa.shared.utils.io
+
+from pipeline._dawg import Dawg
+from pipeline._frozen_trie import NO_VALUE
+from pipeline._parser import topdownparser
+from pipeline.entities import EntityHierarchy
+
+
+def _entity_files(patterns: List[Text]) -> List[Text]:
+    """Expands the (possibly quoted) glob patterns, sorted like in `EntityHierarchy.train`"""
+    files = set()
+    for pattern in patterns:
+        matches = glob(pattern, recursive=True)
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        files.update(matches)
+    return sorted(files)
+
+
+def _component_config(config_file: Optional[Text]) -> Dict[Text, Any]:
+    """The settings of the EntityHierarchy in the pipeline of a rasa config, the defaults without one"""
+    if not config_file:
+        return {}
+    for component in rasa.shared.utils.io.read_yaml_file(config_file).get("pipeline") or []:
+        if str(component.get("name", "")).endswith("EntityHierarchy"):
+            return {key: value for key, value in component.items() if key != "name"}
+    raise ValueError(f"No EntityHierarchy in the pipeline of {config_file}")
+
+
+def _deep_size(obj: Any) -> int:
+    """Bytes of obj and everything reachable from it through dicts, lists, tuples and sets,
+    objects shared several times are counted once"""
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return size
+
+
+def _dict_trie_shape(compiled: Any) -> Tuple[Dict[int, int], Counter]:
+    """Shape of the flashtext dict trie holding the keywords of the compiled trie, taken from its
+    nodes and edges without rebuilding the dicts.
+
+    A collapsed chain of a `FrozenTrie` stands for one dict per character, a `Dawg` state for one
+    dict per path reaching it.
+
+    Returns:
+        (dict, Counter): nodes per depth (the root has depth 0 and is left out) and the number
+            of dicts per number of entries (children plus the keyword key)
+    """
+    if isinstance(compiled, Dawg):
+        def edges(state):
+            return [(char, child) for char, (child, _) in compiled.edges[state].items()]
+
+        def is_keyword(state):
+            return compiled.final[state]
+    else:
+        def edges(node):
+            return list(compiled.children(node).values())
+
+        def is_keyword(node):
+            return compiled.value_ids[node] != NO_VALUE
+
+    histogram = Counter()
+    dict_entries = Counter()
+    # depth -> node -> number of paths reaching the node at that depth
+    frontier = {0: Counter({0: 1})}
+    depth = 0
+    while frontier:
+        for node, paths in frontier.pop(depth, {}).items():
+            out = edges(node)
+            dict_entries[len(out) + is_keyword(node)] += paths
+            for chars, child in out:
+                for offset in range(1, len(chars)):
+                    histogram[depth + offset] += paths
+                dict_entries[1] += paths * (len(chars) - 1)
+                histogram[depth + len(chars)] += paths
+                frontier.setdefault(depth + len(chars), Counter())[child] += paths
+        depth += 1
+    return dict(sorted(histogram.items())), dict_entries
+
+
+@lru_cache(maxsize=None)
+def _dict_size(entries: int) -> int:
+    """Bytes of a dict filled one (string) key after the other up to `entries` keys"""
+    filled = {}
+    for key in range(entries):
+        filled[str(key)] = None
+    return sys.getsizeof(filled)
+
+
+def _keywords_per_entity(hierarchy: Dict[Text, Any], composite_sizes: Dict[Text, int]) -> Counter:
+    counts = Counter()
+    values = hierarchy.get("values", [])
+    for vid in itertools.chain(hierarchy.get("entities", {}).values(), hierarchy.get("alternatives", {}).values()):
+        counts.update(values[vid].keys())
+    for composite, targets in hierarchy.get("composites", {}).items():
+        for target in targets:
+            counts[target] += composite_sizes.get(composite, 0)
+    return counts
+
+
+def _format_bytes(size: int) -> Text:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def compile_entities(
+    files: List[Text], component_config: Dict[Text, Any], output: Optional[Text] = None, top: int = 20
+) -> EntityHierarchy:
+    """Compiles the entity files, prints the report and optionally persists the component.
+
+    Args:
+        files: the entity YAML files
+        component_config: settings of the EntityHierarchy
+        output: directory to persist the compiled component to, None to only report
+        top: number of entities and composites listed, the largest first
+
+    Returns:
+        EntityHierarchy: the compiled component
+    """
+    timings = {}
+
+    @contextmanager
+    def phase(name: Text) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        timings[name] = time.perf_counter() - start
+
+    component = EntityHierarchy({**component_config, "cache_dir": None})
+    with phase("read"):
+        raw_hierarchy, _ = component._read_entity_files(files)
+    composite_sizes = {}
+    with phase("parse"):
+        component._entityhierarchy = topdownparser(
+            raw_hierarchy,
+            lazy_composites=component.component_config.get("lazy_composites", False),
+            max_composite_expansions=component.component_config.get("max_composite_expansions"),
+            composite_sizes=composite_sizes,
+        )
+    with phase("build"):
+        component._parse_prepared_hierarchies()
+    if output:
+        with phase("persist"):
+            os.makedirs(output, exist_ok=True)
+            meta = component.persist("entity_hierarchy", output)
+            with open(os.path.join(output, "entity_hierarchy.meta.json"), "w", encoding="utf-8") as f:
+                json.dump({**component.component_config, **meta}, f, indent=2)
+
+    keyword_processor = component.keyword_processor
+    compiled = keyword_processor.compile()
+    histogram, dict_entries = _dict_trie_shape(compiled)
+
+    print(f"{len(files)} files, {len(raw_hierarchy)} keys")
+    counts = _keywords_per_entity(component._entityhierarchy, composite_sizes)
+    print(f"\nKeywords per target entity ({len(counts)} entities, largest {top}):")
+    for entity, count in counts.most_common(top):
+        print(f"  {count:>10}  {entity}")
+    print(f"\nExpansions per composite ({len(composite_sizes)} composites, largest {top}):")
+    lazy = component._entityhierarchy.get("composites", {})
+    for composite, size in sorted(composite_sizes.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {size:>10}  {composite}{'  (pattern)' if composite in lazy else ''}")
+
+    print(
+        f"\nTrie: {len(keyword_processor)} keywords, {keyword_processor.node_count} nodes in use, "
+        f"{len(component._entityhierarchy.get('values', []))} distinct entity dicts"
+    )
+    print("  depth       nodes")
+    for depth, nodes in histogram.items():
+        print(f"  {depth:>5}  {nodes:>10}")
+
+    print("\nEstimated bytes:")
+    if hasattr(compiled, "nbytes"):
+        print(f"  compiled trie   {_format_bytes(compiled.nbytes)}")
+    dict_trie_size = sum(count * _dict_size(entries) for entries, count in dict_entries.items())
+    print(f"  dict trie       {_format_bytes(dict_trie_size)}  (without values)")
+    if component._composite_matcher:
+        composite_tries = [component._composite_matcher._root, component._composite_matcher._vocabularies]
+        print(f"  composite tries {_format_bytes(_deep_size(composite_tries))}")
+    print(f"  hierarchy       {_format_bytes(_deep_size(component._entityhierarchy))}")
+    print(f"  persisted json  {_format_bytes(len(json.dumps(component._entityhierarchy).encode('utf-8')))}")
+
+    print("\nSeconds per phase:")
+    for name, seconds in timings.items():
+        print(f"  {name:<8} {seconds:>8.3f}")
+    return component
+
+
+def main(argv: Optional[List[Text]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m pipeline.compile", description="Compile entity hierarchy YAML files and report their size."
+    )
+    parser.add_argument("files", nargs="+", help="entity YAML files or glob patterns, e.g. 'entities/**/*.yml'")
+    parser.add_argument("--config", help="rasa config file, the settings of its EntityHierarchy are used")
+    parser.add_argument("--output", help="directory to write the persisted component to")
+    parser.add_argument("--top", type=int, default=20, help="number of entities and composites listed")
+    args = parser.parse_args(argv)
+
+    files = _entity_files(args.files)
+    if not files:
+        parser.error(f"no files match {args.files}")
+    compile_entities(files, _component_config(args.config), args.output, args.top)
+
+
+if __name__ == "__main__":
+    main()
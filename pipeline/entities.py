@@ -1,12 +1,17 @@
 import os
+import random
+import shutil
+import tempfile
+import threading
 import typing
-from typing import Any, Dict, List, Optional, Text, Type
+from collections import OrderedDict, namedtuple
+from typing import Any, Dict, Iterable, List, Optional, Text, Tuple, Type
 from glob import glob
 import rasa.shared.utils.io
 
-# from fuzzywuzzy import process
 from rasa.nlu.components import Component
 from rasa.nlu.config import RasaNLUModelConfig
+from rasa.nlu.constants import TOKENS_NAMES
 from rasa.nlu.extractors.extractor import EntityExtractor
 from rasa.nlu.utils import write_json_to_file
 from rasa.shared.nlu.constants import (
@@ -17,15 +22,33 @@ from rasa.shared.nlu.constants import (
     ENTITY_ATTRIBUTE_END,
     ENTITY_ATTRIBUTE_VALUE,
     ENTITIES,
+    EXTRACTOR,
+    METADATA,
 )
 from rasa.nlu.model import Metadata
 from rasa.shared.nlu.training_data.message import Message
 from rasa.shared.nlu.training_data.training_data import TrainingData
 import logging
-from rasa.shared.utils.io import read_yaml_file
-from pipeline._parser import topdownparser, ANY_SOURCE_ENTITY_KEY
+from pipeline._parser import (
+    topdownparser,
+    build_value_table,
+    dependencies,
+    merge_hierarchies,
+    ANY_SOURCE_ENTITY_KEY,
+)
+from pipeline._yaml_loader import LOADER_KIND, read_entity_files
+from pipeline._compile_cache import CompileCache, digest, file_digest, PARSED_FILE, COMPILED_FILE, HIERARCHY
 
 from pipeline._flashtext_mod import KeywordProcessor
+from pipeline._frozen_trie import FrozenTrie
+from pipeline._normalizer import TextNormalizer, CASEFOLD
+from pipeline._fuzzy import EditBudget
+from pipeline._result_cache import ResultCache
+from pipeline._spans import SpanIndex, OVERLAP_POLICIES, KEEP_BOTH, PREFER_LONGEST, PREFER_ORIGINAL
+from pipeline._composite import CompositeMatcher, merge_matches
+from pipeline._matchers import Matcher, create_matcher, select_matcher, DICT_TRIE, FROZEN_TRIE, TOKEN_TRIE
+from pipeline._watcher import FileWatcher
+from pipeline._type_index import TypeIndex
 
 if typing.TYPE_CHECKING:
     from rasa.nlu.model import Metadata
@@ -33,6 +56,12 @@ if typing.TYPE_CHECKING:
 logger = logging.getLogger(f"{__name__}.entity_hierarchy")
 
 ENTITY_ATTRIBUTE_PROCESSORS = "processors"
+# key of the message metadata restricting the extraction to some entity types
+METADATA_ENTITY_TYPES = "entity_types"
+
+# everything a message is searched with. It is replaced as a whole when the entity files are
+# reloaded, a message is never searched with parts of two versions of the hierarchy.
+_Searchers = namedtuple("_Searchers", ["keyword_processor", "matcher", "composite_matcher"])
 
 
 ###############
@@ -68,6 +97,76 @@ class EntityHierarchy(EntityExtractor):
         "case_sensitive": False,
         "include_repeated_entities": False,  # if true the same entity will only return its first occurrence
         "non_word_boundaries": "_öäüÖÄÜß-",
+        "freeze_trie": True,  # compile the keyword trie into the compact array layout after building it
+        "aho_corasick": False,  # scan each message once with an Aho-Corasick automaton (always frozen)
+        # normalize entity texts and messages before matching, any of "casefold", "umlauts" (ä -> ae, ...)
+        # and "eszett" (ß -> ss). Found spans always refer to the original message text.
+        "normalization": None,
+        # allow typos: minimal keyword length -> number of edits (Levenshtein distance) allowed,
+        # e.g. {5: 1, 10: 2}. Fuzzy hits get a confidence below 1.0. Two edits are a lot more
+        # expensive than one, as the trie has to be searched much wider.
+        "fuzzy_max_edits": None,
+        # search the words of the tokens set by the tokenizer (e.g. WhitespaceTokenizer) with a trie
+        # keyed on whole words instead of the characters of the message text. Messages without
+        # tokens, with tokens that are not the words of the text (e.g. split inside a word) and
+        # fuzzy matching still use the character search.
+        "token_matching": False,
+        # matcher backend: "dict_trie", "frozen_trie", "dawg", "regex_alternation" or "token_trie", all
+        # find the same entities. "auto" benchmarks all of them on the training messages and stores the
+        # fastest in the model. None derives it from freeze_trie and token_matching.
+        "matcher": None,
+        # number of training messages the "auto" matcher selection is measured on
+        "matcher_sample_size": 200,
+        # keep composites as patterns that are matched by chaining the tries of their placeholders,
+        # instead of adding every combination of the placeholder texts as keyword. Memory grows with
+        # the sum of the placeholder vocabularies and not their product.
+        "lazy_composites": False,
+        # training fails if a single composite would expand to more texts than this, before any of
+        # them is created. None for no limit.
+        "max_composite_expansions": 1000000,
+        # directory caching the parsed entity files and the compiled hierarchy by content hash. Only
+        # files that changed, or refer to a changed file, are compiled again. Training removes the
+        # entries it did not use, so the directory must not be shared with other components or bots.
+        # None disables the cache.
+        "cache_dir": None,
+        # number of processes parsing the entity files, None for one per CPU. Files are parsed with
+        # the C loader of LibYAML if PyYAML has it.
+        "loader_workers": None,
+        # number of messages whose entities are kept in an LRU cache, keyed by the normalized text.
+        # 0 disables the cache.
+        "result_cache_size": 0,
+        # seconds a cached result is used, None to keep it until it is the least recently used
+        "result_cache_ttl": None,
+        # number of processes searching the keywords in process_batch, they share the trie copy-on-write
+        "batch_workers": 1,
+        # entities found by this component overlapping entities of other extractors: "keep_both",
+        # "prefer_longest" (the other one on equal length), "prefer_hierarchy" or "prefer_original"
+        "overlap_policy": "keep_both",
+        # watch the files matching entityfile in a loaded model and compile them again in a background
+        # thread when they change. Messages are searched with the old hierarchy until the new one is
+        # complete. Also picks up files changed since the model was trained.
+        "watch_entityfile": False,
+        # seconds between two looks at the modification times of the watched files
+        "watch_interval": 2.0,
+        # directory the compiled matcher of a loaded model is copied to and memory mapped from, e.g. a
+        # directory in /dev/shm. Worker processes loading the same model map the same file, so its
+        # arrays and value table are in memory once per host instead of once per worker. Rasa unpacks
+        # the model of every worker into its own directory, without it the workers map different
+        # files. Only the "frozen_trie" matcher (and aho_corasick) search the mapped arrays, the other
+        # backends build private copies. None maps the file in the unpacked model. With entity_types
+        # only the values of the requested types are decoded into a worker.
+        "shared_matcher_dir": None,
+        # keep the index of the first words of the keywords in every worker. It makes the search
+        # about 15% faster, but is the largest part of the private memory of a worker loading a
+        # mapped matcher (about 100 bytes per distinct first word).
+        "matcher_word_index": True,
+        # entity types to extract, None for all. The "entity_types" of the metadata of a message replace
+        # them for that message, e.g. the few types a dialogue state needs. Only the keywords setting
+        # one of the types are searched and their entities are reduced to these types.
+        "entity_types": None,
+        # number of entity type subsets whose restricted matchers are kept, the least recently used is
+        # dropped. Building one takes a pass over the keywords of its types.
+        "max_type_filters": 32,
     }
 
     # Defines what language(s) this component can handle.
@@ -86,42 +185,172 @@ class EntityHierarchy(EntityExtractor):
         self,
         component_config: Optional[Dict[Text, Any]] = None,
         entityhierarchy: Optional[Dict[Text, Any]] = None,
+        frozen_trie: Optional[FrozenTrie] = None,
+        composites: Optional[Dict[Text, Any]] = None,
     ) -> None:
         super().__init__(component_config)
         if not component_config:
             component_config = self.defaults
-        self.keyword_processor = KeywordProcessor(
-            case_sensitive=self.component_config["case_sensitive"]
-        )
-        for non_word_boundary in self.component_config["non_word_boundaries"]:
-            self.keyword_processor.add_non_word_boundary(non_word_boundary)
+        self._searchers = _Searchers(self._create_keyword_processor(), None, None)
         self._entityfile = component_config.get("entityfile", None)
         self.include_repeated_entities = component_config.get("include_repeated_entities", False)
+        fuzzy_max_edits = self.component_config.get("fuzzy_max_edits")
+        self._edit_budget = EditBudget(fuzzy_max_edits) if fuzzy_max_edits else None
+        self._overlap_policy = self.component_config.get("overlap_policy", KEEP_BOTH)
+        if self._overlap_policy not in OVERLAP_POLICIES:
+            raise ValueError(f"Unknown overlap_policy '{self._overlap_policy}', use any of {list(OVERLAP_POLICIES)}")
+        result_cache_size = self.component_config.get("result_cache_size")
+        self._result_cache = (
+            ResultCache(result_cache_size, self.component_config.get("result_cache_ttl"))
+            if result_cache_size
+            else None
+        )
+        # digest of the entity files the hierarchy was compiled from, set by train and persisted
+        self._source_digest = self.component_config.get("entityfile_digest")
+        self._watcher = None
+        self._reload_lock = threading.Lock()
+        # (searchers, their TypeIndex, entity types -> restricted searchers), built on first use
+        self._type_filters = None
+        self._type_filters_lock = threading.Lock()
 
-        if entityhierarchy:
+        if frozen_trie is not None:
+            logger.debug(f"restore compiled entityhierarchy")
+            self._entityhierarchy = {}
+            keyword_processor = self.keyword_processor
+            keyword_processor.set_frozen(frozen_trie)
+            self._searchers = _Searchers(
+                keyword_processor,
+                self._create_matcher(self._matcher_name(), keyword_processor),
+                self._create_composite_matcher(keyword_processor, composites or {}),
+            )
+        elif entityhierarchy:
             logger.debug(f"restore entityhierarchy")
+            if "values" not in entityhierarchy:
+                # persisted before the values were interned
+                entityhierarchy = build_value_table(entityhierarchy)
             self._entityhierarchy = entityhierarchy
             self._parse_prepared_hierarchies()
         else:
             self._entityhierarchy = {}
 
+    @property
+    def keyword_processor(self) -> KeywordProcessor:
+        return self._searchers.keyword_processor
+
+    @property
+    def _matcher(self) -> Optional[Matcher]:
+        return self._searchers.matcher
+
+    @property
+    def _composite_matcher(self) -> Optional[CompositeMatcher]:
+        return self._searchers.composite_matcher
+
+    def _create_keyword_processor(self) -> KeywordProcessor:
+        """An empty keyword processor with the configured matching options"""
+        keyword_processor = KeywordProcessor(
+            case_sensitive=self.component_config["case_sensitive"],
+            aho_corasick=self.component_config.get("aho_corasick", False),
+            normalizer=self._create_normalizer(self.component_config),
+        )
+        for non_word_boundary in self.component_config["non_word_boundaries"]:
+            keyword_processor.add_non_word_boundary(non_word_boundary)
+        return keyword_processor
+
+    @staticmethod
+    def _create_normalizer(component_config: Dict[Text, Any]) -> Optional[TextNormalizer]:
+        """Creates the normalizer for the configured normalization steps, it also takes care of
+        the lower casing when the matching is case insensitive."""
+        steps = component_config.get("normalization")
+        if not steps:
+            return None
+        if isinstance(steps, str):
+            steps = [steps]
+        if not component_config["case_sensitive"]:
+            steps = list(steps) + [CASEFOLD]
+        return TextNormalizer(steps)
+
     def _parse_prepared_hierarchies(self):
-        for keyword, ent_dict in self._entityhierarchy.get("entities", {}).items():
-            # keyword is the full text to be found, the dict contains entity:value pairs to be set
-            # as flashtext can store ANY python object to be returned, we'll use the full dict as
-            # return value
-            self.keyword_processor.add_keyword(keyword, ent_dict)
-
-        lookups = self.keyword_processor.get_all_keywords()
-        if len(lookups.keys()) == 0:
+        self._searchers = self._build_searchers(self._entityhierarchy)
+        if self._result_cache is not None:
+            self._result_cache.clear()
+
+    def _build_searchers(self, hierarchy: Dict[Text, Any]) -> _Searchers:
+        """Builds a new keyword processor and the matchers for a prepared hierarchy, the ones
+        in use are not changed"""
+        # keyword is the full text to be found, the dict contains entity:value pairs to be set
+        # as flashtext can store ANY python object to be returned, we'll use the full dict as
+        # return value. Keywords with equal dicts share one object of the value table, alternative
+        # spellings are already resolved to the dict of their text.
+        # All keywords are added as one new version of the trie.
+        values = hierarchy.get("values", [])
+        keywords = {text: values[vid] for text, vid in hierarchy.get("entities", {}).items()}
+        keyword_processor = self._create_keyword_processor()
+        composite_matcher = self._create_composite_matcher(keyword_processor, hierarchy)
+
+        if not keywords and not composite_matcher:
             rasa.shared.utils.io.raise_warning(
                 "No entity hierarchies defined in the training data that have "
                 "text examples to use for the extractor"
             )
-        # populate the secondary alternatives dictionary too
+        # populate the secondary alternatives too
+        for alternative, vid in hierarchy.get("alternatives", {}).items():
+            keywords[alternative] = values[vid]
+        keyword_processor.update_keywords(add=keywords)
+        return _Searchers(keyword_processor, self._finish_keyword_processor(keyword_processor), composite_matcher)
+
+    def _finish_keyword_processor(self, keyword_processor: KeywordProcessor) -> Matcher:
+        """Freezes a filled keyword processor unless the configured matcher searches the dict trie,
+        and returns the matcher searching it"""
+        matcher = self._matcher_name()
+        if matcher != DICT_TRIE and (self.component_config.get("freeze_trie", True) or keyword_processor.aho_corasick):
+            keyword_processor.freeze()
+        return self._create_matcher(matcher, keyword_processor)
+
+    def _matcher_name(self) -> Text:
+        """The configured matcher backend, "auto" before it was selected"""
+        matcher = self.component_config.get("matcher")
+        if matcher:
+            return matcher
+        if self.component_config.get("token_matching"):
+            return TOKEN_TRIE
+        if self.component_config.get("freeze_trie", True) or self.component_config.get("aho_corasick", False):
+            return FROZEN_TRIE
+        return DICT_TRIE
 
-        for keyword, clean_name in self._entityhierarchy.get("alternatives", {}).items():
-            self.keyword_processor.add_keyword(keyword, clean_name)
+    @staticmethod
+    def _create_matcher(matcher: Text, keyword_processor: KeywordProcessor) -> Matcher:
+        # until train selected the "auto" backend the compiled trie is used
+        return create_matcher(FROZEN_TRIE if matcher == "auto" else matcher, keyword_processor)
+
+    @staticmethod
+    def _create_composite_matcher(
+        keyword_processor: KeywordProcessor, hierarchy: Dict[Text, Any]
+    ) -> Optional[CompositeMatcher]:
+        """Builds the matcher of the lazy composites of the hierarchy, None if it has none"""
+        if hierarchy.get("composites"):
+            return CompositeMatcher(keyword_processor, hierarchy["composites"], hierarchy.get("vocabularies", {}))
+        return None
+
+    def _select_matcher(self, training_data: TrainingData) -> None:
+        """Benchmarks the matcher backends on a sample of the training messages and keeps the fastest"""
+        messages = [
+            (message.get(TEXT), message.get(TOKENS_NAMES[TEXT]))
+            for message in training_data.training_examples
+            if message.get(TEXT)
+        ]
+        sample_size = self.component_config.get("matcher_sample_size", 200)
+        if len(messages) > sample_size:
+            messages = random.Random(42).sample(messages, sample_size)
+        if not messages:
+            rasa.shared.utils.io.raise_warning(
+                f"No training messages to select the matcher of EntityHierarchy, using {FROZEN_TRIE}"
+            )
+            self.component_config["matcher"] = FROZEN_TRIE
+            return
+        matcher, timings = select_matcher(self.keyword_processor, messages)
+        logger.info(f"Selected matcher {matcher.name} on {len(messages)} messages, seconds per run: {timings}")
+        self._searchers = self._searchers._replace(matcher=matcher)
+        self.component_config["matcher"] = matcher.name
 
     def train(
         self,
@@ -147,30 +376,223 @@ class EntityHierarchy(EntityExtractor):
                 "EntityHierarchy is in the pipeline but no entityfile name is defined in config."
             )
             return
-        filelist = glob(self._entityfile, recursive=True)
+        filelist = self._entity_files()
+        parser_options = self._parser_options()
+        cache = self._compile_cache()
+        digests = {fn: file_digest(fn) for fn in filelist}
+        self._source_digest = digest([[fn, digests[fn]] for fn in filelist])
 
-        raw_hierarchy = {}
-        if filelist:
-            # read each file and merge the results
-            for fn in filelist:
-                logger.debug(f"reading file {fn}")
-                filecontent = read_yaml_file(fn)
-                if isinstance(filecontent, dict):
-                    if [k for k in filecontent if k in raw_hierarchy]:
-                        raise ValueError(
-                            f"Duplicate key(s) {[k for k in filecontent if k in raw_hierarchy]} in file {fn}"
-                        )
-                    raw_hierarchy.update(filecontent)
-                    logger.info(f"Processed file {fn}")
-                else:
-                    logger.warn(f"{fn} invalid file format: must be a dictionary in YAML")
-        self._entityhierarchy = topdownparser(raw_hierarchy)
+        if cache is not None:
+            fingerprint = digest(parser_options, LOADER_KIND, [digests[fn] for fn in filelist])
+            cached = cache.load(HIERARCHY, fingerprint)
+            if cached is not None:
+                # none of the files changed, the result of the last training is used as it is
+                logger.info(f"Entity files unchanged, using the cached entity hierarchy")
+                self._entityhierarchy = cached["hierarchy"]
+                if self.component_config.get("matcher") == "auto" and cached["matcher"]:
+                    self.component_config["matcher"] = cached["matcher"]
+                self._parse_prepared_hierarchies()
+                return
+        self._entityhierarchy = self._compile_entity_files(filelist, digests, cache, parser_options)
 
         self._parse_prepared_hierarchies()
+        if self.component_config.get("matcher") == "auto" and len(self.keyword_processor):
+            self._select_matcher(training_data)
+        if cache is not None:
+            matcher = self.component_config.get("matcher")
+            cache.store(
+                HIERARCHY,
+                fingerprint,
+                {"hierarchy": self._entityhierarchy, "matcher": matcher if matcher != "auto" else None},
+            )
+            removed = cache.prune()
+            logger.debug(f"Compile cache: {cache.hits} hits, {cache.misses} misses, {removed} stale entries removed")
+
+    def _entity_files(self) -> List[Text]:
+        # sorted, so that the merge order and a duplicate key error do not depend on the file system
+        return sorted(glob(self._entityfile, recursive=True))
+
+    def _parser_options(self) -> Dict[Text, Any]:
+        return {
+            "lazy_composites": self.component_config.get("lazy_composites", False),
+            "max_composite_expansions": self.component_config.get("max_composite_expansions"),
+        }
+
+    def _compile_cache(self) -> Optional[CompileCache]:
+        cache_dir = self.component_config.get("cache_dir")
+        return CompileCache(cache_dir) if cache_dir else None
+
+    def _compile_entity_files(
+        self,
+        filelist: List[Text],
+        digests: Dict[Text, Text],
+        cache: Optional[CompileCache],
+        parser_options: Dict[Text, Any],
+        workers: Optional[int] = None,
+    ) -> Dict[Text, Any]:
+        """Reads and parses the entity files into a prepared hierarchy, with a cache only the
+        files that changed are parsed again"""
+        if cache is None:
+            raw_hierarchy, _ = self._read_entity_files(filelist, workers=workers)
+            return topdownparser(raw_hierarchy, **parser_options)
+        raw_hierarchy, owners = self._read_entity_files(filelist, cache, digests, workers)
+        return self._compile_incrementally(raw_hierarchy, owners, digests, cache, parser_options)
+
+    def _read_entity_files(
+        self,
+        filelist: List[Text],
+        cache: Optional[CompileCache] = None,
+        digests: Optional[Dict[Text, Text]] = None,
+        workers: Optional[int] = None,
+    ) -> Tuple[Dict[Text, Any], Dict[Text, Text]]:
+        """Reads the YAML files and merges their keys in the order of filelist, the parsed
+        content is taken from the cache for files with a known digest. The other files
+        are parsed in parallel.
+
+        Args:
+            workers: number of processes parsing the files.
+                Defaults to the loader_workers setting
+
+        Returns:
+            tuple: (merged top-down hierarchy, key -> file defining it)
+
+        Raises:
+            ValueError: If a key is defined in more than one file
+        """
+        contents = {}
+        if cache is not None:
+            for fn in filelist:
+                filecontent = cache.load(PARSED_FILE, digest(LOADER_KIND, digests[fn]))
+                if filecontent is not None:
+                    contents[fn] = filecontent
+        missing = [fn for fn in filelist if fn not in contents]
+        if workers is None:
+            workers = self.component_config.get("loader_workers")
+        for fn, filecontent in zip(missing, read_entity_files(missing, workers=workers)):
+            contents[fn] = filecontent
+            if cache is not None:
+                cache.store(PARSED_FILE, digest(LOADER_KIND, digests[fn]), filecontent)
+
+        raw_hierarchy = {}
+        owners = {}
+        # merge the results, a key is reported in the later of the files in filelist
+        for fn in filelist:
+            filecontent = contents[fn]
+            if isinstance(filecontent, dict):
+                if [k for k in filecontent if k in raw_hierarchy]:
+                    raise ValueError(
+                        f"Duplicate key(s) {[k for k in filecontent if k in raw_hierarchy]} in file {fn}"
+                    )
+                raw_hierarchy.update(filecontent)
+                owners.update(dict.fromkeys(filecontent, fn))
+                logger.info(f"Processed file {fn}")
+            else:
+                logger.warn(f"{fn} invalid file format: must be a dictionary in YAML")
+        return raw_hierarchy, owners
+
+    @staticmethod
+    def _compile_incrementally(
+        raw_hierarchy: Dict[Text, Any],
+        owners: Dict[Text, Text],
+        digests: Dict[Text, Text],
+        cache: CompileCache,
+        parser_options: Dict[Text, Any],
+    ) -> Dict[Text, Any]:
+        """Runs topdownparser for the keys of each file separately and merges the results.
+        The result of a file is cached under the digests of the file and of every file its
+        'ref' and 'composite' examples lead to (also indirectly), it is only parsed again
+        when one of them changed."""
+        refs = dependencies(raw_hierarchy)
+        keys_of_file = {}
+        for key, fn in owners.items():
+            keys_of_file.setdefault(fn, []).append(key)
+        parts = []
+        for fn, keys in keys_of_file.items():
+            # all keys the keys of the file take examples from
+            needed = set(keys)
+            todo = list(keys)
+            while todo:
+                for ref in refs.get(todo.pop(), []):
+                    if ref not in needed and ref in raw_hierarchy:
+                        needed.add(ref)
+                        todo.append(ref)
+            key = digest(
+                parser_options,
+                LOADER_KIND,
+                digests[fn],
+                sorted({digests[owners[ref]] for ref in needed if owners[ref] != fn}),
+            )
+            part = cache.load(COMPILED_FILE, key)
+            if part is None:
+                logger.debug(f"compiling {fn}")
+                part = topdownparser(
+                    {k: v for k, v in raw_hierarchy.items() if k in needed}, targets=keys, **parser_options
+                )
+                cache.store(COMPILED_FILE, key, part)
+            parts.append(part)
+        return merge_hierarchies(parts)
+
+    def reload_entity_files(self, filelist: Optional[List[Text]] = None) -> bool:
+        """Compiles the entity files again and swaps the new matcher in if their content changed.
+
+        Messages processed meanwhile are searched with the old matcher, they never wait for
+        the compilation. The new keyword processor and matchers are replaced in one assignment.
+        The compile cache is used like by train, only changed files are parsed again.
+
+        Args:
+            filelist: the files matching entityfile.
+                Defaults to None, the files are listed again
+
+        Returns:
+            bool: whether a new hierarchy is in use
+        """
+        with self._reload_lock:
+            if filelist is None:
+                filelist = self._entity_files()
+            if not filelist:
+                logger.warning(f"No files match {self._entityfile}, keeping the entity hierarchy")
+                return False
+            digests = {fn: file_digest(fn) for fn in filelist}
+            source_digest = digest([[fn, digests[fn]] for fn in filelist])
+            if source_digest == self._source_digest:
+                return False
+            # the files are parsed in this process, forking a pool from a serving process with
+            # running threads is not safe
+            hierarchy = self._compile_entity_files(
+                filelist, digests, self._compile_cache(), self._parser_options(), workers=1
+            )
+            searchers = self._build_searchers(hierarchy)
+            self._entityhierarchy = hierarchy
+            self._searchers = searchers
+            self._source_digest = source_digest
+            if self._result_cache is not None:
+                # after the swap, results of the old matcher are not stored any more
+                self._result_cache.clear()
+        logger.info(f"Reloaded entity hierarchy from {len(filelist)} files: {len(searchers.keyword_processor)} keywords")
+        return True
+
+    def start_watching(self) -> None:
+        """Starts a daemon thread that reloads the entity files when they change, see `reload_entity_files`"""
+        if not self._entityfile:
+            rasa.shared.utils.io.raise_warning("EntityHierarchy can not watch the entity files, no entityfile is defined.")
+            return
+        if self._watcher is None:
+            # an empty signature makes the first look compare the files with the trained ones
+            self._watcher = FileWatcher(
+                self._entityfile,
+                self.reload_entity_files,
+                self.component_config.get("watch_interval", 2.0),
+                signature={},
+            )
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        if self._watcher is not None:
+            self._watcher.stop()
 
     # process from flashE
     def process(self, message: Message, **kwargs: Any) -> None:
-        extracted_entities = self._extract_entities(message)
+        extracted_entities = self._extract_entities_cached(message)
         extracted_entities = self.add_extractor_name(extracted_entities)
         entities = self._extent_entities(
             original_entities=message.get(ENTITIES, []), new_entities=extracted_entities
@@ -178,48 +600,278 @@ class EntityHierarchy(EntityExtractor):
 
         message.set(ENTITIES, entities, add_to_output=True)
 
-    def _extract_entities(self, message: Message) -> List[Dict[Text, Any]]:
+    def process_batch(self, messages: Iterable[Message], workers: Optional[int] = None, **kwargs: Any) -> None:
+        """Processes many messages at once, with the same result as `process` for each of them.
+
+        Messages with the same text and entity types are only searched once. With more than one
+        worker the keywords of the texts are searched in a pool of forked processes that share the trie,
+        also while other threads (e.g. of `start_watching`) are running.
+
+        Args:
+            messages: the messages, their entities are set like by `process`
+            workers: number of processes searching the keywords.
+                Defaults to the batch_workers setting
+        """
+        messages = list(messages)
+        if workers is None:
+            workers = self.component_config.get("batch_workers", 1)
+        generation = self._result_cache.generation if self._result_cache is not None else None
+        searchers = self._searchers
+        # the messages of each text and entity types, tokens are the same for equal texts
+        by_key = {}
+        types_of_key = {}
+        for message in messages:
+            entity_types = self._entity_types(message)
+            key = self._result_key(message.get(TEXT), entity_types)
+            by_key.setdefault(key, []).append(message)
+            types_of_key[key] = entity_types
+        extracted = {}
+        # the keys still to search, per entity types
+        todo = {}
+        for key, same_text in by_key.items():
+            entities = self._result_cache.get(key) if self._result_cache is not None and key else None
+            if entities is None:
+                todo.setdefault(types_of_key[key], []).append(key)
+            else:
+                extracted[key] = self.add_extractor_name(entities)
+        for entity_types, keys in todo.items():
+            searched = self._extract_entities_batch(
+                [by_key[key][0] for key in keys], workers, self._searchers_for_types(searchers, entity_types)
+            )
+            for key, entities in zip(keys, searched):
+                if self._result_cache is not None and key:
+                    self._result_cache.put(key, entities, generation)
+                extracted[key] = entities
+
+        for key, same_text in by_key.items():
+            for idx, message in enumerate(same_text):
+                # every message gets its own entity dicts
+                new_entities = extracted[key] if idx == 0 else [dict(entity) for entity in extracted[key]]
+                entities = self._extent_entities(original_entities=message.get(ENTITIES, []), new_entities=new_entities)
+                message.set(ENTITIES, entities, add_to_output=True)
+
+    @property
+    def result_cache_stats(self) -> Optional[Dict[Text, int]]:
+        """Hits, misses and size of the result cache, None without one"""
+        return self._result_cache.stats if self._result_cache is not None else None
+
+    def _cache_key(self, text: Optional[Text]) -> Optional[Text]:
+        """The text as normalized for the search, texts with the same key have the same entities"""
+        if not text:
+            return text
+        normalized, offsets = self.keyword_processor._normalize_sentence(text)
+        # texts only share their spans if normalizing did not move them
+        return normalized if offsets is None else text
+
+    def _result_key(self, text: Optional[Text], entity_types: Optional[frozenset]) -> Any:
+        """The key of the entities of a text restricted to entity_types in the result cache"""
+        key = self._cache_key(text)
+        return key if not key or entity_types is None else (key, entity_types)
+
+    def _entity_types(self, message: Message) -> Optional[frozenset]:
+        """The entity types to extract from a message: the ones of its metadata, else the configured
+        ones. None for all types."""
+        metadata = message.get(METADATA)
+        entity_types = metadata.get(METADATA_ENTITY_TYPES) if isinstance(metadata, dict) else None
+        if entity_types is None:
+            entity_types = self.component_config.get("entity_types")
+            if entity_types is None:
+                return None
+        if isinstance(entity_types, str):
+            entity_types = [entity_types]
+        return frozenset(entity_types)
+
+    @property
+    def type_index(self) -> TypeIndex:
+        """Entity type -> keywords of the hierarchy in use setting it. Built on the first access
+        and after a reload, a pass over all keywords."""
+        return self._type_filters_of(self._searchers)[1]
+
+    def _type_filters_of(self, searchers: _Searchers) -> tuple:
+        """The type index and restricted searchers of searchers, new ones if the hierarchy was reloaded"""
+        type_filters = self._type_filters
+        if type_filters is None or type_filters[0] is not searchers:
+            with self._type_filters_lock:
+                type_filters = self._type_filters
+                if type_filters is None or type_filters[0] is not searchers:
+                    type_filters = (searchers, self._build_type_index(searchers.keyword_processor), OrderedDict())
+                    self._type_filters = type_filters
+        return type_filters
+
+    @staticmethod
+    def _build_type_index(keyword_processor: KeywordProcessor) -> TypeIndex:
+        if keyword_processor.is_frozen:
+            trie = keyword_processor.compile()
+            if isinstance(trie, FrozenTrie):
+                # grouped by value ids, the values of a mapped matcher are not decoded and kept
+                return TypeIndex(trie.iter_value_ids(), trie.values)
+        return TypeIndex(keyword_processor.iter_keywords())
+
+    def _searchers_for_types(self, searchers: _Searchers, entity_types: Optional[frozenset]) -> _Searchers:
+        """Returns searchers that only find the keywords and composites setting any of entity_types,
+        with the entity dicts reduced to these types.
+
+        Args:
+            searchers: the searchers of the complete hierarchy
+            entity_types: the types to extract, None for all
+        """
+        if entity_types is None:
+            return searchers
+        _, index, restricted = self._type_filters_of(searchers)
+        with self._type_filters_lock:
+            found = restricted.get(entity_types)
+            if found is not None:
+                restricted.move_to_end(entity_types)
+                return found
+        # built outside of the lock, other messages are not held up meanwhile
+        keyword_processor = self._create_keyword_processor()
+        keyword_processor.update_keywords(add=index.restricted_keywords(entity_types))
+        composite_matcher = (
+            searchers.composite_matcher.restricted(entity_types, keyword_processor)
+            if searchers.composite_matcher
+            else None
+        )
+        found = _Searchers(
+            keyword_processor, self._finish_keyword_processor(keyword_processor), composite_matcher or None
+        )
+        with self._type_filters_lock:
+            restricted[entity_types] = found
+            while len(restricted) > self.component_config.get("max_type_filters", 32):
+                restricted.popitem(last=False)
+        return found
+
+    def _extract_entities_cached(self, message: Message) -> List[Dict[Text, Any]]:
+        """`_extract_entities` with the results of recent texts taken from the result cache"""
+        text = message.get(TEXT)
+        if self._result_cache is None or not text:
+            return self._extract_entities(message)
+        # read before the searchers, a result of a replaced matcher is then never stored
+        generation = self._result_cache.generation
+        entity_types = self._entity_types(message)
+        searchers = self._searchers_for_types(self._searchers, entity_types)
+        key = self._result_key(text, entity_types)
+        entities = self._result_cache.get(key)
+        if entities is None:
+            entities = self._extract_entities(message, searchers)
+            self._result_cache.put(key, entities, generation)
+        return entities
+
+    def _extract_entities(self, message: Message, searchers: Optional[_Searchers] = None) -> List[Dict[Text, Any]]:
         """Extract entities of the given type from the given user message."""
-        if len(self.keyword_processor) == 0:
+        if searchers is None:
+            searchers = self._searchers_for_types(self._searchers, self._entity_types(message))
+        if len(searchers.keyword_processor) == 0 and not searchers.composite_matcher:
             return []
-        matches_ = self.keyword_processor.extract_keywords(message.get(TEXT), span_info=True)
+        return self._entities_from_matches(
+            self._find_matches(message.get(TEXT), message.get(TOKENS_NAMES[TEXT]), searchers=searchers)
+        )
+
+    def _extract_entities_batch(
+        self, messages: List[Message], workers: int, searchers: _Searchers
+    ) -> List[List[Dict[Text, Any]]]:
+        """`_extract_entities` for many messages, the entities already carry the extractor name"""
+        if len(searchers.keyword_processor) == 0 and not searchers.composite_matcher:
+            return [[] for _ in messages]
+        texts = [message.get(TEXT) for message in messages]
+        if workers > 1 and self._edit_budget is None and not searchers.composite_matcher:
+            # all matcher backends find the keywords of the keyword processor
+            keyword_matches = searchers.keyword_processor.extract_keywords_batch(texts, workers=workers)
+        else:
+            keyword_matches = [None] * len(messages)
+        return [
+            self._entities_from_matches(
+                self._find_matches(text, message.get(TOKENS_NAMES[TEXT]), matches, searchers), extractor=self.name
+            )
+            for message, text, matches in zip(messages, texts, keyword_matches)
+        ]
+
+    def _find_matches(
+        self,
+        text: Optional[Text],
+        tokens: Optional[List[Any]],
+        keyword_matches: Optional[List[tuple]] = None,
+        searchers: Optional[_Searchers] = None,
+    ) -> List[tuple]:
+        """Searches a text for keywords and lazy composites.
+
+        Args:
+            text: the message text
+            tokens: the tokens of the message, for token based matchers
+            keyword_matches: the keywords already found in text, None to search them
+            searchers: the keyword processor and matchers to search with, None for the current ones
+
+        Returns:
+            (value, start, end, confidence) of every match
+        """
+        keyword_processor, matcher, composite_matcher = searchers if searchers is not None else self._searchers
+        if self._edit_budget is not None:
+            # the share of the characters of the keyword that were found, a match has fewer edits
+            matches = [
+                (value, start, end, min(max(1.0 - edits / length, 0.0), 1.0))
+                for value, start, end, edits, length in keyword_processor.extract_keywords_fuzzy(
+                    text, self._edit_budget, keyword_length=True
+                )
+            ]
+            if composite_matcher:
+                # composites are only matched exactly
+                matches = merge_matches(
+                    matches,
+                    [(value, start, end, 1.0) for value, start, end in composite_matcher.extract_keywords(text)],
+                )
+            return matches
+        if composite_matcher:
+            # searched in one scan with the keywords
+            keyword_matches = composite_matcher.extract_keywords(text)
+        elif keyword_matches is None:
+            keyword_matches = matcher.extract_keywords(text, tokens)
+        return [(value, start, end, 1.0) for value, start, end in keyword_matches]
+
+    def _entities_from_matches(self, matches: List[tuple], extractor: Optional[Text] = None) -> List[Dict[Text, Any]]:
+        """Creates the entity dicts of the matches.
+
+        Args:
+            matches: (value, start, end, confidence) of the matches, value is the {entity: value}
+                dict of the keyword
+            extractor: the extractor name to set in the entities, None to leave it out
+        """
         # matches looks like
         # [
-        # ({"festnetz": true,"internet": "wlan","wlan": "wlan","topic": "festnetz"}, 39, 54),
-        # ({'festnetz': True}, 63, 72)},
-        # ('somethingfixed',100,112)
+        # ({"festnetz": true,"internet": "wlan","wlan": "wlan","topic": "festnetz"}, 39, 54, 1.0),
+        # ({'festnetz': True}, 63, 72, 0.875)},
         # ]
-        # if match[0] is a string it was an alternative spelling hit
+        # alternative spellings hold the dict of their text as well
         #
-        matches = []
-        for match in matches_:
-            match = list(match)  # convert tuple to list to make it mutable
-            # do the lookup of alternative spellings first
-            if isinstance(match[0], (str, int, float)):
-                # look it up and replace it
-                match[0] = self._entityhierarchy.get("entities", {}).get(match[0], {})
-            matches.append(match)
         # if duplicates are to be ignored, sort the list and remove duplicates
         if not self.include_repeated_entities:
-            matches.sort(key=lambda e: e[1])  # sort by first occurrence in the message text
+            matches = sorted(matches, key=lambda e: e[1])  # sort by first occurrence in the message text
 
         extracted_entities = []
-        name_cache = []
+        name_cache = set()
+        # the keys of every entity in their order, the values are set per match
+        template = dict.fromkeys(
+            (
+                ENTITY_ATTRIBUTE_TYPE,
+                ENTITY_ATTRIBUTE_START,
+                ENTITY_ATTRIBUTE_END,
+                ENTITY_ATTRIBUTE_VALUE,
+                ENTITY_ATTRIBUTE_CONFIDENCE,
+            )
+        )
+        if extractor is not None:
+            template[EXTRACTOR] = extractor
 
         for match in matches:
             for entity_type, entity_value in match[0].items():
                 if entity_type not in name_cache:
                     if not self.include_repeated_entities:
-                        name_cache.append(entity_type)
-                    extracted_entities += [
-                        {
-                            ENTITY_ATTRIBUTE_TYPE: entity_type,
-                            ENTITY_ATTRIBUTE_START: match[1],
-                            ENTITY_ATTRIBUTE_END: match[2],
-                            ENTITY_ATTRIBUTE_VALUE: entity_value,
-                            ENTITY_ATTRIBUTE_CONFIDENCE: 1.0,
-                        }
-                    ]
+                        name_cache.add(entity_type)
+                    entity = template.copy()
+                    entity[ENTITY_ATTRIBUTE_TYPE] = entity_type
+                    entity[ENTITY_ATTRIBUTE_START] = match[1]
+                    entity[ENTITY_ATTRIBUTE_END] = match[2]
+                    entity[ENTITY_ATTRIBUTE_VALUE] = entity_value
+                    entity[ENTITY_ATTRIBUTE_CONFIDENCE] = match[3]
+                    extracted_entities.append(entity)
         return extracted_entities
 
     def _extent_entities(
@@ -228,37 +880,119 @@ class EntityHierarchy(EntityExtractor):
         """Adds new_entities to original_entities and returns the complete list.
            Respects setting of self._ignore_repeated_entities
 
+        A new entity of a type already in the message changes the value of the first entity
+        of that type. The other new entities are added, the overlap_policy decides about
+        those overlapping entities of other extractors (e.g. DIET).
+
         Args:
             original_entities (List[Dict[Text, Any]]): The entities already contained in the message, to be altered in_place
             new_entities (List[Dict[Text, Any]]): The entities to add to the message
         """
         entities = original_entities[:]
-        entity_keys = [e.get(ENTITY_ATTRIBUTE_TYPE) for e in entities]
+        first_of_type = {}
+        for pos, entity in enumerate(entities):
+            first_of_type.setdefault(entity.get(ENTITY_ATTRIBUTE_TYPE), pos)
+        # positions of the entities changed by this component, they are never in conflict
+        updated = set()
+        added = []
         for ent in new_entities:
-            if self.include_repeated_entities or ent.get(ENTITY_ATTRIBUTE_TYPE) not in entity_keys:
-                self.add_extractor_name([ent])
-                entities.append(ent)
+            if self.include_repeated_entities or ent.get(ENTITY_ATTRIBUTE_TYPE) not in first_of_type:
+                added.append(ent)
             else:
                 # change value of passed entity
-                pos = entity_keys.index(ent.get(ENTITY_ATTRIBUTE_TYPE))
+                pos = first_of_type[ent.get(ENTITY_ATTRIBUTE_TYPE)]
                 entity = entities[pos]
                 entity.update({ENTITY_ATTRIBUTE_VALUE: ent.get(ENTITY_ATTRIBUTE_VALUE)})
                 self.add_processor_name(entity)
-        # entities.extend(new_ents)
+                updated.add(pos)
+
+        removed = set()
+        index = None
+        if self._overlap_policy != KEEP_BOTH and added and len(updated) < len(entities):
+            index = SpanIndex(
+                (entity.get(ENTITY_ATTRIBUTE_START), entity.get(ENTITY_ATTRIBUTE_END), pos)
+                for pos, entity in enumerate(entities)
+                if pos not in updated
+            )
+        for ent in added:
+            if index is not None and not self._resolve_overlap(ent, entities, index, removed):
+                continue
+            self.add_extractor_name([ent])
+            entities.append(ent)
+        if removed:
+            entities = [entity for pos, entity in enumerate(entities) if pos not in removed]
         return entities
 
+    def _resolve_overlap(
+        self, ent: Dict[Text, Any], entities: List[Dict[Text, Any]], index: SpanIndex, removed: set
+    ) -> bool:
+        """Applies the overlap_policy to a new entity and the indexed entities it overlaps.
+
+        Args:
+            ent: the new entity
+            entities: the entities of the message, the index refers to their positions
+            index: spans of the entities that may be replaced
+            removed: positions of the replaced entities, extended by the ones ent replaces
+
+        Returns:
+            bool: whether ent is added
+        """
+        start, end = ent.get(ENTITY_ATTRIBUTE_START), ent.get(ENTITY_ATTRIBUTE_END)
+        if start is None or end is None:
+            return True
+        conflicts = [pos for pos in index.overlapping(start, end) if pos not in removed]
+        if not conflicts:
+            return True
+        if self._overlap_policy == PREFER_ORIGINAL:
+            return False
+        if self._overlap_policy == PREFER_LONGEST:
+            longest = max(
+                entities[pos][ENTITY_ATTRIBUTE_END] - entities[pos][ENTITY_ATTRIBUTE_START] for pos in conflicts
+            )
+            # on equal length the entity already in the message stays
+            if end - start <= longest:
+                return False
+        removed.update(conflicts)
+        return True
+
     ############# SAFE and LOAD methods #######################
     #
     def persist(self, file_name: Text, model_dir: Text) -> Optional[Dict[Text, Any]]:
         """Persist this component to disk for future loading."""
+        with self._reload_lock:
+            return self._persist(file_name, model_dir)
+
+    def _persist(self, file_name: Text, model_dir: Text) -> Optional[Dict[Text, Any]]:
         if self._entityhierarchy:
+            matcher_file = file_name + ".bin"
+            composites_file = file_name + ".composites.json" if self._composite_matcher else None
             file_name = file_name + ".json"
             entity_files = os.path.join(model_dir, file_name)
             write_json_to_file(entity_files, self._entityhierarchy)
+            # ready-built matcher for load, its value table holds the entity dicts
+            # so the artifact is usable without the json hierarchy
+            self.keyword_processor.compile().save(os.path.join(model_dir, matcher_file))
+            matcher_digest = file_digest(os.path.join(model_dir, matcher_file))
+            if composites_file:
+                # the composites are not part of the trie, they are loaded next to it
+                write_json_to_file(
+                    os.path.join(model_dir, composites_file),
+                    {key: self._entityhierarchy[key] for key in ("composites", "vocabularies")},
+                )
 
-            return {"file": file_name}
+            # the backend in use, an "auto" matcher is not measured again on load
+            return {
+                "file": file_name,
+                "matcher_file": matcher_file,
+                # name of the shared copy of the matcher file
+                "matcher_digest": matcher_digest,
+                "composites_file": composites_file,
+                "matcher": self._matcher.name,
+                # a watching component compares the entity files with the ones trained on
+                "entityfile_digest": self._source_digest,
+            }
         else:
-            return {"file": None}
+            return {"file": None, "matcher_file": None}
 
     @classmethod
     def load(
@@ -270,12 +1004,39 @@ class EntityHierarchy(EntityExtractor):
         **kwargs: Any,
     ) -> "Component":
         """Load this component from file."""
+        component = cls._restore(meta, model_dir)
+        if meta.get("watch_entityfile"):
+            component.start_watching()
+        return component
 
+    @classmethod
+    def _restore(cls, meta: Dict[Text, Any], model_dir: Text) -> "EntityHierarchy":
         file_name = meta.get("file")
         if not file_name:
             enthier = None
             return cls(meta, enthier)
 
+        matcher_file = meta.get("matcher_file")
+        if matcher_file and os.path.isfile(os.path.join(model_dir, matcher_file)):
+            # memory map the ready-built matcher instead of rebuilding it from the json hierarchy
+            matcher_path = os.path.join(model_dir, matcher_file)
+            if meta.get("shared_matcher_dir"):
+                matcher_path = cls._shared_matcher_file(
+                    matcher_path, meta["shared_matcher_dir"], meta.get("matcher_digest")
+                )
+            try:
+                frozen_trie = FrozenTrie.load(matcher_path, word_nodes=meta.get("matcher_word_index", True))
+            except ValueError as e:
+                logger.warning(f"Rebuilding entity hierarchy from {file_name}: {e}")
+            else:
+                composites_file = meta.get("composites_file")
+                composites = (
+                    rasa.shared.utils.io.read_json_file(os.path.join(model_dir, composites_file))
+                    if composites_file
+                    else None
+                )
+                return cls(meta, None, frozen_trie, composites)
+
         entities_file = os.path.join(model_dir, file_name)
         if os.path.isfile(entities_file):
             enthier = rasa.shared.utils.io.read_json_file(entities_file)
@@ -283,3 +1044,26 @@ class EntityHierarchy(EntityExtractor):
             enthier = None
         return cls(meta, enthier)
 
+    @staticmethod
+    def _shared_matcher_file(matcher_path: Text, shared_dir: Text, matcher_digest: Optional[Text]) -> Text:
+        """Returns the copy of the matcher file in shared_dir that all workers map, named after the
+        digest of its content. The first worker creates it, a failure falls back to matcher_path."""
+        try:
+            shared_path = os.path.join(shared_dir, f"{matcher_digest or file_digest(matcher_path)}.bin")
+            if not os.path.isfile(shared_path):
+                os.makedirs(shared_dir, exist_ok=True)
+                # copied under a temporary name, other workers never map a partial file
+                fd, tmp_path = tempfile.mkstemp(dir=shared_dir, suffix=".tmp")
+                try:
+                    os.chmod(tmp_path, 0o644)
+                    with os.fdopen(fd, "wb") as f, open(matcher_path, "rb") as source:
+                        shutil.copyfileobj(source, f)
+                    os.replace(tmp_path, shared_path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+            return shared_path
+        except OSError as e:
+            logger.warning(f"Mapping the matcher from {matcher_path}, it can not be shared in {shared_dir}: {e}")
+            return matcher_path
+
@@ -0,0 +1,47 @@
+import pytest
+
+from pipeline._flashtext_mod import KeywordProcessor
+
+
+def _random_hierarchy(rnd, words, parts=4, alternatives=False):
+    data = {}
+    for k in range(parts):
+        examples = []
+        for _ in range(rnd.randint(1, 3)):
+            example = {"text": rnd.choice(words) + (" " + rnd.choice(words) if rnd.random() < 0.3 else "")}
+            if alternatives:
+                example["alternatives"] = [rnd.choice(words) + "s"]
+            examples.append(example)
+        data[f"p{k}"] = [{"value": rnd.choice([None, "V"]), "examples": examples}]
+    composites = []
+    for _ in range(rnd.randint(1, 3)):
+        a, b = rnd.sample(range(parts), 2)
+        separator = rnd.choice(["-", " ", ""])
+        composites.append({"composite": "{p%d}%s{p%d}" % (a, separator, b) + rnd.choice(["", " vertrag"])})
+    data["target"] = [{"value": rnd.choice([None, "V"]), "examples": composites}]
+    data["other"] = [{"examples": [{"ref": "target"}, {"text": "mobil"}]}]
+    # keywords overlapping the composites, a longer one hides a composite and the other way round
+    data["keyword"] = [
+        {"examples": [{"text": " ".join(rnd.choice(words) for _ in range(rnd.randint(2, 3)))} for _ in range(4)]}
+    ]
+    return data
+
+
+def _keyword_processor(keywords, **kwargs):
+    keyword_processor = KeywordProcessor(**kwargs)
+    keyword_processor.update_keywords(add=keywords)
+    return keyword_processor
+
+
+@pytest.fixture
+def make_random_hierarchy():
+    """Returns `make(rnd, words, parts=4, alternatives=False)` building a random entity hierarchy
+    (as read from the entity files) with `parts` keyword entities p0, p1, ..., composites of them
+    in "target", a ref to "target" in "other" and multiword keywords overlapping the composites"""
+    return _random_hierarchy
+
+
+@pytest.fixture
+def make_keyword_processor():
+    """Returns `make(keywords, **kwargs)` building a `KeywordProcessor` with the keyword -> value dict"""
+    return _keyword_processor
@@ -0,0 +1,33 @@
+import sys
+
+import pytest
+
+pytest.importorskip("rasa")
+
+from pipeline.compile import _dict_size, _dict_trie_shape
+
+KEYWORDS = ["iphone", "iphone 12", "iphone 12 pro", "ipad", "galaxy s21", "magenta l", "magenta xl", "vertrag"]
+
+
+def _dicts(trie_dict):
+    stack = [trie_dict]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(child for key, child in node.items() if key != "_keyword_")
+
+
+@pytest.mark.parametrize("mode", [{}, {"dawg": True}, {"aho_corasick": True}])
+def test_dict_trie_shape_is_taken_from_the_compiled_trie(make_keyword_processor, mode):
+    compiled = make_keyword_processor({keyword: {"keyword": keyword} for keyword in KEYWORDS}, **mode).compile()
+    histogram, dict_entries = _dict_trie_shape(compiled)
+
+    prefixes = {keyword[:depth] for keyword in KEYWORDS for depth in range(1, len(keyword) + 1)}
+    assert histogram == {depth: sum(len(prefix) == depth for prefix in prefixes) for depth in range(1, 14)}
+    trie_dict = compiled.to_trie_dict()
+    entries = {}
+    for node in _dicts(trie_dict):
+        entries[len(node)] = entries.get(len(node), 0) + 1
+    assert dict(dict_entries) == entries
+    estimate = sum(count * _dict_size(size) for size, count in dict_entries.items())
+    assert estimate == sum(sys.getsizeof(node) for node in _dicts(trie_dict))
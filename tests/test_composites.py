@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+pytest.importorskip("rasa")
+
+from rasa.shared.nlu.training_data.message import Message
+
+from pipeline._parser import topdownparser
+from pipeline.entities import EntityHierarchy
+
+WORDS = ["iphone", "galaxy", "pro", "max", "vertrag", "tarif", "magenta", "mobil", "l", "xl"]
+
+
+def _entities(data, text, lazy):
+    component = EntityHierarchy(
+        {**EntityHierarchy.defaults, "cache_dir": None, "lazy_composites": lazy},
+        topdownparser(data, lazy_composites=lazy),
+    )
+    message = Message({"text": text})
+    component.process(message)
+    return sorted((e["entity"], e["value"], e["start"], e["end"]) for e in message.get("entities"))
+
+
+def test_composites_ending_at_the_same_position_are_all_found():
+    data = {
+        "handy": [{"examples": [{"text": "iphone"}, {"text": "galaxy"}]}],
+        "tarif": [{"examples": [{"text": "iphone vertrag"}]}],
+        "vertrag": [{"examples": [{"composite": "{handy} vertrag"}]}],
+        "produkt": [{"examples": [{"composite": "iphone {v}"}]}],
+        "v": [{"examples": [{"text": "vertrag"}]}],
+    }
+    expected = [
+        ("produkt", "iphone vertrag", 5, 19),
+        ("tarif", "iphone vertrag", 5, 19),
+        ("vertrag", "iphone vertrag", 5, 19),
+    ]
+    assert _entities(data, "mein iphone vertrag", lazy=False) == expected
+    assert _entities(data, "mein iphone vertrag", lazy=True) == expected
+
+
+def test_composites_and_keywords_are_searched_in_one_scan():
+    data = {
+        "p": [{"examples": [{"text": "a"}]}],
+        "k": [{"examples": [{"text": "b c d"}]}],
+        "comp": [{"examples": [{"composite": "{p} b"}]}],
+    }
+    assert _entities(data, "a b c d", lazy=False) == [("comp", "a b", 0, 3)]
+    assert _entities(data, "a b c d", lazy=True) == [("comp", "a b", 0, 3)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_lazy_composites_find_the_expanded_keywords(make_random_hierarchy, seed):
+    rnd = random.Random(seed)
+    for _ in range(40):
+        data = make_random_hierarchy(rnd, WORDS)
+        eager = EntityHierarchy({**EntityHierarchy.defaults, "cache_dir": None}, topdownparser(data))
+        lazy = EntityHierarchy(
+            {**EntityHierarchy.defaults, "cache_dir": None, "lazy_composites": True},
+            topdownparser(data, lazy_composites=True),
+        )
+        # texts made of the examples, so that keywords and composites overlap
+        pieces = WORDS + [
+            example["text"] for entries in data.values() for entry in entries for example in entry["examples"]
+            if "text" in example
+        ]
+        for _ in range(20):
+            text = " ".join(rnd.choice(pieces) + rnd.choice(["", "-", " "]) for _ in range(rnd.randint(1, 6)))
+            found = []
+            for component in (eager, lazy):
+                message = Message({"text": text})
+                component.process(message)
+                found.append(sorted((e["entity"], e["value"], e["start"], e["end"]) for e in message.get("entities")))
+            assert found[0] == found[1], (data, text)
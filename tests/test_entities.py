@@ -0,0 +1,131 @@
+import copy
+import json
+import os
+import random
+
+import pytest
+
+pytest.importorskip("rasa")
+yaml = pytest.importorskip("yaml")
+
+from rasa.shared.nlu.training_data.message import Message
+from rasa.shared.nlu.training_data.training_data import TrainingData
+
+import pipeline.entities
+from pipeline._parser import topdownparser
+from pipeline.entities import EntityHierarchy
+
+WORDS = ["iphone", "galaxy", "pro", "max", "vertrag", "tarif", "magenta", "mobil", "l", "xl", "handy", "Ja"]
+
+
+def _texts(rnd, count):
+    return [" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 8))) for _ in range(count)]
+
+
+def _entities(component, texts, batch=False, **kwargs):
+    # an entity of an earlier extractor, kept by process and process_batch
+    earlier = [{"entity": "p1", "start": 0, "end": 1, "value": "x"}]
+    messages = [Message({"text": text, "entities": copy.deepcopy(earlier)}) for text in texts]
+    if batch:
+        component.process_batch(messages, **kwargs)
+    else:
+        for message in messages:
+            component.process(message)
+    return [message.get("entities") for message in messages]
+
+
+def _component(data, **config):
+    config = {**EntityHierarchy.defaults, "cache_dir": None, **config}
+    return EntityHierarchy(config, topdownparser(copy.deepcopy(data), lazy_composites=config["lazy_composites"]))
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {},
+        {"lazy_composites": True},
+        {"include_repeated_entities": True},
+        {"result_cache_size": 100},
+        {"fuzzy_max_edits": {4: 1}},
+        {"overlap_policy": "prefer_longest"},
+    ],
+)
+def test_process_batch_finds_the_entities_of_process(make_random_hierarchy, config):
+    rnd = random.Random(7)
+    data = make_random_hierarchy(rnd, WORDS, parts=6, alternatives=True)
+    # repeated texts are searched once by process_batch
+    texts = _texts(rnd, 150) * 2
+    expected = _entities(_component(data, **config), texts)
+    assert _entities(_component(data, **config), texts, batch=True) == expected
+    assert _entities(_component(data, **config), texts, batch=True, workers=2) == expected
+
+
+def test_result_cache_returns_copies_of_the_entities(make_random_hierarchy):
+    rnd = random.Random(3)
+    data = make_random_hierarchy(rnd, WORDS, parts=6, alternatives=True)
+    texts = _texts(rnd, 50)
+    expected = _entities(_component(data), texts)
+    component = _component(data, result_cache_size=100)
+    first = _entities(component, texts)
+    for entities in first:
+        for entity in entities:
+            entity["value"] = "changed"
+    assert _entities(component, texts) == expected
+    assert component._result_cache.hits >= len(set(texts))
+
+
+@pytest.mark.parametrize("config", [{}, {"lazy_composites": True}, {"shared_matcher_dir": "shared"}])
+def test_persisted_component_finds_the_same_entities(make_random_hierarchy, tmp_path, config):
+    rnd = random.Random(5)
+    data = make_random_hierarchy(rnd, WORDS, parts=6, alternatives=True)
+    texts = _texts(rnd, 100)
+    if "shared_matcher_dir" in config:
+        config = {**config, "shared_matcher_dir": str(tmp_path / config["shared_matcher_dir"])}
+    component = _component(data, **config)
+    expected = _entities(component, texts)
+    meta = {**component.component_config, **component.persist("entities", str(tmp_path))}
+    # the metadata rasa stores with the model
+    meta = json.loads(json.dumps(meta))
+    loaded = EntityHierarchy.load(meta, str(tmp_path))
+    assert loaded.keyword_processor.is_frozen
+    assert _entities(loaded, texts) == expected
+    if "shared_matcher_dir" in config:
+        assert os.listdir(config["shared_matcher_dir"]) == [meta["matcher_digest"] + ".bin"]
+
+
+def test_compile_cache_returns_the_trained_hierarchy(make_random_hierarchy, tmp_path, monkeypatch):
+    rnd = random.Random(1)
+    data = make_random_hierarchy(rnd, WORDS, parts=6, alternatives=True)
+    for key, value in data.items():
+        with open(tmp_path / f"{key}.yml", "w", encoding="utf-8") as f:
+            yaml.safe_dump({key: value}, f)
+    config = {**EntityHierarchy.defaults, "entityfile": str(tmp_path / "*.yml")}
+    uncached = EntityHierarchy({**config, "cache_dir": None})
+    uncached.train(TrainingData())
+    cached = EntityHierarchy({**config, "cache_dir": str(tmp_path / "cache")})
+    cached.train(TrainingData())
+    assert cached._entityhierarchy == uncached._entityhierarchy
+
+    def parse(*args, **kwargs):
+        raise AssertionError("parsed again")
+
+    monkeypatch.setattr(pipeline.entities, "topdownparser", parse)
+    again = EntityHierarchy({**config, "cache_dir": str(tmp_path / "cache")})
+    again.train(TrainingData())
+    assert again._entityhierarchy == uncached._entityhierarchy
+    texts = _texts(rnd, 50)
+    assert _entities(again, texts) == _entities(uncached, texts)
+
+
+def test_fuzzy_confidence_is_the_share_of_the_keyword_found():
+    data = {"handy": [{"examples": [{"text": "ab"}, {"text": "iphone"}]}]}
+    component = _component(data, fuzzy_max_edits=2)
+    message = Message({"text": "a q iphne"})
+    component.process(message)
+    assert [(e["value"], e["start"], e["end"], e["confidence_entity"]) for e in message.get("entities")] == [
+        ("ab", 0, 1, 0.5),
+    ]
+    component = _component(data, fuzzy_max_edits=2, include_repeated_entities=True)
+    message = Message({"text": "a q iphne"})
+    component.process(message)
+    assert [e["confidence_entity"] for e in message.get("entities")] == [0.5, 1.0 - 1 / 6]
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from pipeline._frozen_trie import FrozenTrie
+
+WORDS = ["iphone", "ipad", "pro", "max", "vertrag", "tarif", "magenta", "mobil", "l", "xl", "c++", "z.b."]
+
+
+def _keywords(rnd):
+    return {" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 3))): {"entity": str(n)} for n in range(30)}
+
+
+def _texts(rnd, keywords):
+    pieces = list(keywords) + WORDS
+    return [" ".join(rnd.choice(pieces) for _ in range(rnd.randint(0, 8))) for _ in range(50)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_frozen_processor_finds_the_keywords_of_the_dict_trie(make_keyword_processor, seed):
+    rnd = random.Random(seed)
+    keywords = _keywords(rnd)
+    dict_trie = make_keyword_processor(keywords)
+    frozen = make_keyword_processor(keywords)
+    frozen.freeze()
+    assert frozen.is_frozen and frozen.keyword_trie_dict is None
+    assert len(frozen) == len(dict_trie)
+    assert sorted(frozen.iter_keywords()) == sorted(dict_trie.iter_keywords())
+    # collapsed chains are one node
+    assert frozen.node_count < dict_trie.node_count
+    for keyword in list(keywords) + WORDS:
+        assert frozen.get_keyword(keyword) == dict_trie.get_keyword(keyword)
+    for text in _texts(rnd, keywords):
+        assert frozen.extract_keywords(text, span_info=True) == dict_trie.extract_keywords(text, span_info=True)
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_loaded_trie_equals_the_saved_one(make_keyword_processor, tmp_path, use_mmap):
+    rnd = random.Random(1)
+    keywords = _keywords(rnd)
+    keyword_processor = make_keyword_processor(keywords)
+    compiled = keyword_processor.compile()
+    path = str(tmp_path / "trie.bin")
+    compiled.save(path)
+    loaded = FrozenTrie.load(path, use_mmap=use_mmap)
+    assert len(loaded) == len(compiled) and loaded.node_count == compiled.node_count
+    assert loaded.nbytes == compiled.nbytes
+    assert sorted(loaded.iter_items()) == sorted(compiled.iter_items())
+    boundaries = keyword_processor.non_word_boundaries
+    for text in _texts(rnd, keywords):
+        assert loaded.extract_keywords(text, boundaries) == compiled.extract_keywords(text, boundaries)
@@ -0,0 +1,51 @@
+import random
+
+from pipeline._fuzzy import EditBudget
+
+LETTERS = "abcde -"
+
+
+def _distance(a, b):
+    row = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        prev, row = row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            row[j] = min(prev[j - 1] + (char != b[j - 1]), prev[j] + 1, row[j - 1] + 1)
+    return row[-1]
+
+
+def test_fuzzy_matches_are_within_the_budget(make_keyword_processor):
+    keyword_processor = make_keyword_processor({"vertrag": "vertrag", "magenta mobil": "tarif", "iphone": "handy"})
+    assert keyword_processor.extract_keywords_fuzzy("mein iphne mit vetrag", {4: 1}) == [
+        ("handy", 5, 10, 1),
+        ("vertrag", 15, 21, 1),
+    ]
+    assert keyword_processor.extract_keywords_fuzzy("magentta mobl", {4: 1, 10: 2}) == [("tarif", 0, 13, 2)]
+    assert keyword_processor.extract_keywords_fuzzy("magentta mobl", 1) == []
+
+
+def test_fuzzy_edits_are_the_edit_distance(make_keyword_processor):
+    rnd = random.Random(0)
+    for _ in range(100):
+        keywords = {
+            "".join(rnd.choice(LETTERS) for _ in range(rnd.randint(1, 10))).strip() or "a": n for n in range(1, 20)
+        }
+        keyword_processor = make_keyword_processor(keywords)
+        by_value = {value: keyword for keyword, value in keywords.items()}
+        for max_edits in (1, 2, {0: 0, 4: 1, 8: 3}):
+            budget = EditBudget(max_edits)
+            sentence = "".join(rnd.choice(LETTERS) for _ in range(rnd.randint(0, 30)))
+            for value, start, end, edits in keyword_processor.extract_keywords_fuzzy(sentence, max_edits):
+                keyword = by_value[value]
+                assert edits == _distance(keyword, sentence[start:end]) <= budget(len(keyword))
+                assert edits < len(keyword)
+
+
+def test_short_spans_need_fewer_edits_than_the_keyword_has_characters(make_keyword_processor):
+    keyword_processor = make_keyword_processor({"ab": "ab", "xyz": "xyz"})
+    assert keyword_processor.extract_keywords_fuzzy("q r", 2) == []
+    assert keyword_processor.extract_keywords_fuzzy("a xz", 2) == [("ab", 0, 1, 1), ("xyz", 2, 4, 1)]
+    assert keyword_processor.extract_keywords_fuzzy("a xz", 2, keyword_length=True) == [
+        ("ab", 0, 1, 1, 2),
+        ("xyz", 2, 4, 1, 3),
+    ]
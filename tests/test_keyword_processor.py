@@ -0,0 +1,37 @@
+import threading
+
+from pipeline import _flashtext_mod
+
+KEYWORDS = {"Big Apple": "New York", "new delhi": "Delhi"}
+SENTENCES = ["I love Big Apple", "no match", "big apple and new delhi", ""] * 20
+
+
+def test_batch_finds_the_keywords_of_each_sentence(make_keyword_processor):
+    for options in ({}, {"aho_corasick": True}):
+        keyword_processor = make_keyword_processor(KEYWORDS, **options)
+        expected = [keyword_processor.extract_keywords(sentence, span_info=True) for sentence in SENTENCES]
+        assert keyword_processor.extract_keywords_batch(SENTENCES, workers=2) == expected
+        assert keyword_processor.extract_keywords_batch(SENTENCES, workers=3, chunk_size=7) == expected
+        assert keyword_processor.extract_keywords_batch(SENTENCES, workers=1) == expected
+
+
+def test_batch_forks_while_other_threads_run(make_keyword_processor, monkeypatch):
+    keyword_processor = make_keyword_processor(KEYWORDS)
+    expected = [keyword_processor.extract_keywords(sentence, span_info=True) for sentence in SENTENCES]
+    contexts = []
+    get_context = _flashtext_mod.multiprocessing.get_context
+
+    def counted(method):
+        contexts.append(method)
+        return get_context(method)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait, daemon=True)
+    thread.start()
+    try:
+        monkeypatch.setattr(_flashtext_mod.multiprocessing, "get_context", counted)
+        assert keyword_processor.extract_keywords_batch(SENTENCES, workers=2) == expected
+    finally:
+        stop.set()
+        thread.join()
+    assert contexts == ["fork"]
@@ -0,0 +1,132 @@
+import random
+from collections import namedtuple
+
+import pytest
+
+from pipeline._matchers import FROZEN_TRIE, MATCHERS, TOKEN_TRIE, Matcher, create_matcher, select_matcher
+from pipeline._normalizer import TextNormalizer
+
+Token = namedtuple("Token", ["text", "start", "end"])
+
+WORDS = ["iphone", "galaxy", "pro", "max", "vertrag", "tarif", "c", "z", "b", "str", "groß", "Äpfel", "x-l"]
+SEPARATORS = [" ", " ", " ", "-", ".", "++", ". ", ", ", "  "]
+PUNCTUATION = ["", "", "", ".", "++", "#", "."]
+
+
+def _text(rnd, words):
+    return "".join(rnd.choice(words) + rnd.choice(SEPARATORS) for _ in range(rnd.randint(1, 8))).strip()
+
+
+def _keyword(rnd):
+    text = _text(rnd, WORDS[: rnd.randint(4, len(WORDS))])
+    return rnd.choice(PUNCTUATION) + text + rnd.choice(PUNCTUATION)
+
+
+def _tokens(text):
+    """Whitespace tokens, like the WhitespaceTokenizer of rasa"""
+    tokens = []
+    start = None
+    for idx, char in enumerate(text + " "):
+        if char.isspace():
+            if start is not None:
+                tokens.append(Token(text[start:idx], start, idx))
+                start = None
+        elif start is None:
+            start = idx
+    return tokens
+
+
+def _cut_tokens(rnd, text):
+    """Tokens of a tokenizer splitting inside words and leaving some out"""
+    tokens = []
+    for token in _tokens(text):
+        if rnd.random() < 0.1:
+            continue
+        cut = rnd.randint(token.start, token.end)
+        for start, end in ((token.start, cut), (cut, token.end)):
+            if end > start:
+                tokens.append(Token(text[start:end], start, end))
+    return tokens
+
+
+PROCESSOR_OPTIONS = [
+    {},
+    {"case_sensitive": True},
+    {"normalizer": TextNormalizer(["umlauts", "eszett", "casefold"])},
+]
+
+
+@pytest.mark.parametrize("options", PROCESSOR_OPTIONS)
+@pytest.mark.parametrize("seed", range(5))
+def test_all_matchers_find_the_same_keywords(make_keyword_processor, options, seed):
+    rnd = random.Random(seed)
+    for _ in range(10):
+        keywords = {_keyword(rnd): {"entity": str(n)} for n in range(rnd.randint(1, 40))}
+        keyword_processor = make_keyword_processor(keywords, **options)
+        matchers = {name: create_matcher(name, keyword_processor) for name in MATCHERS}
+        aho_corasick = make_keyword_processor(dict(keyword_processor.iter_keywords()), aho_corasick=True, **options)
+        keywords = [keyword for keyword, _ in keyword_processor.iter_keywords()]
+        for _ in range(50):
+            # texts made of the keywords, so that they overlap and share prefixes
+            text = _text(rnd, keywords + WORDS)
+            expected = keyword_processor.extract_keywords(text, span_info=True)
+            for name, matcher in matchers.items():
+                assert matcher.extract_keywords(text, _tokens(text)) == expected, (name, text, keywords)
+                assert matcher.extract_keywords(text, _cut_tokens(rnd, text)) == expected, (name, text, keywords)
+            assert aho_corasick.extract_keywords(text, span_info=True) == expected, (text, keywords)
+            # the text in chunks of random size
+            chunks = []
+            pos = 0
+            while pos < len(text):
+                size = rnd.randint(1, 10)
+                chunks.append(text[pos : pos + size])
+                pos += size
+            assert list(keyword_processor.iter_extract_keywords(chunks)) == expected, (text, keywords)
+
+
+def test_token_trie_keeps_characters_around_the_words(make_keyword_processor):
+    keyword_processor = make_keyword_processor({"c++": "cpp", "str.": "strasse", "z.b.": "zb"})
+    matcher = create_matcher(TOKEN_TRIE, keyword_processor)
+    for text in ("ich mag c sehr", "die str ist lang", "z.b. so", "ich mag c++ sehr"):
+        assert matcher.extract_keywords(text, _tokens(text)) == keyword_processor.extract_keywords(
+            text, span_info=True
+        )
+    assert matcher.extract_keywords("ich mag c sehr", _tokens("ich mag c sehr")) == []
+    assert matcher.extract_keywords("z.b. so", _tokens("z.b. so")) == [("zb", 0, 4)]
+    assert matcher.extract_keywords("ich mag c++ sehr", _tokens("ich mag c++ sehr")) == [("cpp", 8, 11)]
+
+
+def test_token_trie_matcher_searches_characters_for_keywords_without_words(make_keyword_processor):
+    keyword_processor = make_keyword_processor({"c": "c", "++": "plus"})
+    matcher = create_matcher(TOKEN_TRIE, keyword_processor)
+    text = "c ++ c"
+    assert matcher.extract_keywords(text, _tokens(text)) == [("c", 0, 1), ("plus", 2, 4), ("c", 5, 6)]
+
+
+class _BrokenMatcher(Matcher):
+    name = "broken"
+
+    def extract_keywords(self, text, tokens=None):
+        return []
+
+
+def test_select_matcher_falls_back_to_the_frozen_trie(make_keyword_processor, monkeypatch):
+    monkeypatch.setitem(MATCHERS, _BrokenMatcher.name, _BrokenMatcher)
+    keyword_processor = make_keyword_processor({"iphone": "iphone"})
+    messages = [("mein iphone", _tokens("mein iphone"))]
+    matcher, timings = select_matcher(keyword_processor, messages, names=[_BrokenMatcher.name])
+    assert matcher.name == FROZEN_TRIE
+    assert timings == {}
+    assert matcher.extract_keywords("mein iphone") == [("iphone", 5, 11)]
+
+
+def test_token_trie_searches_characters_if_the_tokens_are_not_the_words(make_keyword_processor):
+    keyword_processor = make_keyword_processor({"iphone12": "iphone", "vertrag": "vertrag"})
+    matcher = create_matcher(TOKEN_TRIE, keyword_processor)
+    text = "iphone12 vertrag"
+    expected = [("iphone", 0, 8), ("vertrag", 9, 16)]
+    # split inside a word
+    tokens = [Token("iphone", 0, 6), Token("12", 6, 8), Token("vertrag", 9, 16)]
+    assert matcher.extract_keywords(text, tokens) == expected
+    # a word left out
+    assert matcher.extract_keywords(text, [Token("vertrag", 9, 16)]) == expected
@@ -0,0 +1,70 @@
+import copy
+
+import pytest
+
+pytest.importorskip("rasa")
+
+from pipeline._parser import merge_hierarchies, topdownparser
+
+DATA = {
+    "_marken": ["_NO_ENTITY_", {"examples": [{"text": "apple"}, {"text": "samsung"}]}],
+    "handy": [
+        {
+            "value": "iphone",
+            "examples": [{"text": "iphone", "alternatives": ["i-phone", "ifon"]}, {"text": "apple handy"}],
+        },
+        {"examples": [{"text": "galaxy"}, {"ref": "tablet"}]},
+    ],
+    "tablet": [{"value": "ipad", "examples": [{"text": "ipad"}]}],
+    "vertrag": [{"examples": [{"composite": "{handy} vertrag"}, {"composite": "{_marken}-{tablet}"}]}],
+    "produkt": [{"value": "P", "examples": [{"ref": "handy"}, {"composite": "{tablet} {_marken}"}]}],
+}
+
+# the result of the topdownparser before composites were memoized and values interned
+BASELINE_ENTITIES = {
+    "apple handy": {"handy": "iphone", "produkt": "P"},
+    "apple handy vertrag": {"vertrag": "apple handy vertrag"},
+    "apple-ipad": {"vertrag": "apple-ipad"},
+    "galaxy": {"handy": "galaxy", "produkt": "P"},
+    "galaxy vertrag": {"vertrag": "galaxy vertrag"},
+    "i-phone vertrag": {"vertrag": "i-phone vertrag"},
+    "ifon vertrag": {"vertrag": "ifon vertrag"},
+    "ipad": {"handy": "ipad", "produkt": "P", "tablet": "ipad"},
+    "ipad apple": {"produkt": "P"},
+    "ipad samsung": {"produkt": "P"},
+    "ipad vertrag": {"vertrag": "ipad vertrag"},
+    "iphone": {"handy": "iphone", "produkt": "P"},
+    "iphone vertrag": {"vertrag": "iphone vertrag"},
+    "samsung-ipad": {"vertrag": "samsung-ipad"},
+}
+BASELINE_ALTERNATIVES = {"i-phone": "iphone", "ifon": "iphone"}
+
+
+def _resolved(hierarchy):
+    values = hierarchy["values"]
+    entities = {text: values[index] for text, index in hierarchy["entities"].items()}
+    alternatives = {alternative: values[index] for alternative, index in hierarchy["alternatives"].items()}
+    return entities, alternatives
+
+
+def test_parser_creates_the_entities_of_the_baseline():
+    entities, alternatives = _resolved(topdownparser(copy.deepcopy(DATA)))
+    assert entities == BASELINE_ENTITIES
+    assert alternatives == {alternative: BASELINE_ENTITIES[text] for alternative, text in BASELINE_ALTERNATIVES.items()}
+
+
+def test_equal_values_are_stored_once():
+    hierarchy = topdownparser(copy.deepcopy(DATA))
+    assert len(hierarchy["values"]) == len({repr(value) for value in BASELINE_ENTITIES.values()})
+    assert hierarchy["entities"]["iphone"] == hierarchy["entities"]["apple handy"]
+
+
+def test_parts_merge_into_the_whole_hierarchy():
+    parts = [topdownparser(copy.deepcopy(DATA), targets=[key]) for key in DATA]
+    assert _resolved(merge_hierarchies(parts)) == _resolved(topdownparser(copy.deepcopy(DATA)))
+
+
+def test_cycles_are_reported_with_their_path():
+    data = {"a": [{"examples": [{"ref": "b"}]}], "b": [{"examples": [{"composite": "x {a}"}]}]}
+    with pytest.raises(ValueError, match="Cycle in entity hierarchy"):
+        topdownparser(data)
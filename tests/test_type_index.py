@@ -0,0 +1,31 @@
+from pipeline._frozen_trie import FrozenTrie
+from pipeline._type_index import TypeIndex
+
+HANDY = {"handy": "handy"}
+TARIF = {"tarif": "tarif", "produkt": "tarif"}
+VERTRAG = {"vertrag": "vertrag"}
+KEYWORDS = {"iphone": HANDY, "galaxy": HANDY, "magenta l": TARIF, "magenta xl": TARIF, "vertrag": VERTRAG}
+
+
+def test_keywords_are_indexed_by_the_types_of_their_values(make_keyword_processor):
+    index = TypeIndex(make_keyword_processor(KEYWORDS).iter_keywords())
+    assert index.types == ["handy", "produkt", "tarif", "vertrag"]
+    assert sorted(index.keywords("handy")) == ["galaxy", "iphone"]
+    assert "smartwatch" not in index
+    restricted = index.restricted_keywords(["produkt", "vertrag"])
+    assert restricted == {"magenta l": {"produkt": "tarif"}, "magenta xl": {"produkt": "tarif"}, "vertrag": VERTRAG}
+    assert restricted["magenta l"] is restricted["magenta xl"]
+
+
+def test_value_ids_of_a_mapped_trie_are_indexed_without_keeping_the_values(make_keyword_processor, tmp_path):
+    path = str(tmp_path / "matcher.bin")
+    make_keyword_processor(KEYWORDS).compile().save(path)
+    trie = FrozenTrie.load(path)
+    index = TypeIndex(trie.iter_value_ids(), trie.values)
+    expected = TypeIndex(make_keyword_processor(KEYWORDS).iter_keywords())
+    assert index.types == expected.types
+    assert not trie.values._decoded
+    restricted = index.restricted_keywords(["handy"])
+    assert restricted == expected.restricted_keywords(["handy"])
+    # only the value of the requested type was decoded
+    assert list(trie.values._decoded.values()) == [HANDY]
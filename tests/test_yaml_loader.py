@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("rasa")
+yaml = pytest.importorskip("yaml")
+
+from pipeline._yaml_loader import CSafeLoader, read_entity_file, read_entity_files
+
+pytestmark = pytest.mark.skipif(CSafeLoader is None, reason="PyYAML without LibYAML bindings")
+
+
+def _write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+SCALARS = (
+    "values: [no, on, yes, true, False, 1:20, 1:20.5, 2020-01-01, 010, 0x1f, 0o17, 0b101, 1_000, -017,"
+    " 1.5, -2e3, 1_000.5, .inf, ~, null, '1']\n"
+)
+
+
+def test_scalars_are_resolved_like_yaml_1_2(tmp_path):
+    values = read_entity_file(_write(tmp_path, "entities.yml", SCALARS))["values"]
+    assert values[:8] == ["no", "on", "yes", True, False, "1:20", "1:20.5", datetime.date(2020, 1, 1)]
+    assert values[8:14] == [10, 31, 15, 5, 1000, -17]
+    assert values[14:] == [1.5, -2000.0, 1000.5, float("inf"), None, None, "1"]
+
+
+def test_scalars_are_resolved_like_rasa(tmp_path):
+    pytest.importorskip("ruamel.yaml")
+    from rasa.shared.utils.io import read_yaml
+
+    assert read_entity_file(_write(tmp_path, "entities.yml", SCALARS)) == read_yaml(SCALARS)
+
+
+def test_duplicate_keys_are_an_error(tmp_path):
+    path = _write(tmp_path, "entities.yml", "handy:\n  - text: iphone\nhandy:\n  - text: galaxy\n")
+    with pytest.raises(yaml.YAMLError, match="duplicate key 'handy'"):
+        read_entity_file(path)
+
+
+def test_merged_keys_may_be_overridden(tmp_path):
+    path = _write(tmp_path, "entities.yml", "base: &base {a: 1, b: 2}\nderived:\n  <<: *base\n  b: 3\n")
+    assert read_entity_file(path)["derived"] == {"a": 1, "b": 3}
+
+
+def test_files_are_returned_in_order(tmp_path):
+    paths = [_write(tmp_path, f"e{n}.yml", f"e{n}: [{n}]\n") for n in range(5)]
+    assert read_entity_files(paths, workers=2) == [{f"e{n}": [n]} for n in range(5)]